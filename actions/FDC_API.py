@@ -1,15 +1,147 @@
+import logging
 import os
+import numpy as np
 import requests
-from typing import Any, Text, Dict, List
+from typing import Any, Text, Dict, Iterator, List, Optional, Tuple
 
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 
+from actions.cache import TieredCache, cache_path_from_env
+from actions.fdc_local import get_local_store
+from actions.http_client import get_session
+from actions.metrics import observe_upstream, track_caches
+from actions.name_index import INGREDIENT_INDEX, normalize_name
+from actions.singleflight import get_flight_group
+
+logger = logging.getLogger(__name__)
+
+# Shared connection pool for api.nal.usda.gov
+FDC_SESSION = get_session("FDC")
+# Point this at a stand-in server for benchmarks (see benchmarks/stub_apis.py)
+FDC_BASE_URL = os.environ.get("FDC_BASE_URL", "https://api.nal.usda.gov/fdc/v1").rstrip("/")
+
+# Define which nutrients we care about
+# Nutrient names are based on the FDC API documentation
+BENEFICIAL_NUTRIENTS = [
+    "Protein", "Fiber, total dietary", "Vitamin C, total ascorbic acid",
+    "Vitamin A, RAE", "Vitamin D (D2 + D3)", "Vitamin K (phylloquinone)",
+    "Calcium, Ca", "Iron, Fe", "Potassium, K"
+]
+LESS_HEALTHY_NUTRIENTS = ["Sugars, total including NLEA", "Fatty acids, total saturated", "Sodium, Na"]
+
+# The scored nutrients, in the column order of the nutrient matrix
+SCORED_NUTRIENTS = BENEFICIAL_NUTRIENTS + LESS_HEALTHY_NUTRIENTS
+# Legacy nutrient numbers of the same nutrients, used to filter the bulk `/foods` endpoint.
+# The filter only takes integers, so it can't ask for the sugars of Foundation foods ("Sugars, Total",
+# 269.3); those foods are fetched without the filter (see fetch_foods_bulk).
+SCORED_NUTRIENT_NUMBERS = {
+    "Protein": 203, "Fiber, total dietary": 291, "Vitamin C, total ascorbic acid": 401,
+    "Vitamin A, RAE": 320, "Vitamin D (D2 + D3)": 328, "Vitamin K (phylloquinone)": 430,
+    "Calcium, Ca": 301, "Iron, Fe": 303, "Potassium, K": 306,
+    "Sugars, total including NLEA": 269, "Fatty acids, total saturated": 606, "Sodium, Na": 307,
+}
+NUTRIENT_COLUMNS = {name: column for column, name in enumerate(SCORED_NUTRIENTS)}
+BENEFICIAL_COLUMNS = [NUTRIENT_COLUMNS[name] for name in BENEFICIAL_NUTRIENTS]
+LESS_HEALTHY_COLUMNS = [NUTRIENT_COLUMNS[name] for name in LESS_HEALTHY_NUTRIENTS]
+
+# This is a simple override list. A more robust solution might use
+# the food's category if available from the API.
+ALWAYS_HEALTHY_KEYWORDS = [
+    "apple", "banana", "orange", "strawberry", "blueberry", "raspberry",
+    "spinach", "broccoli", "carrot", "kale", "tomato", "avocado",
+    "lettuce", "cucumber", "bell pepper", "onion", "garlic"
+]
+
+# --- Response cache ---
+# normalized ingredient -> fdcId, and fdcId -> parsed nutrient record.
+# Both live in memory (LRU) and in a SQLite file so they survive restarts.
+# Set FDC_CACHE_PATH to an empty string to keep the cache in memory only.
+FDC_CACHE_PATH = cache_path_from_env("FDC_CACHE_PATH", ".cache/fdc.sqlite")
+FDC_CACHE_SIZE = int(os.environ.get("FDC_CACHE_SIZE", 1024))
+FDC_CACHE_DISK_SIZE = int(os.environ.get("FDC_CACHE_DISK_SIZE", 50000))
+FDC_SEARCH_TTL = float(os.environ.get("FDC_SEARCH_TTL", 7 * 24 * 3600))  # 1 week
+FDC_DETAILS_TTL = float(os.environ.get("FDC_DETAILS_TTL", 30 * 24 * 3600))  # 30 days, FDC data changes rarely
+
+# --- Backend ---
+# "api": always use the FDC API (default).
+# "local": only use the local nutrient store built with `python -m actions.fdc_import`.
+# "local_first": use the local store and fall back to the API for foods it doesn't know.
+FDC_BACKEND = os.environ.get("FDC_BACKEND", "api").lower()
+FDC_LOCAL_DB = os.environ.get("FDC_LOCAL_DB", ".cache/fdc_local.sqlite")
+
+if FDC_BACKEND in ("local", "local_first") and not os.path.exists(FDC_LOCAL_DB):
+    logger.warning(
+        f"FDC_BACKEND={FDC_BACKEND} but there is no local nutrient store at {FDC_LOCAL_DB} "
+        f"(build it with `python -m actions.fdc_import`); "
+        + ("every food lookup will fail" if FDC_BACKEND == "local" else "all lookups go to the FDC API")
+    )
+
+# The bulk /foods endpoint accepts at most 20 fdcIds per request
+FDC_BULK_BATCH_SIZE = 20
+
+FDC_SEARCH_CACHE = TieredCache("fdc_search", ttl=FDC_SEARCH_TTL, max_size=FDC_CACHE_SIZE,
+                               path=FDC_CACHE_PATH, max_disk_entries=FDC_CACHE_DISK_SIZE)
+FDC_DETAILS_CACHE = TieredCache("fdc_details", ttl=FDC_DETAILS_TTL, max_size=FDC_CACHE_SIZE,
+                                path=FDC_CACHE_PATH, max_disk_entries=FDC_CACHE_DISK_SIZE)
+
+track_caches(FDC_SEARCH_CACHE, FDC_DETAILS_CACHE)
+
+# Known ingredient names -> fdcId, learned from earlier searches (and restored from the disk cache)
+INGREDIENT_INDEX.load(FDC_SEARCH_CACHE.entries())
+
+# Concurrent lookups of the same ingredient (or the same foods) share one upstream request
+FDC_SEARCH_FLIGHTS = get_flight_group("fdc_search")
+FDC_DETAILS_FLIGHTS = get_flight_group("fdc_details")
+
+
+def standardize_nutrient_name(nutrient_name: str) -> Optional[str]:
+    """Maps an FDC nutrient name to the name we score it under, or None if we don't score it."""
+    # Standardize nutrient names for easier lookup
+    if "Sugars" in nutrient_name: nutrient_name = "Sugars, total including NLEA"
+    if "Saturated" in nutrient_name: nutrient_name = "Fatty acids, total saturated"
+    if "Fiber" in nutrient_name: nutrient_name = "Fiber, total dietary"
+
+    if nutrient_name in BENEFICIAL_NUTRIENTS or nutrient_name in LESS_HEALTHY_NUTRIENTS:
+        return nutrient_name
+    return None
+
+
+def parse_nutrient_record(food_details: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduces an FDC food payload to the nutrients we score.
+
+    Args:
+        food_details (dict): A food as returned by the FDC `/food/{fdcId}` or `/foods` endpoints.
+
+    Returns:
+        dict: {"fdc_id", "description", "nutrients": {name: [amount, unit]}} where the
+        names are standardized to the entries of BENEFICIAL_NUTRIENTS / LESS_HEALTHY_NUTRIENTS.
+    """
+    nutrients = {}
+    for nutrient in food_details.get("foodNutrients", []):
+        # The full format nests name and unit under "nutrient", the abridged (bulk) format doesn't
+        info = nutrient.get("nutrient") or nutrient
+        nutrient_name = standardize_nutrient_name(info.get("name") or "")
+        amount = nutrient.get("amount", 0)
+        unit = (info.get("unitName") or "").lower()
+
+        if nutrient_name:
+            nutrients[nutrient_name] = [amount, unit]
+
+    return {
+        "fdc_id": food_details.get("fdcId"),
+        "description": food_details.get("description"),
+        "nutrients": nutrients,
+    }
+
 
 def get_ingredient_health_info(ingredient: str, api_key: str) -> str:
     """
-    Analyzes an ingredient for its health benefits using the FoodData Central API.
+    Analyzes an ingredient for its health benefits using the FoodData Central API
+    (or the local nutrient store, depending on FDC_BACKEND).
+    Search results and nutrient records are cached, so repeated questions skip the network.
 
     Args:
         ingredient (str): The name of the food ingredient to analyze.
@@ -18,104 +150,266 @@ def get_ingredient_health_info(ingredient: str, api_key: str) -> str:
     Returns:
         str: A user-friendly string summarizing the health information.
     """
+    return get_ingredients_health_info([ingredient], api_key)[0]
+
+
+def get_ingredients_health_info(ingredients: List[str], api_key: str) -> List[str]:
+    """
+    Analyzes several ingredients at once, e.g. the whole `ingredients` slot or every ingredient of a recipe.
+    The nutrients of all ingredients are scored together in one vectorized pass.
+
+    Args:
+        ingredients (List[str]): The names of the food ingredients to analyze.
+        api_key (str): Your personal API key for the FDC API.
+
+    Returns:
+        List[str]: One user-friendly report (or error message) per ingredient, in the same order.
+    """
+    # --- Step 1 & 2: Resolve every ingredient to a nutrient record ---
+    lookups = get_nutrient_records(ingredients, api_key)
+    found = [i for i, (record, _) in enumerate(lookups) if record is not None]
+
+    # --- Step 3: Score all records in one pass ---
+    records = [lookups[i][0] for i in found]
+    descriptions = [record.get("description") or ingredients[i] for i, record in zip(found, records)]
+    is_healthy_override, is_healthy_original = classify_health(nutrient_matrix(records), descriptions)
+
+    # --- Step 4: Format the output, only now do we go back to strings ---
+    reports = [error for _, error in lookups]
+    for row, i in enumerate(found):
+        reports[i] = format_health_report(records[row], ingredients[i],
+                                          bool(is_healthy_override[row]), bool(is_healthy_original[row]))
+    return reports
+
+
+def get_nutrient_records(ingredients: List[str], api_key: str) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Finds the nutrient records of several ingredients in the local store, the cache or the FDC API.
+    Foods missing from the cache are fetched together through the bulk `/foods` endpoint,
+    so N ingredients cost at most N searches plus one request per 20 foods.
+
+    Args:
+        ingredients (List[str]): The names of the food ingredients.
+        api_key (str): Your personal API key for the FDC API.
+
+    Returns:
+        List of tuples, one per ingredient, containing:
+        - Optional[dict]: The record (see `parse_nutrient_record`), or None when it could not be found.
+        - Optional[str]: A user-friendly error message when there is no record.
+    """
+    results = [find_fdc_id(ingredient, api_key) for ingredient in ingredients]
+
+    # --- Step 2: Use the FDC IDs to get detailed nutrient information ---
+    fdc_ids = {result for result, _ in results if isinstance(result, int)}
+    records = {fdc_id: FDC_DETAILS_CACHE.get(fdc_id) for fdc_id in fdc_ids}
+    missing = [fdc_id for fdc_id, record in records.items() if record is None]
+    details_error = None
+
+    if missing:
+        try:
+            fetched = FDC_DETAILS_FLIGHTS.do(tuple(sorted(missing)), lambda: list(fetch_foods_bulk(missing, api_key)))
+            for record in fetched:
+                records[record["fdc_id"]] = record
+                FDC_DETAILS_CACHE.set(record["fdc_id"], record)
+        except requests.exceptions.RequestException as e:
+            details_error = f"Error fetching details from the API: {e}"
+
+    lookups = []
+    for ingredient, (result, error) in zip(ingredients, results):
+        if isinstance(result, dict):  # Already a record from the local store
+            lookups.append((result, None))
+        elif result is None:
+            lookups.append((None, error))
+        elif records.get(result) is not None:
+            lookups.append((records[result], None))
+        else:
+            lookups.append((None, details_error or f"Sorry, I couldn't find any information for '{ingredient}'."))
+    return lookups
+
+
+def find_fdc_id(ingredient: str, api_key: str) -> Tuple[Any, Optional[str]]:
+    """
+    Finds the FDC ID of an ingredient (resolver, cache, then `/foods/search`).
+    With a local backend the local nutrient record is returned instead of an ID.
+
+    Returns:
+        A tuple containing:
+        - The fdcId (int), a local nutrient record (dict), or None when nothing was found.
+        - Optional[str]: A user-friendly error message when nothing was found.
+    """
+    # --- Step 0: Answer from the local nutrient store when configured ---
+    if FDC_BACKEND in ("local", "local_first"):
+        store = get_local_store(FDC_LOCAL_DB)
+        record = store.lookup(ingredient) if store is not None else None
+        if record is not None:
+            return record, None
+        if FDC_BACKEND == "local":
+            return None, f"Sorry, I couldn't find any information for '{ingredient}'."
+
     # --- Step 1: Search for the food to get its FDC ID ---
-    search_url = "https://api.nal.usda.gov/fdc/v1/foods/search"
+    # "cucumbers", "a cucumber" and "cucumbr" all resolve to the same fdcId without a network call
+    cache_key = normalize_name(ingredient) or ingredient.lower().strip()
+    match = INGREDIENT_INDEX.resolve(ingredient)
+    fdc_id = match.fdc_id if match else FDC_SEARCH_CACHE.get(cache_key)
+
+    if fdc_id is None:
+        try:
+            search_data = FDC_SEARCH_FLIGHTS.do(cache_key, search_foods, ingredient, api_key)
+
+            if not search_data.get("foods"):
+                return None, f"Sorry, I couldn't find any information for '{ingredient}'."
+
+            # Get the FDC ID from the first search result
+            fdc_id = search_data["foods"][0]["fdcId"]
+
+        except requests.exceptions.RequestException as e:
+            return None, f"Error connecting to the API: {e}"
+        except (KeyError, IndexError):
+            return None, f"Could not retrieve a valid ID for '{ingredient}'."
+
+        FDC_SEARCH_CACHE.set(cache_key, fdc_id)
+        INGREDIENT_INDEX.add(cache_key, fdc_id, ttl=FDC_SEARCH_TTL)
+
+    return int(fdc_id), None
+
+
+def search_foods(query: str, api_key: str) -> Dict[str, Any]:
+    """
+    Returns the raw `/foods/search` payload for the best match of `query`.
+
+    Raises:
+        requests.exceptions.RequestException: When the request fails.
+    """
+    search_url = f"{FDC_BASE_URL}/foods/search"
     search_params = {
-        "query": ingredient,
+        "query": query,
         "api_key": api_key,
         "pageSize": 1,  # We only need the top result
         "dataType": ["Foundation", "SR Legacy", "Survey (FNDDS)"]
     }
+    response = observe_upstream("fdc", "search", FDC_SESSION.get, search_url, params=search_params)
+    response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+    return response.json()
 
-    try:
-        response = requests.get(search_url, params=search_params)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-        search_data = response.json()
 
-        if not search_data.get("foods"):
-            return f"Sorry, I couldn't find any information for '{ingredient}'."
+def fetch_foods_bulk(fdc_ids: List[int], api_key: str) -> Iterator[Dict[str, Any]]:
+    """
+    Fetches the nutrient records of many foods through the FDC bulk endpoint (`POST /foods`).
+    Only the nutrients we score are requested, and results are yielded batch by batch as they arrive.
+    Foundation foods in a batch are fetched again without the nutrient filter, since their sugars
+    have a nutrient number (269.3) the filter can't express.
 
-        # Get the FDC ID from the first search result
-        fdc_id = search_data["foods"][0]["fdcId"]
+    Args:
+        fdc_ids (List[int]): The FDC IDs to fetch.
+        api_key (str): Your personal API key for the FDC API.
 
-    except requests.exceptions.RequestException as e:
-        return f"Error connecting to the API: {e}"
-    except (KeyError, IndexError):
-        return f"Could not retrieve a valid ID for '{ingredient}'."
+    Yields:
+        dict: A record as returned by `parse_nutrient_record`. Unknown IDs are skipped.
 
-    # --- Step 2: Use the FDC ID to get detailed nutrient information ---
-    details_url = f"https://api.nal.usda.gov/fdc/v1/food/{fdc_id}"
-    details_params = {"api_key": api_key}
+    Raises:
+        requests.exceptions.RequestException: When a request fails.
+    """
+    bulk_url = f"{FDC_BASE_URL}/foods"
 
-    try:
-        response = requests.get(details_url, params=details_params)
+    def post_foods(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        response = observe_upstream("fdc", "details", FDC_SESSION.post, bulk_url,
+                                    params={"api_key": api_key}, json=payload)
         response.raise_for_status()
-        food_details = response.json()
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching details from the API: {e}"
+        return response.json() or []
 
-    # --- Step 3: Analyze the nutrients and build a user-friendly report ---
-    nutrients = {
-        "beneficial": {},
-        "less_healthy": {}
-    }
+    for start in range(0, len(fdc_ids), FDC_BULK_BATCH_SIZE):
+        foundation_ids = []
+        for food_details in post_foods({
+            "fdcIds": list(fdc_ids[start:start + FDC_BULK_BATCH_SIZE]),
+            "format": "abridged",
+            "nutrients": list(SCORED_NUTRIENT_NUMBERS.values()),
+        }):
+            if food_details.get("dataType") == "Foundation":
+                foundation_ids.append(food_details.get("fdcId"))
+            else:
+                yield parse_nutrient_record(food_details)
+        if foundation_ids:
+            for food_details in post_foods({"fdcIds": foundation_ids, "format": "abridged"}):
+                yield parse_nutrient_record(food_details)
 
-    # Define which nutrients we care about
-    # Nutrient names are based on the FDC API documentation
-    BENEFICIAL_NUTRIENTS = [
-        "Protein", "Fiber, total dietary", "Vitamin C, total ascorbic acid",
-        "Vitamin A, RAE", "Vitamin D (D2 + D3)", "Vitamin K (phylloquinone)",
-        "Calcium, Ca", "Iron, Fe", "Potassium, K"
-    ]
-    LESS_HEALTHY_NUTRIENTS = ["Sugars, total including NLEA", "Fatty acids, total saturated", "Sodium, Na"]
 
-    for nutrient in food_details.get("foodNutrients", []):
-        nutrient_name = nutrient.get("nutrient", {}).get("name")
-        amount = nutrient.get("amount", 0)
-        unit = nutrient.get("nutrient", {}).get("unitName", "").lower()
+def nutrient_matrix(records: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Puts the scored nutrients of several records into one matrix.
+
+    Returns:
+        np.ndarray: Shape (len(records), len(SCORED_NUTRIENTS)), amounts per 100g in the column
+        order of SCORED_NUTRIENTS. Nutrients a food doesn't report are NaN.
+    """
+    matrix = np.full((len(records), len(SCORED_NUTRIENTS)), np.nan)
+    for row, record in enumerate(records):
+        for name, (amount, _) in record["nutrients"].items():
+            matrix[row, NUTRIENT_COLUMNS[name]] = amount
+    return matrix
 
-        # Standardize nutrient names for easier lookup
-        if "Sugars" in nutrient_name: nutrient_name = "Sugars, total including NLEA"
-        if "Saturated" in nutrient_name: nutrient_name = "Fatty acids, total saturated"
-        if "Fiber" in nutrient_name: nutrient_name = "Fiber, total dietary"
 
-        if nutrient_name in BENEFICIAL_NUTRIENTS:
-            nutrients["beneficial"][nutrient_name] = f"{amount}{unit}"
-        elif nutrient_name in LESS_HEALTHY_NUTRIENTS:
-            nutrients["less_healthy"][nutrient_name] = f"{amount}{unit}"
+def classify_health(matrix: np.ndarray, descriptions: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Classifies every row of a nutrient matrix as healthy or less healthy.
 
-    # --- Step 4: Determine if it's "healthy" and format the output ---
-    
-    # Get the food name early for our check
-    food_name_lower = food_details.get("description", ingredient).lower()
+    Args:
+        matrix (np.ndarray): A matrix as returned by `nutrient_matrix`.
+        descriptions (List[str]): The food description of every row.
 
+    Returns:
+        A tuple of boolean arrays, one value per row:
+        - is_healthy_override: The food is a fruit or vegetable we always call healthy.
+        - is_healthy_original: The nutrient heuristic says it's healthy.
+    """
     # --- MODIFICATION: Force fruits and vegetables to be "healthy" ---
-    # This is a simple override list. A more robust solution might use
-    # the food's category if available from the API.
-    ALWAYS_HEALTHY_KEYWORDS = [
-        "apple", "banana", "orange", "strawberry", "blueberry", "raspberry",
-        "spinach", "broccoli", "carrot", "kale", "tomato", "avocado",
-        "lettuce", "cucumber", "bell pepper", "onion", "garlic"
-    ]
-
-    is_healthy_override = False
-    for item in ALWAYS_HEALTHY_KEYWORDS:
-        if item in food_name_lower:
-            is_healthy_override = True
-            break
+    names = np.char.lower(np.array(descriptions, dtype=str))
+    is_healthy_override = np.zeros(len(descriptions), dtype=bool)
+    for keyword in ALWAYS_HEALTHY_KEYWORDS:
+        is_healthy_override |= np.char.find(names, keyword) >= 0
     # --- End of modification ---
 
-    # Original heuristic
-    sugars = float(nutrients.get("less_healthy", {}).get("Sugars, total including NLEA", "0g")[:-1])
-    saturated_fat = float(nutrients.get("less_healthy", {}).get("Fatty acids, total saturated", "0g")[:-1])
+    # Original heuristic: more beneficial than less healthy nutrients reported, and little sugar / saturated fat
+    present = ~np.isnan(matrix)
+    beneficial_count = present[:, BENEFICIAL_COLUMNS].sum(axis=1)
+    less_healthy_count = present[:, LESS_HEALTHY_COLUMNS].sum(axis=1)
+    sugars = np.nan_to_num(matrix[:, NUTRIENT_COLUMNS["Sugars, total including NLEA"]])
+    saturated_fat = np.nan_to_num(matrix[:, NUTRIENT_COLUMNS["Fatty acids, total saturated"]])
+
+    is_healthy_original = (beneficial_count > less_healthy_count) & (sugars < 10) & (saturated_fat < 5)
+    return is_healthy_override, is_healthy_original
+
+
+def format_health_report(record: Dict[str, Any], ingredient: str,
+                         is_healthy_override: bool, is_healthy_original: bool) -> str:
+    """
+    Builds the user-facing healthiness report for a parsed and classified nutrient record.
+
+    Args:
+        record (dict): A record as returned by `parse_nutrient_record`.
+        ingredient (str): The name the user asked about, used when the record has no description.
+        is_healthy_override (bool): The food is a fruit or vegetable (see `classify_health`).
+        is_healthy_original (bool): The nutrient heuristic says it's healthy (see `classify_health`).
+
+    Returns:
+        str: A user-friendly string summarizing the health information.
+    """
+    # Split the nutrients into beneficial and less healthy
+    nutrients = {
+        "beneficial": {},
+        "less_healthy": {}
+    }
 
-    is_healthy_original = len(nutrients["beneficial"]) > len(nutrients["less_healthy"]) and sugars < 10 and saturated_fat < 5
+    for nutrient_name, (amount, unit) in record["nutrients"].items():
+        if nutrient_name in BENEFICIAL_NUTRIENTS:
+            nutrients["beneficial"][nutrient_name] = f"{amount}{unit}"
+        elif nutrient_name in LESS_HEALTHY_NUTRIENTS:
+            nutrients["less_healthy"][nutrient_name] = f"{amount}{unit}"
 
     # Use override if it's true, otherwise use original logic
     is_healthy = is_healthy_override or is_healthy_original
 
     # Build the final output string
-    food_name = food_details.get("description", ingredient).capitalize()
+    food_name = (record.get("description") or ingredient).capitalize()
     if is_healthy:
         output = f"✅ {food_name} appears to be a healthy choice.\n\n"
         # If it was overridden (e.g., a fruit), provide a better explanation
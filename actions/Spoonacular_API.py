@@ -1,7 +1,125 @@
+import os
 import requests
 import random
 import re
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from actions.cache import TieredCache, cache_path_from_env
+from actions.http_client import get_session
+from actions.metrics import (RECIPE_BUFFER_LOOKUPS, RECIPE_LOCAL_SEARCHES, SPOONACULAR_QUOTA_POINTS_SAVED,
+                             observe_upstream, record_spoonacular_quota, track_caches)
+from actions.quota import QuotaExceeded, QuotaScheduler, background_priority, is_background
+from actions.recipe_local import FLAG_FACETS, get_local_corpus
+from actions.result_buffer import RecipeResultBuffer, SearchResults
+from actions.singleflight import get_flight_group
+
+# Shared connection pool for api.spoonacular.com
+# Every request is booked with SPOONACULAR_QUOTA first, so responses are never retried behind its back
+SPOONACULAR_SESSION = get_session("SPOONACULAR", retry_responses=False)
+# Point this at a stand-in server for benchmarks (see benchmarks/stub_apis.py)
+SPOONACULAR_BASE_URL = os.environ.get("SPOONACULAR_BASE_URL", "https://api.spoonacular.com").rstrip("/")
+
+# --- Recipe cache ---
+# /information and /nutritionWidget.json payloads keyed by recipe ID, so the explain flow can reuse
+# what the search flow already fetched. Spoonacular only allows caching for a limited time, so the
+# default TTL is one hour. Set SPOONACULAR_CACHE_PATH to an empty string to keep the cache in memory only.
+SPOONACULAR_CACHE_PATH = cache_path_from_env("SPOONACULAR_CACHE_PATH", ".cache/spoonacular.sqlite")
+SPOONACULAR_CACHE_SIZE = int(os.environ.get("SPOONACULAR_CACHE_SIZE", 512))
+SPOONACULAR_INFO_TTL = float(os.environ.get("SPOONACULAR_INFO_TTL", 3600))
+SPOONACULAR_NUTRITION_TTL = float(os.environ.get("SPOONACULAR_NUTRITION_TTL", 3600))
+
+RECIPE_CACHES = {
+    "information": TieredCache("spoonacular_information", ttl=SPOONACULAR_INFO_TTL,
+                               max_size=SPOONACULAR_CACHE_SIZE, path=SPOONACULAR_CACHE_PATH),
+    "nutritionWidget": TieredCache("spoonacular_nutrition", ttl=SPOONACULAR_NUTRITION_TTL,
+                                   max_size=SPOONACULAR_CACHE_SIZE, path=SPOONACULAR_CACHE_PATH),
+}
+
+track_caches(*RECIPE_CACHES.values())
+
+# --- Backend ---
+# "api": always search Spoonacular (default).
+# "local": only search the local recipe corpus built with `python -m actions.recipe_import`.
+# "local_first": search the local corpus and fall back to Spoonacular when nothing matches.
+RECIPE_BACKEND = os.environ.get("RECIPE_BACKEND", "api").lower()
+RECIPE_LOCAL_DB = os.environ.get("RECIPE_LOCAL_DB", ".cache/recipes_local.sqlite")
+# Share of the requested ingredients a local recipe must contain (1.0 = all, like includeIngredients)
+RECIPE_LOCAL_MIN_MATCH = float(os.environ.get("RECIPE_LOCAL_MIN_MATCH", 1.0))
+
+# --- Search payloads ---
+# complexSearch already returns the recipe details (addRecipeInformation, fillIngredients,
+# addRecipeInstructions), so find_recipe renders the chosen hit from the search payload and only
+# requests /information when one of RECIPE_DETAIL_FIELDS is missing. Set to "false" to always fetch it.
+SPOONACULAR_SEARCH_DETAILS = os.environ.get("SPOONACULAR_SEARCH_DETAILS", "true").lower() == "true"
+# What format_recipe shows
+RECIPE_DETAIL_FIELDS = ("title", "servings", "readyInMinutes", "extendedIngredients", "instructions")
+
+# --- Result buffer ---
+# find_recipe keeps the search hits it did not show per conversation, so "show me another recipe"
+# (next_recipe) needs no new search. The next page is fetched in the background when only
+# RECIPE_BUFFER_REFILL_AT hits are left. Buffers live in the action server process.
+RECIPE_BUFFER_CONVERSATIONS = int(os.environ.get("RECIPE_BUFFER_CONVERSATIONS", 1000))
+RECIPE_BUFFER_TTL = float(os.environ.get("RECIPE_BUFFER_TTL", 1800))
+RECIPE_BUFFER_REFILL_AT = int(os.environ.get("RECIPE_BUFFER_REFILL_AT", 2))  # 0 = never refill
+# What a buffered hit keeps: the fields format_recipe and the explanation use, and the facets
+BUFFERED_RECIPE_FIELDS = RECIPE_DETAIL_FIELDS + ("id", "sourceUrl", "healthScore", "diets", "cuisines",
+                                                 "dishTypes") + tuple(FLAG_FACETS)
+BUFFERED_INGREDIENT_FIELDS = ("id", "name", "nameClean", "original", "amount", "unit")
+
+RECIPE_RESULTS = RecipeResultBuffer(max_conversations=RECIPE_BUFFER_CONVERSATIONS, ttl=RECIPE_BUFFER_TTL)
+
+# --- Meal plans ---
+# plan_meals builds a day or week plan from one search per meal type and one /informationBulk request
+# (with nutrition) for all recipes, so a week costs as many upstream calls as a day.
+MEAL_PLAN_MAX_DAYS = int(os.environ.get("MEAL_PLAN_MAX_DAYS", 7))
+# (meal, Spoonacular meal type) of every day
+MEAL_PLAN_MEALS = (("Breakfast", "breakfast"), ("Lunch", "main course"), ("Dinner", "main course"))
+
+RECIPE_ENDPOINT_PATHS = {"information": "information", "nutritionWidget": "nutritionWidget.json"}
+
+# Quota points Spoonacular charges per request, used to report how many points the cache saved
+QUOTA_POINTS = {"information": 1, "nutritionWidget": 1}
+quota_points_saved = {"information": 0, "nutritionWidget": 0}
+_quota_lock = threading.Lock()
+# Estimated points of a search (1 + a fraction per result and per added field), booked before sending it
+SEARCH_QUOTA_POINTS = {"complexSearch": 1.6, "random": 1.01}
+
+
+def bulk_quota_points(count: int) -> float:
+    """Points of an /informationBulk request: 1 for the first recipe and 0.5 for every other one."""
+    return 1 + 0.5 * max(0, count - 1)
+
+# --- Quota scheduler ---
+# Every Spoonacular request first takes its turn from a rate limit and a daily point budget shared by
+# all action server processes (see actions/quota.py). Interactive searches wait up to
+# SPOONACULAR_QUEUE_TIMEOUT seconds for a turn; prefetching only uses spare capacity.
+SPOONACULAR_RATE_LIMIT = float(os.environ.get("SPOONACULAR_RATE_LIMIT", 5))  # Requests per second, 0 = no limit
+SPOONACULAR_RATE_BURST = int(os.environ.get("SPOONACULAR_RATE_BURST", 10))
+SPOONACULAR_DAILY_QUOTA = float(os.environ.get("SPOONACULAR_DAILY_QUOTA", 0))  # Points, 0 = learn from the headers
+SPOONACULAR_QUEUE_TIMEOUT = float(os.environ.get("SPOONACULAR_QUEUE_TIMEOUT", 2))
+SPOONACULAR_BACKGROUND_RESERVE = float(os.environ.get("SPOONACULAR_BACKGROUND_RESERVE", 0.2))
+SPOONACULAR_QUOTA_PATH = cache_path_from_env("SPOONACULAR_QUOTA_PATH", ".cache/spoonacular_quota.sqlite")
+
+SPOONACULAR_QUOTA = QuotaScheduler("spoonacular", rate=SPOONACULAR_RATE_LIMIT, burst=SPOONACULAR_RATE_BURST,
+                                   daily_limit=SPOONACULAR_DAILY_QUOTA, path=SPOONACULAR_QUOTA_PATH,
+                                   queue_timeout=SPOONACULAR_QUEUE_TIMEOUT,
+                                   background_reserve=SPOONACULAR_BACKGROUND_RESERVE)
+
+# --- Concurrent requests ---
+# Independent Spoonacular calls (e.g. /information and /nutritionWidget.json) run in parallel on a
+# bounded thread pool. find_recipe can also warm the nutrition cache for the chosen recipe and the
+# top-N other search hits in the background.
+SPOONACULAR_MAX_WORKERS = int(os.environ.get("SPOONACULAR_MAX_WORKERS", 8))
+SPOONACULAR_PREFETCH_TOP_N = int(os.environ.get("SPOONACULAR_PREFETCH_TOP_N", 0))  # Costs quota, off by default
+SPOONACULAR_PREFETCH_NUTRITION = os.environ.get("SPOONACULAR_PREFETCH_NUTRITION", "false").lower() == "true"
+
+_executor = ThreadPoolExecutor(max_workers=SPOONACULAR_MAX_WORKERS, thread_name_prefix="spoonacular")
+
+# Concurrent identical searches and recipe lookups share one upstream request (and its quota points)
+SPOONACULAR_SEARCH_FLIGHTS = get_flight_group("spoonacular_search")
+SPOONACULAR_RECIPE_FLIGHTS = get_flight_group("spoonacular_recipe")
 
 # def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) -> typing.Tuple[str, typing.Optional[str], typing.Optional[int]]:
 #     """
@@ -178,6 +296,336 @@ import typing
 #         # Catch any other unexpected errors
 #         return f"An unexpected error occurred: {e}", None, None
 
+def _get_recipe_endpoint(recipe_id: int, endpoint: str, api_key: str, params: dict = None) -> dict:
+    """
+    Fetches a per-recipe Spoonacular endpoint through the recipe cache.
+    Concurrent cache misses for the same recipe share one request.
+    Raises the usual `requests` exceptions when the API call fails.
+    """
+    cache = RECIPE_CACHES[endpoint]
+    data = cache.get(recipe_id)
+    if data is not None:
+        with _quota_lock:
+            quota_points_saved[endpoint] += QUOTA_POINTS[endpoint]
+        SPOONACULAR_QUOTA_POINTS_SAVED.labels(endpoint).inc(QUOTA_POINTS[endpoint])
+        return data
+
+    return _do_flight(SPOONACULAR_RECIPE_FLIGHTS, (endpoint, recipe_id),
+                      _fetch_recipe_endpoint, recipe_id, endpoint, api_key, params)
+
+
+def _do_flight(flights, key, function, *args):
+    """Joins or leads a coalesced request; a shed prefetch leading the flight does not fail user requests."""
+    try:
+        return flights.do(key, function, *args)
+    except QuotaExceeded as e:
+        if not e.background or is_background():
+            raise
+        return flights.do(key, function, *args)
+
+
+def _fetch_recipe_endpoint(recipe_id: int, endpoint: str, api_key: str, params: dict = None) -> dict:
+    SPOONACULAR_QUOTA.acquire(QUOTA_POINTS[endpoint])
+    url = f'{SPOONACULAR_BASE_URL}/recipes/{recipe_id}/{RECIPE_ENDPOINT_PATHS[endpoint]}'
+    response = observe_upstream("spoonacular", endpoint, SPOONACULAR_SESSION.get,
+                                url, params={'apiKey': api_key, **(params or {})})
+    record_spoonacular_quota(endpoint, response)
+    SPOONACULAR_QUOTA.record(response)
+    response.raise_for_status()
+
+    data = response.json()
+    RECIPE_CACHES[endpoint].set(recipe_id, data)
+    return data
+
+
+def search_recipes(search_url: str, search_params: dict) -> dict:
+    """
+    Runs a recipe search (complexSearch or random) and returns the raw payload.
+    Identical concurrent searches share one request; the key ignores case, ingredient order and the API key.
+    """
+    key = [search_url]
+    for name, value in sorted(search_params.items()):
+        if name == 'apiKey':
+            continue
+        if name == 'includeIngredients':
+            value = ','.join(sorted(value.lower().split(',')))
+        key.append((name, str(value).lower()))
+    return _do_flight(SPOONACULAR_SEARCH_FLIGHTS, tuple(key), _fetch_search, search_url, search_params)
+
+
+def _fetch_search(search_url: str, search_params: dict) -> dict:
+    endpoint = search_url.rsplit('/', 1)[-1]  # complexSearch or random
+    SPOONACULAR_QUOTA.acquire(SEARCH_QUOTA_POINTS.get(endpoint, 1))
+    search_response = observe_upstream("spoonacular", endpoint, SPOONACULAR_SESSION.get, search_url, params=search_params)
+    record_spoonacular_quota(endpoint, search_response)
+    SPOONACULAR_QUOTA.record(search_response)
+    search_response.raise_for_status()
+    return search_response.json()
+
+
+def get_recipe_information(recipe_id: int, api_key: str) -> dict:
+    """
+    Returns the `/recipes/{id}/information` payload (without nutrition), cached by recipe ID.
+    With a local backend, recipes in the local corpus are answered from there.
+    """
+    if RECIPE_BACKEND in ("local", "local_first"):
+        corpus = get_local_corpus(RECIPE_LOCAL_DB)
+        recipe = corpus.get(recipe_id) if corpus is not None else None
+        if recipe is not None:
+            return recipe
+    return _get_recipe_endpoint(recipe_id, "information", api_key, {'includeNutrition': False})
+
+
+def get_recipe_nutrition_widget(recipe_id: int, api_key: str) -> dict:
+    """Returns the `/recipes/{id}/nutritionWidget.json` payload, cached by recipe ID."""
+    return _get_recipe_endpoint(recipe_id, "nutritionWidget", api_key)
+
+
+def get_recipes_information_bulk(recipe_ids: typing.List[int], api_key: str) -> typing.Dict[int, dict]:
+    """
+    Returns the `/information` payloads with nutrition of several recipes, by recipe ID, with one
+    `/recipes/informationBulk` request for all recipes that are not cached with nutrition yet.
+    Raises the usual `requests` exceptions when the API call fails.
+    """
+    cache = RECIPE_CACHES["information"]
+    recipes, missing = {}, []
+    for recipe_id in dict.fromkeys(recipe_ids):
+        data = cache.get(recipe_id)
+        if data is not None and 'nutrition' in data:
+            recipes[recipe_id] = data
+        else:
+            missing.append(recipe_id)
+    if recipes:
+        with _quota_lock:
+            quota_points_saved["information"] += QUOTA_POINTS["information"] * len(recipes)
+        SPOONACULAR_QUOTA_POINTS_SAVED.labels("information").inc(QUOTA_POINTS["information"] * len(recipes))
+    if missing:
+        ids = tuple(sorted(missing))
+        recipes.update(_do_flight(SPOONACULAR_RECIPE_FLIGHTS, ("informationBulk", ids),
+                                  _fetch_information_bulk, ids, api_key))
+    return recipes
+
+
+def _fetch_information_bulk(recipe_ids: typing.Tuple[int, ...], api_key: str) -> typing.Dict[int, dict]:
+    SPOONACULAR_QUOTA.acquire(bulk_quota_points(len(recipe_ids)))
+    params = {'apiKey': api_key, 'ids': ','.join(str(recipe_id) for recipe_id in recipe_ids), 'includeNutrition': True}
+    response = observe_upstream("spoonacular", "informationBulk", SPOONACULAR_SESSION.get,
+                                f'{SPOONACULAR_BASE_URL}/recipes/informationBulk', params=params)
+    record_spoonacular_quota("informationBulk", response)
+    SPOONACULAR_QUOTA.record(response)
+    response.raise_for_status()
+
+    recipes = {}
+    for recipe in response.json():
+        recipes[recipe.get('id')] = recipe
+        # A superset of /information, so single-recipe lookups can use it too
+        RECIPE_CACHES["information"].set(recipe.get('id'), recipe)
+    return recipes
+
+
+def fetch_concurrently(calls: typing.Dict[str, typing.Callable[[], typing.Any]]) -> typing.Tuple[dict, dict]:
+    """
+    Runs independent API calls in parallel on the shared thread pool.
+
+    Args:
+        calls (dict): Maps a name to a function without arguments.
+
+    Returns:
+        A tuple containing:
+        - dict: The results of the calls that succeeded, by name.
+        - dict: The exceptions raised by the calls that failed, by name.
+    """
+    futures = {name: _executor.submit(call) for name, call in calls.items()}
+    results, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+    return results, errors
+
+
+def prefetch_nutrition_widgets(recipe_ids: typing.List[int], api_key: str) -> None:
+    """
+    Warms the nutrition cache in the background without waiting for the results. The /information
+    of search hits is already cached from the search itself, so only the nutrition is fetched, and
+    widgets that are cached cost no request. Failures are ignored; the real request will simply be
+    made again later.
+    """
+    for recipe_id in recipe_ids:
+        _executor.submit(_run_in_background, get_recipe_nutrition_widget, recipe_id, api_key)
+
+
+def _run_in_background(function, *args):
+    """Runs a prefetch with background priority, so it only uses quota users don't need, and ignores failures."""
+    try:
+        with background_priority():
+            function(*args)
+    except Exception:
+        pass
+
+
+def get_recipe_cache_stats() -> dict:
+    """Hit/miss counters of the recipe caches, the quota points they saved and the coalesced requests."""
+    with _quota_lock:
+        saved = dict(quota_points_saved)
+    return {
+        "caches": {endpoint: cache.stats() for endpoint, cache in RECIPE_CACHES.items()},
+        "quota_points_saved": saved,
+        "quota_points_saved_total": sum(saved.values()),
+        "quota": SPOONACULAR_QUOTA.stats(),
+        "result_buffer": RECIPE_RESULTS.stats(),
+        "coalesced": {
+            "search": SPOONACULAR_SEARCH_FLIGHTS.stats(),
+            "recipe": SPOONACULAR_RECIPE_FLIGHTS.stats(),
+        },
+    }
+
+
+def find_local_recipe(ingredients: typing.List[str], query_wish: typing.Optional[str],
+                      dish_type: str) -> typing.Optional[dict]:
+    """
+    Picks a recipe from the local corpus, ranked by how many of the ingredients it uses.
+
+    Returns:
+        Optional[dict]: The recipe's /information payload, or None when the corpus is missing
+        or has no match.
+    """
+    corpus = get_local_corpus(RECIPE_LOCAL_DB)
+    if corpus is None:
+        return None
+    recipe_ids = corpus.search(ingredients, query_wish, dish_type=dish_type, min_match=RECIPE_LOCAL_MIN_MATCH)
+    RECIPE_LOCAL_SEARCHES.labels("hit" if recipe_ids else "miss").inc()
+    if not recipe_ids:
+        return None
+    # Like the API path, a random pick among the best matches for variety
+    return corpus.get(random.choice(recipe_ids[:3]))
+
+
+def recipe_from_search(summary: dict) -> dict:
+    """
+    Turns a search hit into an /information-like payload: search results list the ingredients as
+    usedIngredients/missedIngredients and the steps as analyzedInstructions.
+    """
+    recipe = dict(summary)
+    if not recipe.get('extendedIngredients'):
+        ingredients = (recipe.get('usedIngredients') or []) + (recipe.get('missedIngredients') or [])
+        if ingredients:
+            recipe['extendedIngredients'] = ingredients
+    if not recipe.get('instructions'):
+        steps = [step.get('step', '').strip() for section in recipe.get('analyzedInstructions') or []
+                 for step in section.get('steps') or []]
+        steps = [step for step in steps if step]
+        if steps:
+            recipe['instructions'] = "\n".join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+    return recipe
+
+
+def missing_recipe_fields(recipe_details: dict) -> typing.List[str]:
+    """The RECIPE_DETAIL_FIELDS a payload lacks (absent or empty)."""
+    return [field for field in RECIPE_DETAIL_FIELDS if recipe_details.get(field) in (None, "", [])]
+
+
+def get_recipe_details(recipe_summary: dict, api_key: str) -> dict:
+    """
+    The details of a search hit, from the search payload when it has every field format_recipe
+    shows, otherwise from /information. A complete search payload is cached as the recipe's
+    /information, so a follow-up explanation still needs no extra request.
+    """
+    recipe_id = recipe_summary.get('id')
+    if SPOONACULAR_SEARCH_DETAILS:
+        recipe_details = recipe_from_search(recipe_summary)
+        if not missing_recipe_fields(recipe_details):
+            RECIPE_CACHES["information"].set(recipe_id, recipe_details)
+            with _quota_lock:
+                quota_points_saved["information"] += QUOTA_POINTS["information"]
+            SPOONACULAR_QUOTA_POINTS_SAVED.labels("information").inc(QUOTA_POINTS["information"])
+            return recipe_details
+    return get_recipe_information(recipe_id, api_key)
+
+
+def compact_recipe(recipe_details: dict) -> dict:
+    """The part of a recipe payload worth keeping in the result buffer (a few KiB less per hit)."""
+    recipe = {field: recipe_details[field] for field in BUFFERED_RECIPE_FIELDS if field in recipe_details}
+    if recipe.get('extendedIngredients'):
+        recipe['extendedIngredients'] = [
+            {field: ingredient[field] for field in BUFFERED_INGREDIENT_FIELDS if field in ingredient}
+            for ingredient in recipe['extendedIngredients']
+        ]
+    return recipe
+
+
+def format_recipe(recipe_details: dict, intro: str = "🍲 Here's a recipe I found for you!") -> str:
+    """Builds the user-friendly recipe message from an /information payload."""
+    title = recipe_details.get('title', 'Untitled Recipe')
+    servings = recipe_details.get('servings', 'N/A')
+    ready_in = recipe_details.get('readyInMinutes', 'N/A')
+    source_url = recipe_details.get('sourceUrl', '#')
+
+    output = f"{intro}\n\n"
+    output += f"**{title}**\n\n"
+    output += f"**Serves:** {servings}\n"
+    output += f"**Ready in:** {ready_in} minutes\n"
+    output += f"**Source:** {source_url}\n"
+
+    # Ingredients
+    output += f"\n--- Ingredients ---\n"
+    if recipe_details.get('extendedIngredients'):
+        for ingredient in recipe_details['extendedIngredients']:
+            output += f" * {ingredient.get('original', 'Unknown ingredient')}\n"
+    else:
+        output += "No ingredients listed.\n"
+
+    # Instructions
+    output += f"\n--- Instructions ---\n"
+    instructions = recipe_details.get('instructions')
+    if instructions:
+        clean_instructions = re.sub(r'<[^>]+>', '\n', instructions).strip()
+        clean_instructions = re.sub(r'\n\s*\n', '\n', clean_instructions)
+        output += f"{clean_instructions}\n"
+    else:
+        output += "No instructions provided. Check the source URL for details.\n"
+    return output
+
+
+def recipe_calories(recipe_details: dict) -> typing.Optional[float]:
+    """Calories per serving from the `nutrition` of an /information payload (includeNutrition), if any."""
+    for nutrient in (recipe_details.get('nutrition') or {}).get('nutrients') or []:
+        if nutrient.get('name') == 'Calories':
+            return nutrient.get('amount')
+    return None
+
+
+def format_recipe_line(recipe_details: dict) -> str:
+    """A one-line summary of a recipe: title, time, servings, calories and source."""
+    details = [f"{recipe_details.get('readyInMinutes', 'N/A')} min",
+               f"serves {recipe_details.get('servings', 'N/A')}"]
+    calories = recipe_calories(recipe_details)
+    if calories is not None:
+        details.append(f"{calories:.0f} kcal per serving")
+    return f"**{recipe_details.get('title', 'Untitled Recipe')}** ({', '.join(details)}) {recipe_details.get('sourceUrl', '#')}"
+
+
+def format_meal_plan(days: typing.List[typing.List[typing.Tuple[str, typing.Optional[dict]]]]) -> str:
+    """Builds the meal plan message from the (meal, recipe) pairs of every day."""
+    output = "🗓️ Here's your meal plan!\n"
+    for number, meals in enumerate(days, 1):
+        if len(days) > 1:
+            output += f"\n--- Day {number} ---\n"
+        else:
+            output += "\n"
+        total = 0.0
+        for meal, recipe in meals:
+            if recipe is None:
+                output += f" * {meal}: no recipe found\n"
+                continue
+            output += f" * {meal}: {format_recipe_line(recipe)}\n"
+            total += recipe_calories(recipe) or 0
+        if total:
+            output += f"About {total:.0f} kcal (one serving of each meal)\n"
+    return output
+
+
 def get_recipe_nutrition(recipe_id: int, recipe_title: str, api_key: str) -> str:
     """
     Fetches nutritional information and a health score for a given recipe ID.
@@ -191,50 +639,53 @@ def get_recipe_nutrition(recipe_id: int, recipe_title: str, api_key: str) -> str
         str: A formatted string explaining the recipe's healthiness and nutritional facts.
     """
     try:
-        # --- Step 1: Get Health Score from the information endpoint ---
-        info_url = f'https://api.spoonacular.com/recipes/{recipe_id}/information'
-        info_params = {'apiKey': api_key, 'includeNutrition': False}
-        
-        info_response = requests.get(info_url, params=info_params, timeout=10)
-        info_response.raise_for_status()
-        
-        recipe_info = info_response.json()
-        health_score = recipe_info.get('healthScore', 0)
-
-        # --- Step 2: Get Nutrition Facts from the nutrition widget endpoint ---
-        nutrition_url = f'https://api.spoonacular.com/recipes/{recipe_id}/nutritionWidget.json'
-        nutrition_params = {'apiKey': api_key}
+        # --- Step 1 & 2: Get the Health Score and Nutrition Facts in parallel ---
+        # /information is usually already cached by find_recipe
+        results, errors = fetch_concurrently({
+            "information": lambda: get_recipe_information(recipe_id, api_key),
+            "nutrition": lambda: get_recipe_nutrition_widget(recipe_id, api_key),
+        })
 
-        nutrition_response = requests.get(nutrition_url, params=nutrition_params, timeout=10)
-        nutrition_response.raise_for_status()
-
-        nutrition_data = nutrition_response.json()
-        calories = nutrition_data.get('calories', 'N/A')
-        carbs = nutrition_data.get('carbs', 'N/A')
-        fat = nutrition_data.get('fat', 'N/A')
-        protein = nutrition_data.get('protein', 'N/A')
+        # Only give up when both requests failed, otherwise explain what we have
+        if not results:
+            raise errors["information"]
 
         # --- Step 3: Build the explanation string ---
         
         # Part A: Health Score Explanation
-        health_explanation = f"The recipe '{recipe_title}' has a health score of **{health_score} out of 100**.\n"
-        if health_score >= 75:
-            health_explanation += "This is a very healthy choice! It's well-balanced and likely rich in nutrients."
-        elif health_score >= 50:
-            health_explanation += "This is a reasonably healthy option. It provides a good balance of nutrients."
+        if "information" in results:
+            health_score = results["information"].get('healthScore', 0)
+            health_explanation = f"The recipe '{recipe_title}' has a health score of **{health_score} out of 100**.\n"
+            if health_score >= 75:
+                health_explanation += "This is a very healthy choice! It's well-balanced and likely rich in nutrients."
+            elif health_score >= 50:
+                health_explanation += "This is a reasonably healthy option. It provides a good balance of nutrients."
+            else:
+                health_explanation += "This might not be the healthiest option, but it can be enjoyed in moderation as part of a balanced diet."
         else:
-            health_explanation += "This might not be the healthiest option, but it can be enjoyed in moderation as part of a balanced diet."
+            health_explanation = f"I couldn't retrieve the health score of '{recipe_title}' right now, but here are its nutritional facts."
 
         # Part B: Nutritional Facts
-        nutritional_facts = (
-            f"\n\n--- Nutritional Facts (per serving) ---\n"
-            f" * **Calories:** {calories}\n"
-            f" * **Carbohydrates:** {carbs}\n"
-            f" * **Fat:** {fat}\n"
-            f" * **Protein:** {protein}\n"
-        )
+        if "nutrition" in results:
+            nutrition_data = results["nutrition"]
+            calories = nutrition_data.get('calories', 'N/A')
+            carbs = nutrition_data.get('carbs', 'N/A')
+            fat = nutrition_data.get('fat', 'N/A')
+            protein = nutrition_data.get('protein', 'N/A')
+
+            nutritional_facts = (
+                f"\n\n--- Nutritional Facts (per serving) ---\n"
+                f" * **Calories:** {calories}\n"
+                f" * **Carbohydrates:** {carbs}\n"
+                f" * **Fat:** {fat}\n"
+                f" * **Protein:** {protein}\n"
+            )
+        else:
+            nutritional_facts = "\n\nThe detailed nutritional facts are not available at the moment.\n"
 
-        calc_explanation = f"\nThe Spoonacular health score is a nutrient-density rating from 0 to 100 that rewards fiber and vitamins while penalizing sodium, sugar, and saturated fats, meaning most recipes fall below 50 because they contain common levels of salt or fat that the strict algorithm considers less than perfectly nutritious.\n"
+        calc_explanation = ""
+        if "information" in results:
+            calc_explanation = f"\nThe Spoonacular health score is a nutrient-density rating from 0 to 100 that rewards fiber and vitamins while penalizing sodium, sugar, and saturated fats, meaning most recipes fall below 50 because they contain common levels of salt or fat that the strict algorithm considers less than perfectly nutritious.\n"
 
         return f"{health_explanation}{nutritional_facts}{calc_explanation}"
 
@@ -245,6 +696,8 @@ def get_recipe_nutrition(recipe_id: int, recipe_title: str, api_key: str) -> str
             return f"Error: API quota exceeded. Details: {http_err.response.json().get('message')}"
         else:
             return f"HTTP error occurred while fetching nutrition: {http_err}"
+    except QuotaExceeded as e:
+        return str(e)
     except requests.exceptions.RequestException as e:
         return f"An error occurred during the API request for nutrition: {e}"
     except Exception as e:
@@ -273,11 +726,39 @@ import random
 import typing
 import re
 
-def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) -> typing.Tuple[str, typing.Optional[str], typing.Optional[int]]:
+def no_recipes_message(chosen_type: str, clean_ingredients: typing.List[str],
+                       clean_wish: typing.Optional[str], other: bool = False) -> str:
+    error_details = []
+    if clean_wish: error_details.append(f"wish: '{clean_wish}'")
+    if clean_ingredients: error_details.append(f"ingredients: {', '.join(clean_ingredients)}")
+    detail_str = " and ".join(error_details)
+    return f"😢 No {'other ' if other else ''}{chosen_type} recipes found matching {detail_str}."
+
+
+def clean_search_inputs(ingredients: typing.Optional[typing.List[str]],
+                        query_wish: typing.Optional[str]) -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+    """The non-empty ingredients and the wish (None when empty)."""
+    clean_ingredients = [i.strip() for i in ingredients or [] if i and i.strip()]
+    clean_wish = query_wish.strip() if query_wish and query_wish.strip() else None
+    return clean_ingredients, clean_wish
+
+
+def search_key(clean_ingredients: typing.List[str], clean_wish: typing.Optional[str]) -> tuple:
+    """Identifies a search in the result buffer, ignoring case and ingredient order."""
+    return tuple(sorted(i.lower() for i in clean_ingredients)), (clean_wish or "").lower()
+
+
+def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str,
+                prefetch_top_n: int = SPOONACULAR_PREFETCH_TOP_N,
+                prefetch_nutrition: bool = SPOONACULAR_PREFETCH_NUTRITION,
+                sender_id: typing.Optional[str] = None) -> typing.Tuple[str, typing.Optional[str], typing.Optional[int]]:
     """
     Fetches a recipe from the Spoonacular API. 
     - Combined Search: Can filter by ingredients, wish/keyword, AND meal type simultaneously.
     - Meal Types: Filters for either 'breakfast' or 'main course' (evening meal).
+    - Prefetching: Optionally warms the cache with /information for the top-N other hits, and with
+      the nutrition of the chosen recipe, so a follow-up explanation needs no extra round-trip.
+    - Result buffer: With a sender ID, the other hits are kept for next_recipe.
     """
     
     # --- Step 0: Static Meal Types ---
@@ -286,11 +767,17 @@ def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) ->
     chosen_type = "main course"
     
     # --- Step 1: Sanitize Inputs ---
-    if ingredients is None:
-        ingredients = []
-    
-    clean_ingredients = [i.strip() for i in ingredients if i and i.strip()]
-    clean_wish = query_wish.strip() if query_wish and query_wish.strip() else None
+    clean_ingredients, clean_wish = clean_search_inputs(ingredients, query_wish)
+
+    # --- Step 1b: Answer from the local recipe corpus when configured ---
+    # No network call and no quota points; Spoonacular is only asked when the corpus has no match
+    if RECIPE_BACKEND in ("local", "local_first"):
+        recipe_details = find_local_recipe(clean_ingredients, clean_wish, chosen_type)
+        if recipe_details is not None:
+            title = recipe_details.get('title', 'Untitled Recipe')
+            return format_recipe(recipe_details), title, recipe_details.get('id')
+        if RECIPE_BACKEND == "local":
+            return no_recipes_message(chosen_type, clean_ingredients, clean_wish), None, None
 
     # --- Step 2: Determine Search Strategy ---
     search_params = {
@@ -302,7 +789,7 @@ def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) ->
     try:
         # Scenario A & B: Ingredients and/or Wish provided
         if clean_ingredients or clean_wish:
-            search_url = 'https://api.spoonacular.com/recipes/complexSearch'
+            search_url = f'{SPOONACULAR_BASE_URL}/recipes/complexSearch'
             
             # This handles the combined logic:
             if clean_ingredients:
@@ -316,32 +803,26 @@ def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) ->
             
             search_params.update({
                 'addRecipeInformation': True,
+                'addRecipeInstructions': True,
                 'fillIngredients': True
             })
 
         # Scenario C: Both are empty (Random recipe based on meal type)
         else:
-            search_url = 'https://api.spoonacular.com/recipes/random'
+            search_url = f'{SPOONACULAR_BASE_URL}/recipes/random'
             search_params.update({
                 'number': 1,
                 'tags': chosen_type
             })
 
         # --- First API Call: Search ---
-        search_response = requests.get(search_url, params=search_params, timeout=10)
-        search_response.raise_for_status()
-        
-        data = search_response.json()
+        data = search_recipes(search_url, search_params)
         
         # Normalize response (complexSearch uses 'results', random uses 'recipes')
         recipes = data.get('results', data.get('recipes', []))
 
         if not recipes:
-            error_details = []
-            if clean_wish: error_details.append(f"wish: '{clean_wish}'")
-            if clean_ingredients: error_details.append(f"ingredients: {', '.join(clean_ingredients)}")
-            detail_str = " and ".join(error_details)
-            return f"😢 No {chosen_type} recipes found matching {detail_str}.", None, None
+            return no_recipes_message(chosen_type, clean_ingredients, clean_wish), None, None
 
         # Pick a random recipe from the results
         chosen_recipe_summary = random.choice(recipes)
@@ -350,45 +831,26 @@ def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) ->
         if not recipe_id:
             return "Error: Found recipes, but could not retrieve a valid recipe ID.", None, None
 
-        # --- Step 3: Get full details (Step 2 in original logic) ---
-        info_url = f'https://api.spoonacular.com/recipes/{recipe_id}/information'
-        info_params = {'apiKey': api_key, 'includeNutrition': False}
+        # Warm the nutrition cache in the background while we build this response
+        if prefetch_nutrition:
+            other_ids = [recipe.get('id') for recipe in recipes if recipe.get('id') and recipe.get('id') != recipe_id]
+            prefetch_nutrition_widgets([recipe_id] + other_ids[:prefetch_top_n], api_key)
 
-        info_response = requests.get(info_url, params=info_params, timeout=10)
-        info_response.raise_for_status()
-        recipe_details = info_response.json()
+        # Keep the other hits for "show me another recipe" (random recipes are not a search that can be paged)
+        if sender_id and 'results' in data:
+            params = {name: value for name, value in search_params.items() if name != 'apiKey'}
+            others = [compact_recipe(recipe_from_search(recipe)) for recipe in recipes if recipe is not chosen_recipe_summary]
+            RECIPE_RESULTS.put(sender_id, SearchResults(
+                search_key(clean_ingredients, clean_wish), search_url, params, others, [recipe_id],
+                next_offset=data.get('offset', 0) + len(recipes), total_results=data.get('totalResults')))
+
+        # --- Step 3: Get full details (Step 2 in original logic) ---
+        # Usually already in the search payload; cached, so a follow-up get_recipe_nutrition does not pay for it again
+        recipe_details = get_recipe_details(chosen_recipe_summary, api_key)
 
         # --- Step 4: Build output string ---
         title = recipe_details.get('title', 'Untitled Recipe')
-        servings = recipe_details.get('servings', 'N/A')
-        ready_in = recipe_details.get('readyInMinutes', 'N/A')
-        source_url = recipe_details.get('sourceUrl', '#')
-
-        output = f"🍲 Here's a recipe I found for you!\n\n"
-        output += f"**{title}**\n\n"
-        output += f"**Serves:** {servings}\n"
-        output += f"**Ready in:** {ready_in} minutes\n"
-        output += f"**Source:** {source_url}\n"
-
-        # Ingredients
-        output += f"\n--- Ingredients ---\n"
-        if recipe_details.get('extendedIngredients'):
-            for ingredient in recipe_details['extendedIngredients']:
-                output += f" * {ingredient.get('original', 'Unknown ingredient')}\n"
-        else:
-            output += "No ingredients listed.\n"
-        
-        # Instructions
-        output += f"\n--- Instructions ---\n"
-        instructions = recipe_details.get('instructions')
-        if instructions:
-            clean_instructions = re.sub(r'<[^>]+>', '\n', instructions).strip()
-            clean_instructions = re.sub(r'\n\s*\n', '\n', clean_instructions)
-            output += f"{clean_instructions}\n"
-        else:
-            output += "No instructions provided. Check the source URL for details.\n"
-            
-        return output, title, recipe_id
+        return format_recipe(recipe_details), title, recipe_id
 
     except requests.exceptions.HTTPError as http_err:
         if http_err.response.status_code == 401:
@@ -396,5 +858,133 @@ def find_recipe(ingredients: typing.List[str], query_wish: str, api_key: str) ->
         elif http_err.response.status_code == 402:
             return "Error: API quota exceeded.", None, None
         return f"HTTP error occurred: {http_err}", None, None
+    except QuotaExceeded as e:
+        return str(e), None, None
+    except Exception as e:
+        return f"An unexpected error occurred: {e}", None, None
+
+
+def next_recipe(ingredients: typing.List[str], query_wish: str, api_key: str,
+                sender_id: str) -> typing.Tuple[str, typing.Optional[str], typing.Optional[int]]:
+    """
+    Shows another recipe for the conversation's last search, from the hits find_recipe kept.
+    Without a buffer for this search (expired, another process, new ingredients) it searches again.
+
+    Args:
+        ingredients (List[str]): The ingredients of the search.
+        query_wish (str): The wish of the search.
+        api_key (str): Your personal API key for the Spoonacular API.
+        sender_id (str): The conversation.
+
+    Returns:
+        A tuple like find_recipe: the message, the recipe title and the recipe ID.
+    """
+    chosen_type = "main course"
+    clean_ingredients, clean_wish = clean_search_inputs(ingredients, query_wish)
+    hit, results = RECIPE_RESULTS.pop(sender_id, search_key(clean_ingredients, clean_wish))
+    RECIPE_BUFFER_LOOKUPS.labels("hit" if hit is not None else "miss").inc()
+
+    if hit is None:
+        if results is not None and results.exhausted and not results.refilling:
+            return no_recipes_message(chosen_type, clean_ingredients, clean_wish, other=True), None, None
+        return find_recipe(ingredients, query_wish, api_key, sender_id=sender_id)
+
+    if RECIPE_BUFFER_REFILL_AT > 0:
+        offset = RECIPE_RESULTS.start_refill(results, RECIPE_BUFFER_REFILL_AT)
+        if offset is not None:
+            _executor.submit(_run_in_background, _refill_results, results, offset, api_key)
+
+    try:
+        # Buffered hits are complete, so this only calls /information for hits that lacked fields
+        recipe_details = get_recipe_details(hit, api_key)
+    except QuotaExceeded as e:
+        return str(e), None, None
+    except Exception as e:
+        return f"An unexpected error occurred: {e}", None, None
+    title = recipe_details.get('title', 'Untitled Recipe')
+    return format_recipe(recipe_details, intro="🍲 Here's another recipe for you!"), title, recipe_details.get('id')
+
+
+def _refill_results(results: SearchResults, offset: int, api_key: str) -> None:
+    """Fetches the next page of a buffered search."""
+    try:
+        data = search_recipes(results.search_url, {**results.search_params, 'apiKey': api_key, 'offset': offset})
+    except Exception:
+        RECIPE_RESULTS.cancel_refill(results)
+        raise
+    hits = data.get('results', [])
+    RECIPE_RESULTS.finish_refill(results, [compact_recipe(recipe_from_search(hit)) for hit in hits],
+                                 next_offset=offset + len(hits),
+                                 # An empty page means there is nothing more to fetch
+                                 total_results=data.get('totalResults') if hits else offset)
+
+
+def plan_meals(ingredients: typing.List[str], query_wish: str, api_key: str, days: int = 1) -> str:
+    """
+    Builds a meal plan (breakfast, lunch and dinner per day) around the ingredients and wish.
+
+    Costs one search per meal type and one /informationBulk request, however many days are planned.
+    When a search has fewer hits than meals, its recipes are repeated.
+
+    Args:
+        ingredients (List[str]): Ingredients the recipes should use.
+        query_wish (str): The wish the recipes should match (e.g. "vegan").
+        api_key (str): Your personal API key for the Spoonacular API.
+        days (int): Days to plan, from 1 to MEAL_PLAN_MAX_DAYS.
+
+    Returns:
+        str: The meal plan, or a message explaining why there is none.
+    """
+    days = max(1, min(int(days or 1), MEAL_PLAN_MAX_DAYS))
+    clean_ingredients, clean_wish = clean_search_inputs(ingredients, query_wish)
+    needed = {}
+    for _, meal_type in MEAL_PLAN_MEALS:
+        needed[meal_type] = needed.get(meal_type, 0) + days
+
+    def search(meal_type: str, number: int) -> dict:
+        params = {'apiKey': api_key, 'number': number, 'type': meal_type, 'instructionsRequired': True}
+        if clean_ingredients:
+            params['includeIngredients'] = ','.join(clean_ingredients)
+            params['sort'] = 'max-used-ingredients'
+        if clean_wish:
+            params['query'] = clean_wish
+        return search_recipes(f'{SPOONACULAR_BASE_URL}/recipes/complexSearch', params)
+
+    try:
+        # --- Step 1: One search per meal type, in parallel ---
+        results, errors = fetch_concurrently({meal_type: (lambda meal_type=meal_type, number=number: search(meal_type, number))
+                                              for meal_type, number in needed.items()})
+        if errors and not results:
+            raise next(iter(errors.values()))
+        hits = {meal_type: [recipe.get('id') for recipe in data.get('results', []) if recipe.get('id')]
+                for meal_type, data in results.items()}
+        if not any(hits.values()):
+            return no_recipes_message("meal plan", clean_ingredients, clean_wish)
+
+        # --- Step 2: All recipes of the plan in one request ---
+        recipe_ids = [recipe_id for ids in hits.values() for recipe_id in ids]
+        recipes = get_recipes_information_bulk(recipe_ids, api_key)
+
+        # --- Step 3: Hand out the recipes, without repeating one before every hit was used ---
+        used = {meal_type: 0 for meal_type in hits}
+        plan = []
+        for _ in range(days):
+            meals = []
+            for meal, meal_type in MEAL_PLAN_MEALS:
+                ids = hits.get(meal_type) or []
+                recipe = recipes.get(ids[used[meal_type] % len(ids)]) if ids else None
+                used[meal_type] = used.get(meal_type, 0) + 1
+                meals.append((meal, recipe))
+            plan.append(meals)
+        return format_meal_plan(plan)
+
+    except requests.exceptions.HTTPError as http_err:
+        if http_err.response.status_code == 401:
+            return "Error: Authentication failed. Check your API_KEY."
+        elif http_err.response.status_code == 402:
+            return "Error: API quota exceeded."
+        return f"HTTP error occurred: {http_err}"
+    except QuotaExceeded as e:
+        return str(e)
     except Exception as e:
-        return f"An unexpected error occurred: {e}", None, None
\ No newline at end of file
+        return f"An unexpected error occurred: {e}"
@@ -1,33 +1,60 @@
 
 from actions.FDC_API import *
-from actions.Spoonacular_API import find_recipe, get_recipe_nutrition
+from actions.Spoonacular_API import find_recipe, get_recipe_nutrition, next_recipe, plan_meals
+from actions.http_client import run_blocking
+from actions.knowledge_base import get_knowledge_base
+from actions.metrics import start_metrics_server, timed_action
+from actions.name_index import INGREDIENT_INDEX
 from typing import Any, Text, Dict, List
 
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # --- FDC API Key ---
 FDC_API_KEY = os.environ.get("FDC_API_KEY", "DEMO_KEY")
 SPOONACULAR_API_KEY = os.environ.get("SPOONACULAR_API_KEY", "DEMO_KEY")
 
+# The actions are async: the blocking API helpers run on a thread pool (see actions/http_client.py)
+# so the action server keeps serving other conversations while one waits on an upstream API.
+
+# Action timings, upstream latencies, cache hit ratios and Spoonacular quota (see actions/metrics.py)
+start_metrics_server()
+
+# Load (or build) the cooking knowledge base index now, not on the first question
+get_knowledge_base()
+
+
+
+def recipe_search_slots(tracker: Tracker):
+    """The ingredients and wish of the recipe search in the slots."""
+    ingredients_raw = tracker.get_slot("ingredients")
+    ingredients = [item.strip() for item in ingredients_raw.split(',')] if ingredients_raw else []
+    # Canonical names ("Tomatoes" -> "tomato") so equivalent searches share the cache. Names that
+    # normalize to nothing ("123", "the") are dropped, so the search asks for ingredients instead.
+    canonical = (INGREDIENT_INDEX.canonical_name(item) for item in ingredients if item)
+    ingredients = list(dict.fromkeys(name for name in canonical if name))
+    query_wish = tracker.get_slot("query_wish") or "" # Use wish or empty string
+    return ingredients, query_wish
 
 
 class ActionSearchRecipe(Action):
     def name(self) -> Text:
         return "action_search_recipe"
 
-    def run(
+    @timed_action
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any],
     ) -> List[Dict[Text, Any]]:
         
-        ingredients_raw = tracker.get_slot("ingredients")
-        ingredients = [item.strip() for item in ingredients_raw.split(',')] if ingredients_raw else []
-        query_wish = tracker.get_slot("query_wish") or "" # Use wish or empty string
+        ingredients, query_wish = recipe_search_slots(tracker)
         
         if ingredients:
             if SPOONACULAR_API_KEY == "DEMO_KEY":
@@ -35,12 +62,14 @@ class ActionSearchRecipe(Action):
                 return []
 
             # Call the Spoonacular API
-            recipe_output, recipe_title, recipe_id = find_recipe(ingredients, query_wish, SPOONACULAR_API_KEY)
+            # The other hits are kept for action_next_recipe
+            recipe_output, recipe_title, recipe_id = await run_blocking(
+                find_recipe, ingredients, query_wish, SPOONACULAR_API_KEY, sender_id=tracker.sender_id)
             
             dispatcher.utter_message(text=recipe_output)
 
             if recipe_title:
-                print('yes')
+                logger.debug(f"Found recipe {recipe_id}: {recipe_title}")
                 return [SlotSet("last_recipe_name", recipe_title), SlotSet("last_recipe_id", recipe_id)]
             else:
                 return [SlotSet("last_recipe_name", None), SlotSet("last_recipe_id", None)]
@@ -52,11 +81,70 @@ class ActionSearchRecipe(Action):
         return []
 
 
+class ActionNextRecipe(Action):
+    def name(self) -> Text:
+        return "action_next_recipe"
+
+    @timed_action
+    async def run(
+        self,
+        dispatcher: CollectingDispatcher,
+        tracker: Tracker,
+        domain: Dict[Text, Any],
+    ) -> List[Dict[Text, Any]]:
+
+        ingredients, query_wish = recipe_search_slots(tracker)
+
+        if not ingredients:
+            dispatcher.utter_message(text="To find a recipe, please ask me.")
+            return []
+        if SPOONACULAR_API_KEY == "DEMO_KEY":
+            dispatcher.utter_message(text="The SPOONACULAR_API_KEY is not configured. Please set it to use this feature.")
+            return []
+
+        # Usually answered from the hits of the last search, without a network call
+        recipe_output, recipe_title, recipe_id = await run_blocking(
+            next_recipe, ingredients, query_wish, SPOONACULAR_API_KEY, tracker.sender_id)
+        dispatcher.utter_message(text=recipe_output)
+
+        if recipe_title:
+            logger.debug(f"Next recipe {recipe_id}: {recipe_title}")
+            return [SlotSet("last_recipe_name", recipe_title), SlotSet("last_recipe_id", recipe_id)]
+        return [SlotSet("last_recipe_name", None), SlotSet("last_recipe_id", None)]
+
+
+class ActionPlanMeals(Action):
+    def name(self) -> Text:
+        return "action_plan_meals"
+
+    @timed_action
+    async def run(
+        self,
+        dispatcher: CollectingDispatcher,
+        tracker: Tracker,
+        domain: Dict[Text, Any],
+    ) -> List[Dict[Text, Any]]:
+
+        ingredients, query_wish = recipe_search_slots(tracker)
+        days = tracker.get_slot("plan_days") or 1
+
+        if SPOONACULAR_API_KEY == "DEMO_KEY":
+            dispatcher.utter_message(text="The SPOONACULAR_API_KEY is not configured. Please set it to use this feature.")
+        else:
+            # A constant number of API calls, however many days are planned
+            plan_output = await run_blocking(plan_meals, ingredients, query_wish, SPOONACULAR_API_KEY, int(days))
+            dispatcher.utter_message(text=plan_output)
+
+        # Ask again for the next plan
+        return [SlotSet("plan_days", None)]
+
+
 class ActionCheckHealthiness(Action):
     def name(self) -> Text:
         return "action_check_healthiness"
 
-    def run(
+    @timed_action
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
@@ -66,11 +154,13 @@ class ActionCheckHealthiness(Action):
         food_item = tracker.get_slot("food_item")
         
         if food_item:
-            if FDC_API_KEY == "DEMO_KEY":
+            if FDC_API_KEY == "DEMO_KEY" and FDC_BACKEND == "api":
                 dispatcher.utter_message(text="The FDC_API_KEY is not configured. Please set it to use this feature.")
             else:
-                health_info = get_ingredient_health_info(food_item, FDC_API_KEY)
-                dispatcher.utter_message(text=health_info)
+                # "tomato, cheese, basil" is checked as one batch
+                food_items = [item.strip() for item in food_item.split(',') if item.strip()] or [food_item]
+                health_infos = await run_blocking(get_ingredients_health_info, food_items, FDC_API_KEY)
+                dispatcher.utter_message(text="\n\n".join(health_infos))
         else:
             dispatcher.utter_message(text="Which food item do you want to know about?")
 
@@ -81,7 +171,8 @@ class ActionExplainRecommendation(Action):
     def name(self) -> Text:
         return "action_explain_recommendation"
 
-    def run(
+    @timed_action
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
@@ -95,7 +186,7 @@ class ActionExplainRecommendation(Action):
             if SPOONACULAR_API_KEY == "DEMO_KEY":
                 dispatcher.utter_message(text="The SPOONACULAR_API_KEY is not configured. Please set it to use this feature.")
             else:
-                explanation = get_recipe_nutrition(last_recipe_id, last_recipe, SPOONACULAR_API_KEY)
+                explanation = await run_blocking(get_recipe_nutrition, last_recipe_id, last_recipe, SPOONACULAR_API_KEY)
                 dispatcher.utter_message(text=explanation)
         else:
             dispatcher.utter_message(text="I don't have a recipe in context. Could you ask for a recipe first?")
@@ -103,6 +194,36 @@ class ActionExplainRecommendation(Action):
         return []
 
 
+class ActionAnswerCookingQuestion(Action):
+    def name(self) -> Text:
+        return "action_answer_cooking_question"
+
+    @timed_action
+    async def run(
+        self,
+        dispatcher: CollectingDispatcher,
+        tracker: Tracker,
+        domain: Dict[Text, Any],
+    ) -> List[Dict[Text, Any]]:
+
+        question = tracker.latest_message.get("text") or ""
+        knowledge_base = get_knowledge_base()
+        if knowledge_base.uses_embeddings:
+            # Encoding the question with the embedding model blocks, keep it off the event loop
+            match = await run_blocking(knowledge_base.search, question)
+        else:
+            # In-process BM25 lookup, fast enough to run without the thread pool
+            match = knowledge_base.search(question)
+
+        if match:
+            logger.debug(f"Answered {question!r} with {match.question!r} (confidence {match.confidence:.2f})")
+            dispatcher.utter_message(text=match.answer)
+        else:
+            dispatcher.utter_message(response="utter_cooking_question_unknown")
+
+        return []
+
+
 
 # # actions.py
 # from rasa_sdk import Action
@@ -0,0 +1,326 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    A small thread-safe in-process LRU cache where every entry can expire.
+
+    Args:
+        max_size (int): The maximum number of entries kept in memory.
+        ttl (float): Default time-to-live in seconds (None means no expiry).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            # Evict the least recently used entries once we are over the limit
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All entries that have not expired yet, least recently used first."""
+        return [(key, value) for key, value, _ in self.entries()]
+
+    def entries(self) -> List[Tuple[str, Any, Optional[float]]]:
+        """Like `items`, with the expiry time of every entry: (key, value, expires_at)."""
+        now = time.time()
+        with self._lock:
+            return [(key, value, expires_at) for key, (expires_at, value) in self._data.items()
+                    if expires_at is None or expires_at >= now]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# One connection (and the lock guarding it) per database file, shared by every namespace stored in it.
+_connections: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(path: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+    with _connections_lock:
+        if path not in _connections:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+            # WAL lets several action server processes read while one writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed_at)")
+            _connections[path] = (connection, threading.Lock())
+        return _connections[path]
+
+
+class SQLiteCache:
+    """
+    A persistent key/value store backed by a SQLite file. Values must be JSON serializable.
+
+    Args:
+        path (str): Location of the SQLite file (created if missing).
+        namespace (str): Keeps several caches apart inside one file.
+        max_entries (int): Least recently used rows are evicted beyond this number.
+        ttl (float): Default time-to-live in seconds (None means no expiry).
+    """
+
+    # Reads refresh a row's access time at most this often (seconds). The eviction order only needs
+    # to be roughly right, and a write on every disk hit would contend for the write lock
+    access_time_resolution = 60
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 50000, ttl: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._connection, self._lock = _connect(path)
+        self._writes = 0
+
+    def get_entry(self, key: str):
+        """Returns (value, expires_at) or None when the key is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at, accessed_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            if expires_at is not None and expires_at < now:
+                self._connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            if now - accessed_at >= self.access_time_resolution:
+                self._connection.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+        return json.loads(value), expires_at
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at, now),
+            )
+            self._writes += 1
+            # Checking the size on every write is wasteful, every 100 writes is plenty
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._connection.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, now),
+        )
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM cache WHERE rowid IN ("
+                " SELECT rowid FROM cache WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                (self.namespace, count - self.max_entries),
+            )
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All entries that have not expired yet."""
+        return [(key, value) for key, value, _ in self.entries()]
+
+    def entries(self) -> List[Tuple[str, Any, Optional[float]]]:
+        """Like `items`, with the expiry time of every entry: (key, value, expires_at)."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value, expires_at FROM cache"
+                " WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (self.namespace, time.time()),
+            ).fetchall()
+        return [(key, json.loads(value), expires_at) for key, value, expires_at in rows]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        return count
+
+
+_MISSING = object()
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process LRU in front of an optional SQLite store.
+
+    Disk hits are promoted into memory so hot keys are answered without touching SQLite.
+    Hit and miss counters are kept per tier and are available through `stats()`.
+
+    Args:
+        namespace (str): Name of the cache, also used as the SQLite namespace.
+        ttl (float): Time-to-live in seconds for new entries (None means no expiry).
+        max_size (int): Maximum number of entries kept in memory.
+        path (str): SQLite file for the disk tier. An empty value disables the disk tier, and so does
+            a file that can't be opened (with a warning).
+        max_disk_entries (int): Maximum number of rows kept on disk for this namespace.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: Optional[float] = None,
+        max_size: int = 1024,
+        path: Optional[str] = None,
+        max_disk_entries: int = 50000,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.disk = None
+        if path:
+            try:
+                self.disk = SQLiteCache(path, namespace, max_entries=max_disk_entries, ttl=ttl)
+            except (OSError, sqlite3.Error) as e:
+                # An unwritable cache directory must not keep the action server from starting
+                logger.warning(f"Could not open the {namespace} cache at {path}, keeping it in memory only: {e}")
+        self._counter_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        key = str(key)
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("memory_hits")
+            return value
+
+        if self.disk is not None:
+            try:
+                entry = self.disk.get_entry(key)
+            except sqlite3.Error:
+                entry = None  # A broken disk tier should never break a conversation
+            if entry is not None:
+                value, expires_at = entry
+                self.memory.set(key, value, expires_at=expires_at)
+                self._count("disk_hits")
+                return value
+
+        self._count("misses")
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        key = str(key)
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl=ttl)
+            except sqlite3.Error:
+                pass
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All entries that have not expired, read from disk when there is a disk tier."""
+        return [(key, value) for key, value, _ in self.entries()]
+
+    def entries(self) -> List[Tuple[str, Any, Optional[float]]]:
+        """Like `items`, with the expiry time of every entry: (key, value, expires_at)."""
+        if self.disk is not None:
+            try:
+                return self.disk.entries()
+            except sqlite3.Error:
+                pass
+        return self.memory.entries()
+
+    def delete(self, key: str) -> None:
+        key = str(key)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+        }
+
+
+def cache_path_from_env(name: str, default: str) -> Optional[str]:
+    """Reads a cache file location from the environment. Set it to an empty string to disable the disk tier."""
+    path = os.environ.get(name, default)
+    return path or None
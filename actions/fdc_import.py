@@ -0,0 +1,107 @@
+"""
+Builds the local nutrient store from the FoodData Central bulk download.
+
+Download the Foundation, SR Legacy and/or FNDDS datasets (JSON or CSV) from
+https://fdc.nal.usda.gov/download-datasets and run for example:
+
+    python -m actions.fdc_import FoodData_Central_foundation_food_json.json FoodData_Central_sr_legacy_food_csv/
+
+Then start the action server with FDC_BACKEND=local (or local_first).
+"""
+import argparse
+import csv
+import json
+import os
+from typing import Any, Dict, Iterator, Tuple
+
+from actions.FDC_API import FDC_LOCAL_DB, parse_nutrient_record, standardize_nutrient_name
+from actions.fdc_local import create_store, finalize_store, write_records
+
+# Top-level keys of the JSON downloads
+JSON_DATASETS = {
+    "FoundationFoods": "Foundation",
+    "SRLegacyFoods": "SR Legacy",
+    "SurveyFoods": "Survey (FNDDS)",
+}
+
+# data_type values used in food.csv
+CSV_DATA_TYPES = {
+    "foundation_food": "Foundation",
+    "sr_legacy_food": "SR Legacy",
+    "survey_fndds_food": "Survey (FNDDS)",
+}
+
+
+def read_json_dataset(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yields (data_type, nutrient record) for every food in a JSON download."""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    if isinstance(data, list):
+        datasets = [(None, data)]
+    else:
+        datasets = [(JSON_DATASETS.get(key), foods) for key, foods in data.items() if isinstance(foods, list)]
+
+    for data_type, foods in datasets:
+        for food in foods:
+            yield food.get("dataType", data_type), parse_nutrient_record(food)
+
+
+def read_csv_dataset(directory: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yields (data_type, nutrient record) for every food in a CSV download directory."""
+    # nutrient.csv: which nutrient ids we score, under which name and unit
+    scored = {}
+    with open(os.path.join(directory, "nutrient.csv"), encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            name = standardize_nutrient_name(row["name"])
+            if name:
+                scored[row["id"]] = (name, row["unit_name"].lower())
+
+    # food.csv: descriptions of the foods in the datasets we support
+    foods = {}
+    with open(os.path.join(directory, "food.csv"), encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            data_type = CSV_DATA_TYPES.get(row["data_type"])
+            if data_type:
+                foods[row["fdc_id"]] = {
+                    "data_type": data_type,
+                    "record": {"fdc_id": int(row["fdc_id"]), "description": row["description"], "nutrients": {}},
+                }
+
+    # food_nutrient.csv is by far the largest file, stream it and keep only what we score
+    with open(os.path.join(directory, "food_nutrient.csv"), encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            food = foods.get(row["fdc_id"])
+            nutrient = scored.get(row["nutrient_id"])
+            if food is None or nutrient is None or not row["amount"]:
+                continue
+            name, unit = nutrient
+            food["record"]["nutrients"][name] = [float(row["amount"]), unit]
+
+    for food in foods.values():
+        yield food["data_type"], food["record"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the local FDC nutrient store from the bulk download.")
+    parser.add_argument("sources", nargs="+", help="JSON files or CSV directories from the FDC download page")
+    parser.add_argument("--out", default=FDC_LOCAL_DB, help=f"SQLite file to write (default: {FDC_LOCAL_DB})")
+    args = parser.parse_args()
+
+    connection = create_store(args.out)
+    total = 0
+    for source in args.sources:
+        reader = read_csv_dataset if os.path.isdir(source) else read_json_dataset
+        count = 0
+        for data_type, record in reader(source):
+            count += write_records(connection, [record], data_type)
+        connection.commit()
+        print(f"Imported {count} foods from {source}")
+        total += count
+
+    finalize_store(connection)
+    print(f"Wrote {total} foods to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
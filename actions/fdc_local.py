@@ -0,0 +1,157 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+# --- Local nutrient store ---
+# A compact SQLite copy of the FDC bulk download (see actions/fdc_import.py). It only keeps the
+# nutrients we score, plus a full-text index on the food descriptions for name lookups.
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS foods ("
+    " fdc_id INTEGER PRIMARY KEY,"
+    " description TEXT NOT NULL,"
+    " data_type TEXT)",
+    "CREATE TABLE IF NOT EXISTS food_nutrients ("
+    " fdc_id INTEGER NOT NULL,"
+    " name TEXT NOT NULL,"
+    " amount REAL NOT NULL,"
+    " unit TEXT NOT NULL,"
+    " PRIMARY KEY (fdc_id, name))",
+    # The porter tokenizer lets "cucumbers" match "Cucumber, with peel, raw"
+    "CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5("
+    " description, content='foods', content_rowid='fdc_id', tokenize='porter unicode61')",
+]
+
+# Preferred data types when several foods match equally well
+DATA_TYPE_RANK = {"Foundation": 0, "SR Legacy": 1, "Survey (FNDDS)": 2}
+
+
+class LocalNutrientStore:
+    """
+    Read access to a local nutrient database built by `python -m actions.fdc_import`.
+
+    Args:
+        path (str): Location of the SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        # Map the file into memory, lookups then never copy pages through read()
+        self._connection.execute("PRAGMA mmap_size = 268435456")
+        self._lock = threading.Lock()
+
+    def search(self, query: str) -> Optional[int]:
+        """Returns the fdcId of the best matching food, or None if nothing matches."""
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return None
+        # Quote every word so FTS5 syntax characters in user input are taken literally.
+        # Require all words first, then accept any of them ("a cucumber" still finds cucumbers).
+        quoted = [f'"{word}"' for word in words]
+        rows = []
+        for match in (" ".join(quoted), " OR ".join(quoted)):
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT foods.fdc_id, foods.data_type FROM foods_fts"
+                    " JOIN foods ON foods.fdc_id = foods_fts.rowid"
+                    " WHERE foods_fts MATCH ?"
+                    " ORDER BY bm25(foods_fts), length(foods.description)"
+                    " LIMIT 10",
+                    (match,),
+                ).fetchall()
+            if rows or len(quoted) == 1:
+                break
+        if not rows:
+            return None
+        # bm25 already sorted by relevance; break near-ties in favor of the most curated data type
+        best_rank = min(DATA_TYPE_RANK.get(data_type, 3) for _, data_type in rows[:3])
+        for fdc_id, data_type in rows[:3]:
+            if DATA_TYPE_RANK.get(data_type, 3) == best_rank:
+                return fdc_id
+        return rows[0][0]
+
+    def get_record(self, fdc_id: int) -> Optional[Dict[str, Any]]:
+        """Returns a nutrient record shaped like `FDC_API.parse_nutrient_record`, or None."""
+        with self._lock:
+            food = self._connection.execute(
+                "SELECT description FROM foods WHERE fdc_id = ?", (fdc_id,)
+            ).fetchone()
+            if food is None:
+                return None
+            rows = self._connection.execute(
+                "SELECT name, amount, unit FROM food_nutrients WHERE fdc_id = ? ORDER BY rowid", (fdc_id,)
+            ).fetchall()
+        return {
+            "fdc_id": fdc_id,
+            "description": food[0],
+            "nutrients": {name: [amount, unit] for name, amount, unit in rows},
+        }
+
+    def lookup(self, ingredient: str) -> Optional[Dict[str, Any]]:
+        """Searches an ingredient and returns its nutrient record, or None."""
+        fdc_id = self.search(ingredient)
+        return self.get_record(fdc_id) if fdc_id is not None else None
+
+
+def create_store(path: str) -> sqlite3.Connection:
+    """Creates (or opens) a nutrient database for writing and returns the connection."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def write_records(connection: sqlite3.Connection, records: Iterable[Dict[str, Any]], data_type: str) -> int:
+    """
+    Inserts parsed nutrient records into a nutrient database.
+
+    Args:
+        connection (sqlite3.Connection): A connection returned by `create_store`.
+        records (iterable): Records shaped like `FDC_API.parse_nutrient_record`.
+        data_type (str): The FDC data type of the records (e.g. "Foundation").
+
+    Returns:
+        int: The number of foods written.
+    """
+    count = 0
+    for record in records:
+        if record.get("fdc_id") is None or not record.get("description"):
+            continue
+        connection.execute(
+            "INSERT OR REPLACE INTO foods (fdc_id, description, data_type) VALUES (?, ?, ?)",
+            (record["fdc_id"], record["description"], data_type),
+        )
+        connection.execute("DELETE FROM food_nutrients WHERE fdc_id = ?", (record["fdc_id"],))
+        connection.executemany(
+            "INSERT INTO food_nutrients (fdc_id, name, amount, unit) VALUES (?, ?, ?, ?)",
+            [(record["fdc_id"], name, amount, unit) for name, (amount, unit) in record["nutrients"].items()],
+        )
+        count += 1
+    return count
+
+
+def finalize_store(connection: sqlite3.Connection) -> None:
+    """Rebuilds the full-text index and compacts the file after an import."""
+    connection.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+
+
+_stores: Dict[str, LocalNutrientStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_local_store(path: str) -> Optional[LocalNutrientStore]:
+    """Returns a shared store for `path`, or None when the file has not been built yet."""
+    with _stores_lock:
+        if path not in _stores:
+            if not os.path.exists(path):
+                return None
+            _stores[path] = LocalNutrientStore(path)
+        return _stores[path]
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- Shared HTTP clients ---
+# Every upstream API (FDC, Spoonacular) gets one long-lived requests.Session with its own
+# connection pool, so consecutive calls reuse TCP/TLS connections instead of handshaking again.
+# Settings are read per upstream, e.g. FDC_POOL_SIZE or SPOONACULAR_READ_TIMEOUT.
+DEFAULTS = {
+    "POOL_SIZE": 20,          # Connections kept alive per host
+    "CONNECT_TIMEOUT": 3.05,  # Seconds to establish a connection
+    "READ_TIMEOUT": 10,       # Seconds to wait for a response
+    "MAX_RETRIES": 2,         # Retries on connection errors and 5xx responses to GET requests
+    "BACKOFF": 0.3,           # Backoff factor between retries
+    "KEEP_ALIVE": "true",     # Keep idle connections open between requests
+}
+
+# Thread pool the async actions use to run the (blocking) API helpers off the event loop,
+# so one slow upstream call never stalls the other conversations.
+ACTION_IO_WORKERS = int(os.environ.get("ACTION_IO_WORKERS", 32))
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_io_executor = ThreadPoolExecutor(max_workers=ACTION_IO_WORKERS, thread_name_prefix="action-io")
+
+
+def _setting(upstream: str, name: str) -> str:
+    return os.environ.get(f"{upstream}_{name}", os.environ.get(f"HTTP_{name}", DEFAULTS[name]))
+
+
+class _TimeoutSession(requests.Session):
+    """A Session that applies a default timeout to every request that does not set one."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_session(upstream: str, retry_responses: bool = True) -> requests.Session:
+    """
+    Returns the shared, connection-pooled session for an upstream API.
+
+    Only GET requests are retried; POST requests may not be safe to repeat.
+
+    Args:
+        upstream (str): Name of the upstream, used as the prefix of its settings (e.g. "FDC").
+        retry_responses (bool): Also retry 5xx responses and read timeouts. False for APIs that
+            charge per request: the retry would cost quota that was never booked. Connection
+            failures, which never reached the API, are still retried.
+
+    Returns:
+        requests.Session: A session with pool size, retries, keep-alive and timeouts configured.
+    """
+    with _sessions_lock:
+        session = _sessions.get(upstream)
+        if session is not None:
+            return session
+
+        pool_size = int(_setting(upstream, "POOL_SIZE"))
+        max_retries = int(_setting(upstream, "MAX_RETRIES"))
+        retries = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries if retry_responses else 0,
+            status=max_retries if retry_responses else 0,
+            other=0,
+            backoff_factor=float(_setting(upstream, "BACKOFF")),
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,  # Let raise_for_status() report the final response
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+
+        session = _TimeoutSession(
+            timeout=(float(_setting(upstream, "CONNECT_TIMEOUT")), float(_setting(upstream, "READ_TIMEOUT")))
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if _setting(upstream, "KEEP_ALIVE").lower() != "true":
+            session.headers["Connection"] = "close"
+
+        _sessions[upstream] = session
+        return session
+
+
+async def run_blocking(function: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Runs a blocking function on the action I/O thread pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(function, *args, **kwargs))
@@ -0,0 +1,348 @@
+"""
+Answers cooking questions (substitutions, techniques, storage) from docs/knowledge_base.txt.
+
+The question/answer pairs are searched with BM25 in-process, so an answer needs no LLM call.
+The index is built from the knowledge base file when the action server starts, or ahead of
+time into KNOWLEDGE_INDEX_PATH, from where it is memory-mapped instead of rebuilt:
+
+    python -m actions.knowledge_base --build
+    python -m actions.knowledge_base "what can I use instead of eggs?"
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from actions.cache import cache_path_from_env
+from actions.name_index import singularize
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: without it only BM25 is used
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+# --- Cooking knowledge base ---
+KNOWLEDGE_BASE_PATH = os.environ.get("KNOWLEDGE_BASE_PATH", "docs/knowledge_base.txt")
+# Where the prebuilt index is kept; empty builds it in memory on every start
+KNOWLEDGE_INDEX_PATH = cache_path_from_env("KNOWLEDGE_INDEX_PATH", ".cache/knowledge_index")
+# Share (0-1) of the question's words, weighted by how rare they are, the best entry must contain
+KNOWLEDGE_MIN_CONFIDENCE = float(os.environ.get("KNOWLEDGE_MIN_CONFIDENCE", 0.6))
+# Optional sentence-transformers model (e.g. "all-MiniLM-L6-v2") for questions BM25 can't answer
+KNOWLEDGE_EMBEDDING_MODEL = os.environ.get("KNOWLEDGE_EMBEDDING_MODEL", "")
+KNOWLEDGE_MIN_SIMILARITY = float(os.environ.get("KNOWLEDGE_MIN_SIMILARITY", 0.6))
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+QUESTION_WEIGHT = 2  # Words in the question count twice as much as words in the answer
+CANDIDATES = 5  # Best-scoring entries checked for a confident answer, best first
+
+# Function words that say nothing about the topic of a question
+STOPWORDS = {
+    "a", "an", "the", "i", "my", "me", "we", "you", "it", "its", "is", "are", "was", "be", "do", "does",
+    "did", "can", "could", "should", "would", "what", "whats", "which", "how", "why", "when", "to", "of",
+    "in", "on", "for", "with", "and", "or", "if", "s", "t", "use", "make", "get", "there", "some", "any",
+    "please", "tell", "about", "that", "this", "so", "too", "way", "good", "best",
+}
+# Words that set the scene rather than name the topic ("... milk in a recipe", "... butter in baking").
+# They help the ranking, but an entry without them still answers the question.
+CONTEXT_WORDS = {
+    "recipe", "baking", "bake", "baked", "dish", "meal", "kitchen", "home", "homemade", "dinner", "lunch",
+}
+# Different ways of asking for a substitute map to one term
+SYNONYMS = {
+    "instead": "substitute", "replace": "substitute", "replacement": "substitute", "alternative": "substitute",
+    "swap": "substitute", "substitution": "substitute", "sub": "substitute",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words without stopwords, singular, with substitute synonyms merged."""
+    words = re.findall(r"[a-z]+", text.lower().replace("’", "'"))
+    tokens = []
+    for word in words:
+        if word in STOPWORDS:
+            continue
+        word = singularize(word)
+        tokens.append(SYNONYMS.get(word, word))
+    return tokens
+
+
+def parse_knowledge_base(text: str) -> List[Tuple[str, str]]:
+    """Reads "Q: ..." / "A: ..." pairs; answer lines without a prefix continue the previous answer."""
+    pairs = []
+    question = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("Q:"):
+            question = line[2:].strip()
+        elif line.startswith("A:") and question is not None:
+            pairs.append((question, line[2:].strip()))
+        elif line and pairs and question == pairs[-1][0]:
+            pairs[-1] = (question, f"{pairs[-1][1]} {line}")
+    return pairs
+
+
+class KnowledgeMatch(NamedTuple):
+    question: str
+    answer: str
+    score: float       # BM25 score (or cosine similarity for an embedding match)
+    confidence: float  # 0-1, compared against KNOWLEDGE_MIN_CONFIDENCE
+
+
+class KnowledgeIndex:
+    """
+    A BM25 index over question/answer pairs.
+
+    Postings are stored as flat arrays (CSR layout: one slice of document numbers and
+    precomputed BM25 weights per term), so a saved index is memory-mapped on load.
+
+    Args:
+        questions (List[str]): The questions, by document number.
+        answers (List[str]): The answers, by document number.
+        vocabulary (Dict[str, int]): Term -> term number.
+        arrays (Dict[str, np.ndarray]): "offsets", "docs", "weights", "idf" and optionally "embeddings".
+    """
+
+    ARRAYS = ("offsets", "docs", "weights", "idf", "embeddings")
+
+    def __init__(self, questions: List[str], answers: List[str], vocabulary: Dict[str, int],
+                 arrays: Dict[str, np.ndarray], embedding_model: Optional[str] = None):
+        self.questions = questions
+        self.answers = answers
+        self.vocabulary = vocabulary
+        self.offsets = arrays["offsets"]
+        self.docs = arrays["docs"]
+        self.weights = arrays["weights"]
+        self.idf = arrays["idf"]
+        self.embeddings = arrays.get("embeddings")
+        self.embedding_model = embedding_model
+        # Weight of a word the knowledge base doesn't contain: as rare as the rarest known word
+        self._unknown_weight = float(self.idf.max()) if len(self.idf) else 1.0
+        self._encoder = None
+
+    @classmethod
+    def build(cls, pairs: List[Tuple[str, str]], embedding_model: Optional[str] = None) -> "KnowledgeIndex":
+        questions = [question for question, _ in pairs]
+        answers = [answer for _, answer in pairs]
+        documents = [Counter(tokenize(question) * QUESTION_WEIGHT + tokenize(answer)) for question, answer in pairs]
+
+        vocabulary: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        for doc, counts in enumerate(documents):
+            for term, count in counts.items():
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+                    postings.append([])
+                postings[vocabulary[term]].append((doc, count))
+
+        lengths = np.array([sum(counts.values()) for counts in documents], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        n = len(documents)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        idf = np.zeros(len(vocabulary), dtype=np.float32)
+        docs, weights = [], []
+        for term_id, term_postings in enumerate(postings):
+            idf[term_id] = math.log(1 + (n - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc, count in term_postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / average_length)
+                docs.append(doc)
+                weights.append(idf[term_id] * count * (BM25_K1 + 1) / (count + norm))
+            offsets[term_id + 1] = len(docs)
+
+        arrays = {
+            "offsets": offsets,
+            "docs": np.array(docs, dtype=np.int32),
+            "weights": np.array(weights, dtype=np.float32),
+            "idf": idf,
+        }
+        index = cls(questions, answers, vocabulary, arrays, embedding_model)
+        if embedding_model and index._get_encoder() is not None:
+            texts = [f"{question} {answer}" for question, answer in pairs]
+            arrays["embeddings"] = index._get_encoder().encode(texts, normalize_embeddings=True).astype(np.float32)
+            index.embeddings = arrays["embeddings"]
+        return index
+
+    def save(self, path: str, source_hash: str) -> None:
+        """Writes the index as a directory of .npy files plus meta.json."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {"offsets": self.offsets, "docs": self.docs, "weights": self.weights, "idf": self.idf,
+                  "embeddings": self.embeddings}
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(os.path.join(path, f"{name}.npy"), array)
+        meta = {
+            "version": INDEX_VERSION,
+            "source_sha256": source_hash,
+            "embedding_model": self.embedding_model if self.embeddings is not None else None,
+            "vocabulary": self.vocabulary,
+            "questions": self.questions,
+            "answers": self.answers,
+        }
+        # meta.json last: an index without it is incomplete and gets rebuilt
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["KnowledgeIndex", dict]:
+        """Memory-maps a saved index. Returns the index and its meta data."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        arrays = {}
+        for name in cls.ARRAYS:
+            array_path = os.path.join(path, f"{name}.npy")
+            if os.path.exists(array_path):
+                arrays[name] = np.load(array_path, mmap_mode="r")
+        index = cls(meta["questions"], meta["answers"], meta["vocabulary"], arrays, meta.get("embedding_model"))
+        return index, meta
+
+    @property
+    def uses_embeddings(self) -> bool:
+        """Whether a search may encode the question with the embedding model (too slow for the event loop)."""
+        return self.embeddings is not None and bool(self.embedding_model) and SentenceTransformer is not None
+
+    def _get_encoder(self):
+        if self._encoder is None and self.embedding_model and SentenceTransformer is not None:
+            self._encoder = SentenceTransformer(self.embedding_model)
+        return self._encoder
+
+    def search(self, text: str, min_confidence: float = KNOWLEDGE_MIN_CONFIDENCE,
+               min_similarity: float = KNOWLEDGE_MIN_SIMILARITY) -> Optional[KnowledgeMatch]:
+        """
+        Finds the entry that answers a question.
+
+        Args:
+            text (str): The user's question.
+            min_confidence (float): Minimum share of the (idf-weighted) question words the entry
+                must contain. The entry must also contain every question word rarer than the
+                rarest one it matched. Missing CONTEXT_WORDS count for neither.
+            min_similarity (float): Minimum cosine similarity for an embedding match, used only
+                when BM25 finds nothing confident enough and embeddings are available.
+
+        Returns:
+            Optional[KnowledgeMatch]: The best entry, or None when nothing is confident enough.
+        """
+        terms = list(dict.fromkeys(tokenize(text)))
+        if terms and len(self.questions):
+            scores = np.zeros(len(self.questions), dtype=np.float32)
+            known = []
+            for term in terms:
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                    scores[self.docs[start:end]] += self.weights[start:end]
+                    known.append((term, term_id))
+            unknown = sum(1 for term in terms if term not in self.vocabulary and term not in CONTEXT_WORDS)
+            # The top entry may be vetoed ("eggs in baking" for "butter in baking"), so check a few
+            top = np.argpartition(-scores, CANDIDATES)[:CANDIDATES] if len(scores) > CANDIDATES else np.arange(len(scores))
+            for best in top[np.argsort(-scores[top], kind="stable")]:
+                best = int(best)
+                if scores[best] <= 0:
+                    break
+                # Which of the question's words the entry contains
+                matched, missed = [], []
+                for term, term_id in known:
+                    if best in self.docs[self.offsets[term_id]:self.offsets[term_id + 1]]:
+                        matched.append(float(self.idf[term_id]))
+                    elif term not in CONTEXT_WORDS:
+                        missed.append(float(self.idf[term_id]))
+                confidence = sum(matched) / (sum(matched) + sum(missed) + self._unknown_weight * unknown)
+                # The entry must contain the question's most specific words: missing a word that is
+                # rarer than one it matched means it is about something else ("butter in baking"
+                # is not answered by "eggs in baking")
+                specific = not missed or (matched and max(missed) <= min(matched))
+                if confidence >= min_confidence and specific:
+                    return KnowledgeMatch(self.questions[best], self.answers[best], float(scores[best]), confidence)
+
+        if self.embeddings is not None and self._get_encoder() is not None and text.strip():
+            query = self._get_encoder().encode([text], normalize_embeddings=True)[0]
+            similarities = np.asarray(self.embeddings) @ query
+            best = int(similarities.argmax())
+            if similarities[best] >= min_similarity:
+                return KnowledgeMatch(self.questions[best], self.answers[best], float(similarities[best]),
+                                      float(similarities[best]))
+        return None
+
+
+def load_knowledge_base(source: str = KNOWLEDGE_BASE_PATH, index_path: Optional[str] = KNOWLEDGE_INDEX_PATH,
+                        embedding_model: str = KNOWLEDGE_EMBEDDING_MODEL) -> KnowledgeIndex:
+    """
+    Loads the saved index when it was built from the current knowledge base, else builds (and saves) it.
+    A missing knowledge base gives an empty index that answers nothing.
+    """
+    try:
+        with open(source, "rb") as file:
+            data = file.read()
+    except OSError:
+        logger.warning(f"No knowledge base at {source}, cooking questions won't be answered")
+        return KnowledgeIndex.build([])
+    source_hash = hashlib.sha256(data).hexdigest()
+
+    if index_path and os.path.exists(os.path.join(index_path, "meta.json")):
+        try:
+            index, meta = KnowledgeIndex.load(index_path)
+            if (meta.get("version") == INDEX_VERSION and meta.get("source_sha256") == source_hash
+                    and (meta.get("embedding_model") or "") == (embedding_model if SentenceTransformer else "")):
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load the knowledge index at {index_path}: {e}")
+
+    start = time.perf_counter()
+    index = KnowledgeIndex.build(parse_knowledge_base(data.decode("utf-8")), embedding_model or None)
+    logger.info(f"Indexed {len(index.questions)} knowledge base entries in {time.perf_counter() - start:.3f}s")
+    if index_path:
+        try:
+            index.save(index_path, source_hash)
+        except OSError as e:
+            logger.warning(f"Could not save the knowledge index to {index_path}: {e}")
+    return index
+
+
+_knowledge_base: Optional[KnowledgeIndex] = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base() -> KnowledgeIndex:
+    """Returns the shared index, loading it on first use."""
+    global _knowledge_base
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = load_knowledge_base()
+        return _knowledge_base
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("question", nargs="*", help="Questions to look up")
+    parser.add_argument("--build", action="store_true", help=f"Rebuild the index in {KNOWLEDGE_INDEX_PATH}")
+    args = parser.parse_args()
+
+    if args.build and KNOWLEDGE_INDEX_PATH and os.path.exists(os.path.join(KNOWLEDGE_INDEX_PATH, "meta.json")):
+        os.remove(os.path.join(KNOWLEDGE_INDEX_PATH, "meta.json"))
+    index = load_knowledge_base()
+    print(f"{len(index.questions)} entries, {len(index.vocabulary)} terms"
+          f"{', embeddings: ' + index.embedding_model if index.embeddings is not None else ''}")
+    for question in args.question:
+        start = time.perf_counter()
+        match = index.search(question)
+        elapsed = (time.perf_counter() - start) * 1000
+        if match is None:
+            print(f"{question!r}: no confident answer ({elapsed:.3f} ms)")
+        else:
+            print(f"{question!r}: {match.answer} (matched {match.question!r}, "
+                  f"confidence {match.confidence:.2f}, {elapsed:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
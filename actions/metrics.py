@@ -0,0 +1,162 @@
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from actions.cache import TieredCache
+from actions.singleflight import get_singleflight_stats
+
+logger = logging.getLogger(__name__)
+
+# --- Action server metrics ---
+# Prometheus metrics of the custom actions and the upstream APIs behind them, served on their own
+# port next to the action server (5055). Set ACTION_METRICS_PORT to 0 to turn the endpoint off.
+ACTION_METRICS_PORT = int(os.environ.get("ACTION_METRICS_PORT", 5056))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+
+ACTION_SECONDS = Histogram("action_seconds", "Time to run a custom action", ["action"], buckets=LATENCY_BUCKETS)
+ACTION_ERRORS = Counter("action_errors_total", "Custom actions that raised an exception", ["action"])
+
+UPSTREAM_SECONDS = Histogram("upstream_request_seconds", "Latency of upstream API requests",
+                             ["upstream", "endpoint"], buckets=LATENCY_BUCKETS)
+UPSTREAM_RESPONSES = Counter("upstream_responses_total",
+                             "Upstream API responses by status code ('error' when no response came back)",
+                             ["upstream", "endpoint", "status"])
+
+# Spoonacular reports its quota on every response (X-API-Quota-Request/-Used/-Left)
+SPOONACULAR_QUOTA_POINTS = Counter("spoonacular_quota_points_total", "Quota points Spoonacular charged", ["endpoint"])
+SPOONACULAR_QUOTA_POINTS_SAVED = Counter("spoonacular_quota_points_saved_total",
+                                         "Quota points the recipe cache saved", ["endpoint"])
+SPOONACULAR_QUOTA_USED = Gauge("spoonacular_quota_used_points", "Quota points used today, as of the last response")
+SPOONACULAR_QUOTA_LEFT = Gauge("spoonacular_quota_left_points", "Quota points left today, as of the last response")
+
+QUOTA_WAIT_SECONDS = Histogram("spoonacular_quota_wait_seconds", "Time a request waited for the rate limit",
+                               ["priority"], buckets=LATENCY_BUCKETS)
+QUOTA_SHED = Counter("spoonacular_requests_shed_total",
+                     "Requests not sent because of the rate limit or the daily quota", ["priority", "reason"])
+
+RECIPE_LOCAL_SEARCHES = Counter("recipe_local_searches_total",
+                                "Recipe searches answered by the local corpus (hit) or not (miss)", ["result"])
+RECIPE_BUFFER_LOOKUPS = Counter("recipe_buffer_lookups_total",
+                                "'Another recipe' requests answered from the result buffer (hit) or not (miss)",
+                                ["result"])
+
+
+def timed_action(run: Callable) -> Callable:
+    """Decorates an action's async `run` to record its execution time and failures per action name."""
+
+    @functools.wraps(run)
+    async def wrapper(self, dispatcher, tracker, domain):
+        action = self.name()
+        start = time.perf_counter()
+        try:
+            return await run(self, dispatcher, tracker, domain)
+        except Exception:
+            ACTION_ERRORS.labels(action).inc()
+            raise
+        finally:
+            ACTION_SECONDS.labels(action).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def observe_upstream(upstream: str, endpoint: str, send: Callable[..., requests.Response],
+                     *args: Any, **kwargs: Any) -> requests.Response:
+    """
+    Sends an upstream request (e.g. `FDC_SESSION.get`) and records its latency and status code.
+
+    Args:
+        upstream (str): "fdc" or "spoonacular".
+        endpoint (str): A fixed name for the endpoint, e.g. "search" or "information".
+        send (Callable): The session method to call with `*args` and `**kwargs`.
+
+    Returns:
+        requests.Response: The response; exceptions of `send` are recorded and re-raised.
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = send(*args, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        UPSTREAM_SECONDS.labels(upstream, endpoint).observe(time.perf_counter() - start)
+        UPSTREAM_RESPONSES.labels(upstream, endpoint, status).inc()
+
+
+def record_spoonacular_quota(endpoint: str, response: requests.Response) -> None:
+    """Reads the quota headers of a Spoonacular response. Missing or malformed headers are ignored."""
+    headers = response.headers
+    try:
+        if "X-API-Quota-Request" in headers:
+            SPOONACULAR_QUOTA_POINTS.labels(endpoint).inc(float(headers["X-API-Quota-Request"]))
+        if "X-API-Quota-Used" in headers:
+            SPOONACULAR_QUOTA_USED.set(float(headers["X-API-Quota-Used"]))
+        if "X-API-Quota-Left" in headers:
+            SPOONACULAR_QUOTA_LEFT.set(float(headers["X-API-Quota-Left"]))
+    except ValueError:
+        pass
+
+
+class _StatsCollector:
+    """Exposes the counters the caches and coalescing groups already keep, read at scrape time."""
+
+    def __init__(self):
+        self.caches: List[TieredCache] = []
+
+    def collect(self):
+        lookups = CounterMetricFamily("cache_lookups", "Cache lookups by tier that answered them",
+                                      labels=["cache", "result"])
+        hit_ratio = GaugeMetricFamily("cache_hit_ratio", "Share of lookups answered by the cache", labels=["cache"])
+        entries = GaugeMetricFamily("cache_memory_entries", "Entries in the in-memory tier", labels=["cache"])
+        for cache in list(self.caches):
+            stats = cache.stats()
+            for result in ("memory_hits", "disk_hits", "misses"):
+                lookups.add_metric([cache.namespace, result], stats[result])
+            hit_ratio.add_metric([cache.namespace], stats["hit_ratio"])
+            entries.add_metric([cache.namespace], stats["memory_size"])
+
+        calls = CounterMetricFamily("singleflight_calls", "Requests that went upstream", labels=["group"])
+        saved = CounterMetricFamily("singleflight_requests_saved", "Requests answered by a concurrent identical one",
+                                    labels=["group"])
+        for group, stats in get_singleflight_stats()["groups"].items():
+            calls.add_metric([group], stats["calls"])
+            saved.add_metric([group], stats["requests_saved"])
+        return [lookups, hit_ratio, entries, calls, saved]
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def track_caches(*caches: TieredCache) -> None:
+    """Adds caches to the hit/miss metrics."""
+    _stats_collector.caches.extend(caches)
+
+
+_server_pid: Optional[int] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = ACTION_METRICS_PORT) -> None:
+    """Serves /metrics on `port` from a background thread, once per process. Port 0 disables it."""
+    global _server_pid
+    if not port:
+        return
+    with _server_lock:
+        if _server_pid == os.getpid():
+            return
+        try:
+            start_http_server(port)
+        except OSError as e:
+            logger.warning(f"Could not serve action metrics on port {port}: {e}")
+            return
+        _server_pid = os.getpid()
+        logger.info(f"Action metrics on http://localhost:{port}/metrics")
@@ -0,0 +1,211 @@
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+# Words that don't change which food is meant ("a cucumber", "some fresh basil")
+STOPWORDS = {"a", "an", "the", "some", "few", "of", "fresh", "piece", "pieces", "bunch", "handful"}
+
+# Plurals the suffix rules below would get wrong
+IRREGULAR_PLURALS = {
+    "leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife",
+    "olives": "olive", "chives": "chive", "cloves": "clove", "anchovies": "anchovy",
+}
+# Words that end in "s" but are not plural
+SINGULAR_S_WORDS = {
+    "asparagus", "hummus", "couscous", "molasses", "swiss", "citrus", "octopus",
+    "brussels", "grits", "oats",
+}
+
+
+def singularize(word: str) -> str:
+    """Cheap English plural stemming, good enough for ingredient names."""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in SINGULAR_S_WORDS or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"        # berries -> berry
+    if word.endswith("oes"):
+        return word[:-2]              # tomatoes -> tomato
+    if word.endswith(("sses", "ches", "shes", "xes", "zes")):
+        return word[:-2]              # radishes -> radish
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]              # cucumbers -> cucumber
+    return word
+
+
+def normalize_name(text: str) -> str:
+    """
+    Normalizes a free-text ingredient: lowercase, letters only, no quantities or articles, singular.
+    "2 Fresh Cucumbers" -> "cucumber".
+    """
+    words = re.findall(r"[a-z]+", text.lower())
+    return " ".join(singularize(word) for word in words if word not in STOPWORDS)
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance where swapping two adjacent letters counts as one edit."""
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+
+def is_typo_of(key: str, candidate: str) -> bool:
+    """
+    Whether `key` is a misspelling of `candidate`: the same words, each at most one edit off
+    (two for words longer than 8 letters). "cucumbr" is a typo of "cucumber"; "cheese" is not
+    one of "cream cheese", and "pea" is not one of "pear".
+    """
+    words, candidate_words = key.split(" "), candidate.split(" ")
+    if len(words) != len(candidate_words):
+        return False
+    for word, candidate_word in zip(words, candidate_words):
+        if word == candidate_word:
+            continue
+        if min(len(word), len(candidate_word)) <= 3:
+            return False
+        if edit_distance(word, candidate_word) > (2 if len(candidate_word) > 8 else 1):
+            return False
+    return True
+
+
+class NameMatch(NamedTuple):
+    fdc_id: int            # The FDC food the name was searched as
+    canonical: str         # The canonical ingredient name
+    score: float           # 1.0 for an exact alias, the trigram similarity otherwise
+
+
+class NameIndex:
+    """
+    Maps free-text ingredient names to canonical names and fdcIds without a network call.
+
+    Exact aliases are a dictionary lookup. Everything else is matched on character
+    trigrams (Dice similarity), and a candidate above the threshold is only accepted when
+    the text is a typo of it (same words, each within a small edit distance), so
+    "cheese" never becomes "cream cheese". Fuzzy matches are not remembered: only names
+    that an FDC search confirmed are added as aliases. Like the search cache they come from,
+    aliases expire, so a name is searched again once its search result is outdated.
+
+    Args:
+        threshold (float): Minimum trigram similarity (0-1) for a fuzzy match.
+    """
+
+    def __init__(self, threshold: float = 0.7):
+        self.threshold = threshold
+        self._aliases: Dict[str, Tuple[int, str, Optional[float]]] = {}  # key -> (fdc_id, canonical, expires_at)
+        self._trigram_index: Dict[str, Set[str]] = defaultdict(set)
+        self._trigram_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, fdc_id: int, canonical: Optional[str] = None, ttl: Optional[float] = None,
+            expires_at: Optional[float] = None) -> None:
+        """
+        Registers `name` (normalized) as an alias of `canonical` / `fdc_id`.
+
+        Args:
+            name (str): The ingredient name as searched.
+            fdc_id (int): The FDC food the search found.
+            canonical (str): The canonical name (default: the normalized name).
+            ttl (float): Seconds until the alias expires (None means never), unless `expires_at` is given.
+            expires_at (float): When the alias expires, e.g. that of the cached search result.
+        """
+        key = normalize_name(name)
+        if not key:
+            return
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        with self._lock:
+            self._aliases[key] = (fdc_id, canonical or key, expires_at)
+            trigrams = _trigrams(key)
+            self._trigram_counts[key] = len(trigrams)
+            for trigram in trigrams:
+                self._trigram_index[trigram].add(key)
+
+    def _remove(self, key: str) -> None:
+        """Drops an alias; the caller holds the lock."""
+        self._aliases.pop(key, None)
+        self._trigram_counts.pop(key, None)
+        for trigram in _trigrams(key):
+            keys = self._trigram_index.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigram_index[trigram]
+
+    def resolve(self, text: str) -> Optional[NameMatch]:
+        """Returns the best match for `text`, or None when nothing is similar enough."""
+        key = normalize_name(text)
+        if not key:
+            return None
+
+        now = time.time()
+        with self._lock:
+            known = self._aliases.get(key)
+            if known is not None:
+                if known[2] is None or known[2] >= now:
+                    return NameMatch(known[0], known[1], 1.0)
+                self._remove(key)
+
+            # Count shared trigrams with every alias that has at least one in common
+            trigrams = _trigrams(key)
+            shared = Counter()
+            for trigram in trigrams:
+                shared.update(self._trigram_index.get(trigram, ()))
+            if not shared:
+                return None
+
+            best_score, best_key, expired = 0.0, None, []
+            for candidate, count in shared.items():
+                score = 2 * count / (len(trigrams) + self._trigram_counts[candidate])
+                if score >= self.threshold and score > best_score and is_typo_of(key, candidate):
+                    expires_at = self._aliases[candidate][2]
+                    if expires_at is not None and expires_at < now:
+                        expired.append(candidate)
+                    else:
+                        best_score, best_key = score, candidate
+            for candidate in expired:
+                self._remove(candidate)
+            if best_key is None:
+                return None
+            fdc_id, canonical, _ = self._aliases[best_key]
+
+        return NameMatch(fdc_id, canonical, best_score)
+
+    def canonical_name(self, text: str) -> str:
+        """The canonical name of a known ingredient, or the normalized text for unknown ones."""
+        match = self.resolve(text)
+        return match.canonical if match else normalize_name(text)
+
+    def load(self, aliases: Iterable[Tuple[str, int, Optional[float]]]) -> None:
+        """Bulk-registers (name, fdcId, expires_at) entries, e.g. from the persistent search cache."""
+        for name, fdc_id, expires_at in aliases:
+            self.add(name, fdc_id, expires_at=expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._aliases.clear()
+            self._trigram_index.clear()
+            self._trigram_counts.clear()
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+
+INGREDIENT_MATCH_THRESHOLD = float(os.environ.get("INGREDIENT_MATCH_THRESHOLD", 0.7))
+
+# Shared by the FDC lookups and the recipe search
+INGREDIENT_INDEX = NameIndex(threshold=INGREDIENT_MATCH_THRESHOLD)
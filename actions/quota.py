@@ -0,0 +1,212 @@
+import contextlib
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from actions.metrics import QUOTA_SHED, QUOTA_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# --- Quota scheduler ---
+# Spoonacular bills every request in quota points and answers 402 once the day's points are gone.
+# A token bucket (requests per second) and a daily point budget, kept in SQLite so every action
+# server process draws from the same ones, hold requests back before they are sent. Interactive
+# requests wait a moment for their turn; background work (prefetching) only runs when there is
+# spare capacity and is dropped otherwise.
+
+# Share of the burst that background work leaves for interactive requests
+BACKGROUND_TOKEN_HEADROOM = 0.5
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS quota ("
+    " name TEXT PRIMARY KEY,"
+    " tokens REAL NOT NULL,"
+    " refilled_at REAL NOT NULL,"
+    " day TEXT NOT NULL,"
+    " used REAL NOT NULL,"
+    " learned_limit REAL)",
+]
+
+_background = contextvars.ContextVar("quota_background", default=False)
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised instead of sending a request the rate limit or daily quota does not allow.
+    The message is meant for the user.
+    """
+
+    def __init__(self, message: str, background: bool):
+        super().__init__(message)
+        self.background = background
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Runs the requests made inside the block as background work."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def is_background() -> bool:
+    return _background.get()
+
+
+def utc_day(timestamp: float) -> str:
+    """Spoonacular resets the quota at midnight UTC."""
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+class QuotaScheduler:
+    """
+    Admits upstream requests within a per-second rate and a per-day point budget.
+
+    Args:
+        name (str): Keeps several schedulers apart inside one file.
+        rate (float): Requests per second across all processes (0 means no rate limit).
+        burst (int): Requests that may be sent at once after a quiet period.
+        daily_limit (float): Points per day (0 means learn it from the quota headers).
+        path (str): SQLite file shared by the processes (None keeps the state in this process).
+        queue_timeout (float): Seconds an interactive request may wait for its turn.
+        background_reserve (float): Share of the daily budget background work leaves for users.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, daily_limit: float, path: Optional[str],
+                 queue_timeout: float, background_reserve: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.daily_limit = daily_limit
+        self.queue_timeout = queue_timeout
+        self.background_reserve = background_reserve
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None,
+                                           timeout=5)
+        if path:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR IGNORE INTO quota (name, tokens, refilled_at, day, used) VALUES (?, ?, ?, ?, 0)",
+            (name, self.burst, now, utc_day(now)),
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Yields the row as a dict and writes it back; BEGIN IMMEDIATE serializes the processes."""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, refilled_at, day, used, learned_limit = connection.execute(
+                    "SELECT tokens, refilled_at, day, used, learned_limit FROM quota WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                state = {"tokens": tokens, "refilled_at": refilled_at, "used": used, "learned_limit": learned_limit}
+                if day != utc_day(now):
+                    state["used"] = 0.0
+                if self.rate > 0:
+                    state["tokens"] = min(self.burst, tokens + max(0.0, now - refilled_at) * self.rate)
+                state["refilled_at"] = now
+                yield state
+                connection.execute(
+                    "UPDATE quota SET tokens = ?, refilled_at = ?, day = ?, used = ?, learned_limit = ? WHERE name = ?",
+                    (state["tokens"], now, utc_day(now), state["used"], state["learned_limit"], self.name),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _limit(self, state: Dict[str, Any]) -> Optional[float]:
+        return self.daily_limit or state["learned_limit"]
+
+    def _try_acquire(self, points: float, background: bool) -> float:
+        """Takes a request token and books `points`. Returns 0, or the seconds to wait before trying again."""
+        with self._transaction() as state:
+            limit = self._limit(state)
+            if limit:
+                budget = limit * (1 - self.background_reserve) if background else limit
+                if state["used"] + points > budget:
+                    raise QuotaExceeded("I've used up today's recipe lookups. Please try again tomorrow.",
+                                        background)
+            if self.rate > 0:
+                needed = 1 + (self.burst * BACKGROUND_TOKEN_HEADROOM if background else 0)
+                if state["tokens"] < needed:
+                    return (needed - state["tokens"]) / self.rate
+                state["tokens"] -= 1
+            state["used"] += points
+            return 0.0
+
+    def acquire(self, points: float = 1.0) -> None:
+        """
+        Waits until a request may be sent and books its points against today's budget.
+
+        Args:
+            points (float): The (estimated) quota points of the request.
+
+        Raises:
+            QuotaExceeded: The daily budget is spent, the wait would exceed `queue_timeout`, or this
+                is background work and there is no spare capacity.
+        """
+        background = is_background()
+        priority = "background" if background else "interactive"
+        start = time.monotonic()
+        deadline = start + (0 if background else self.queue_timeout)
+        while True:
+            try:
+                wait = self._try_acquire(points, background)
+            except QuotaExceeded:
+                QUOTA_SHED.labels(priority, "daily").inc()
+                raise
+            if not wait:
+                QUOTA_WAIT_SECONDS.labels(priority).observe(time.monotonic() - start)
+                return
+            if time.monotonic() + wait > deadline:
+                QUOTA_SHED.labels(priority, "rate").inc()
+                raise QuotaExceeded("I'm getting a lot of recipe requests right now. Please try again in a moment.",
+                                    background)
+            time.sleep(wait)
+
+    def record(self, response: requests.Response) -> None:
+        """
+        Corrects the booked points with Spoonacular's own count (X-API-Quota-Used/-Left) and
+        stops all requests for the day after a 402.
+        """
+        try:
+            used = float(response.headers["X-API-Quota-Used"]) if "X-API-Quota-Used" in response.headers else None
+            left = float(response.headers["X-API-Quota-Left"]) if "X-API-Quota-Left" in response.headers else None
+        except ValueError:
+            used = left = None
+        if used is None and response.status_code != 402:
+            return
+
+        with self._transaction() as state:
+            if used is not None:
+                state["used"] = used
+                if left is not None:
+                    state["learned_limit"] = used + max(0.0, left)
+            if response.status_code == 402:
+                logger.warning("Spoonacular quota exhausted, holding back requests until midnight UTC")
+                state["learned_limit"] = min(state["learned_limit"] or state["used"], state["used"])
+                if self.daily_limit:
+                    state["used"] = max(state["used"], self.daily_limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._transaction() as state:
+            limit = self._limit(state)
+            return {
+                "tokens": round(state["tokens"], 2) if self.rate > 0 else None,
+                "used": round(state["used"], 2),
+                "limit": limit,
+                "left": round(max(0.0, limit - state["used"]), 2) if limit else None,
+            }
@@ -0,0 +1,70 @@
+"""
+Builds the local recipe corpus from Spoonacular payloads.
+
+Sources are JSON files with /information payloads (a list of recipes, a complexSearch or
+/recipes/random response, or a single recipe) and, with --from-cache, every recipe the action
+server already fetched into its recipe cache:
+
+    python -m actions.recipe_import recipes.json --from-cache
+
+Then start the action server with RECIPE_BACKEND=local_first (or local).
+Check Spoonacular's terms before keeping their data longer than their caching limits allow.
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict, Iterator
+
+from actions.cache import SQLiteCache
+from actions.Spoonacular_API import RECIPE_LOCAL_DB, SPOONACULAR_CACHE_PATH
+from actions.recipe_local import create_corpus, finalize_corpus, write_recipes
+
+
+def read_json_recipes(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the recipe payloads of a JSON file."""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    if isinstance(data, dict):
+        data = data.get("results", data.get("recipes", [data]))
+    for recipe in data:
+        if isinstance(recipe, dict):
+            yield recipe
+
+
+def read_cached_recipes(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the /information payloads that have not expired in the recipe cache."""
+    if not os.path.exists(path):
+        return
+    for _, recipe in SQLiteCache(path, "spoonacular_information").items():
+        yield recipe
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the local recipe corpus from Spoonacular payloads.")
+    parser.add_argument("sources", nargs="*", help="JSON files with recipe payloads")
+    parser.add_argument("--from-cache", action="store_true",
+                        help=f"Also import the recipe cache ({SPOONACULAR_CACHE_PATH or 'not configured'})")
+    parser.add_argument("--out", default=RECIPE_LOCAL_DB, help=f"SQLite file to write (default: {RECIPE_LOCAL_DB})")
+    args = parser.parse_args()
+    if not args.sources and not args.from_cache:
+        parser.error("give at least one JSON file or --from-cache")
+
+    sources = [(source, read_json_recipes(source)) for source in args.sources]
+    if args.from_cache and SPOONACULAR_CACHE_PATH:
+        sources.append((SPOONACULAR_CACHE_PATH, read_cached_recipes(SPOONACULAR_CACHE_PATH)))
+
+    connection = create_corpus(args.out)
+    total = 0
+    for source, recipes in sources:
+        count = write_recipes(connection, recipes)
+        connection.commit()
+        print(f"Imported {count} recipes from {source}")
+        total += count
+
+    finalize_corpus(connection)
+    print(f"Wrote {total} recipes to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
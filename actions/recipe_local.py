@@ -0,0 +1,268 @@
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from functools import reduce
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from actions.name_index import normalize_name
+
+# --- Local recipe corpus ---
+# Recipes imported from earlier Spoonacular responses or a dataset (see actions/recipe_import.py).
+# The /information payloads stay in SQLite; the search index (ingredient and title-word postings,
+# diet/cuisine/dish type facets) is built in memory when the corpus is first used.
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS recipes ("
+    " id INTEGER PRIMARY KEY,"
+    " title TEXT NOT NULL,"
+    " payload TEXT NOT NULL)",
+]
+
+# Words in a wish that say nothing about the recipe ("I want something vegan" -> "vegan")
+WISH_STOPWORDS = {
+    "i", "me", "my", "we", "want", "would", "like", "love", "please", "can", "you", "give", "make", "cook",
+    "something", "anything", "recipe", "dish", "meal", "food", "with", "and", "or", "for", "to", "in",
+    "that", "is", "it", "today", "tonight", "dinner", "lunch",
+}
+
+# Boolean fields of the /information payload and the facet they stand for
+FLAG_FACETS = {"vegetarian": "vegetarian", "vegan": "vegan", "glutenFree": "gluten free", "dairyFree": "dairy free"}
+
+# Wishes that rank the recipes on a field of the payload: (field, +1 = higher first, -1 = lower first)
+WISH_RANKINGS = {
+    "healthy": ("healthScore", 1), "healthier": ("healthScore", 1), "light": ("healthScore", 1),
+    "low salt": ("sodium", -1), "low sodium": ("sodium", -1), "less salt": ("sodium", -1),
+    "quick": ("readyInMinutes", -1), "fast": ("readyInMinutes", -1), "easy": ("readyInMinutes", -1),
+}
+RANKING_FIELDS = ("healthScore", "sodium", "readyInMinutes")
+
+
+def recipe_ingredients(recipe: Dict[str, Any]) -> List[str]:
+    """Normalized ingredient names of a recipe payload (/information, or complexSearch with fillIngredients)."""
+    names = []
+    for field in ("extendedIngredients", "usedIngredients", "missedIngredients"):
+        for ingredient in recipe.get(field) or []:
+            name = normalize_name(ingredient.get("nameClean") or ingredient.get("name") or "")
+            if name:
+                names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def recipe_field(recipe: Dict[str, Any], field: str) -> float:
+    """A numeric field of a recipe payload; "sodium" is read from its nutrition. NaN when missing."""
+    if field == "sodium":
+        nutrients = (recipe.get("nutrition") or {}).get("nutrients") or []
+        value = next((nutrient.get("amount") for nutrient in nutrients if nutrient.get("name") == "Sodium"), None)
+    else:
+        value = recipe.get(field)
+    return float(value) if isinstance(value, (int, float)) else math.nan
+
+
+def recipe_facets(recipe: Dict[str, Any]) -> Set[str]:
+    """Diets, cuisines and dish types of a recipe, normalized like wish text ("Gluten-Free" -> "gluten free")."""
+    facets = set()
+    for field in ("diets", "cuisines", "dishTypes"):
+        for value in recipe.get(field) or []:
+            facets.add(" ".join(re.findall(r"[a-z]+", value.lower())))
+    facets.update(facet for flag, facet in FLAG_FACETS.items() if recipe.get(flag))
+    facets.discard("")
+    return facets
+
+
+class LocalRecipeCorpus:
+    """
+    Searches a local recipe corpus built by `python -m actions.recipe_import`.
+
+    Every index term maps to the sorted document numbers of the recipes that contain it, so a
+    search is a handful of NumPy operations over the postings of the requested ingredients.
+
+    Args:
+        path (str): Location of the SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        ids, dish_typed = [], []
+        fields = {field: [] for field in RANKING_FIELDS}
+        ingredient_postings = defaultdict(list)  # Full ingredient names and their single words
+        title_postings = defaultdict(list)
+        facet_postings = defaultdict(list)
+        with self._lock:
+            rows = self._connection.execute("SELECT id, payload FROM recipes ORDER BY id").fetchall()
+        for doc, (recipe_id, payload) in enumerate(rows):
+            recipe = json.loads(payload)
+            ids.append(recipe_id)
+            dish_typed.append(bool(recipe.get("dishTypes")))
+            for field, values in fields.items():
+                values.append(recipe_field(recipe, field))
+            terms = set()
+            for name in recipe_ingredients(recipe):
+                terms.add(name)
+                terms.update(name.split())
+            for term in terms:
+                ingredient_postings[term].append(doc)
+            for word in set(normalize_name(recipe.get("title", "")).split()):
+                title_postings[word].append(doc)
+            for facet in recipe_facets(recipe):
+                facet_postings[facet].append(doc)
+
+        def as_arrays(postings):
+            return {term: np.array(docs, dtype=np.int32) for term, docs in postings.items()}
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.ingredient_postings = as_arrays(ingredient_postings)
+        self.title_postings = as_arrays(title_postings)
+        self.facet_postings = as_arrays(facet_postings)
+        self.fields = {field: np.array(values, dtype=np.float64) for field, values in fields.items()}
+        self._untyped = ~np.array(dish_typed, dtype=bool)
+        # Longest facets first, so "gluten free" is matched before "free" could be
+        self._facets = sorted(self.facet_postings, key=len, reverse=True)
+
+    def _mask(self, docs: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[docs] = True
+        return mask
+
+    def _ingredient_docs(self, ingredient: str) -> Optional[np.ndarray]:
+        """Recipes that contain an ingredient: an exact name, else every word of it ("chicken breast")."""
+        if ingredient in self.ingredient_postings:
+            return self.ingredient_postings[ingredient]
+        postings = [self.ingredient_postings.get(word) for word in ingredient.split()]
+        if not postings or any(docs is None for docs in postings):
+            return None
+        return reduce(np.intersect1d, postings)
+
+    def search(self, ingredients: List[str], query_wish: Optional[str] = None, dish_type: Optional[str] = None,
+               min_match: float = 1.0, limit: int = 10) -> List[int]:
+        """
+        Finds recipes for the requested ingredients and wish.
+
+        Args:
+            ingredients (List[str]): Ingredients the recipe should use.
+            query_wish (str): Free text; diets, cuisines and dish types in it ("vegan", "italian")
+                filter the recipes, "healthy", "low salt" and "quick" rank them on health score,
+                sodium and preparation time, and its other words keep the recipes with them in the
+                title, when there are any.
+            dish_type (str): Only recipes of this dish type (recipes without dish types are kept).
+            min_match (float): Share of the ingredients a recipe must contain (1.0 = all of them).
+            limit (int): Maximum number of recipe IDs to return.
+
+        Returns:
+            List[int]: Recipe IDs, most ingredients in common first, then most wish words in the
+            title, then by the wished ranking. Empty when nothing matches.
+        """
+        if not len(self.ids):
+            return []
+
+        allowed = np.ones(len(self.ids), dtype=bool)
+        if dish_type:
+            docs = self.facet_postings.get(normalize_name(dish_type))
+            allowed &= self._untyped | (self._mask(docs) if docs is not None else False)
+
+        wish = " ".join(re.findall(r"[a-z]+", (query_wish or "").lower()))
+        for facet in self._facets:
+            if re.search(rf"\b{facet}\b", wish):
+                allowed &= self._mask(self.facet_postings[facet])
+                wish = re.sub(rf"\b{facet}\b", " ", wish)
+        rankings = []
+        for phrase, ranking in WISH_RANKINGS.items():
+            if re.search(rf"\b{phrase}\b", wish):
+                rankings.append(ranking)
+                wish = re.sub(rf"\b{phrase}\b", " ", wish)
+        # Other words are looked up in the titles; they only filter when some recipe has them in its title
+        title_hits = np.zeros(len(self.ids), dtype=np.int32)
+        for word in set(normalize_name(wish).split()) - WISH_STOPWORDS:
+            docs = self.title_postings.get(word)
+            if docs is not None:
+                title_hits[docs] += 1
+
+        wanted = list(dict.fromkeys(name for name in map(normalize_name, ingredients) if name))
+        overlap = np.zeros(len(self.ids), dtype=np.int32)
+        for ingredient in wanted:
+            docs = self._ingredient_docs(ingredient)
+            if docs is not None:
+                overlap[docs] += 1
+        if wanted:
+            allowed &= overlap >= max(1, math.ceil(len(wanted) * min_match))
+        candidates = np.flatnonzero(allowed)
+        if title_hits[candidates].any():
+            candidates = candidates[title_hits[candidates] > 0]
+        if not wanted and not rankings and not title_hits.any():
+            return [int(self.ids[doc]) for doc in random.sample(list(candidates), min(limit, len(candidates)))]
+
+        # np.lexsort sorts on the last key first; recipes without the ranked field go last
+        keys = []
+        for field, direction in reversed(rankings):
+            values = -direction * self.fields[field][candidates]
+            keys.append(np.where(np.isnan(values), np.inf, values))
+        keys += [-title_hits[candidates], -overlap[candidates]]
+        ranked = candidates[np.lexsort(keys)][:limit]
+        return [int(self.ids[doc]) for doc in ranked]
+
+    def get(self, recipe_id: int) -> Optional[Dict[str, Any]]:
+        """Returns the stored /information payload of a recipe, or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT payload FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def create_corpus(path: str) -> sqlite3.Connection:
+    """Creates (or opens) a recipe corpus for writing and returns the connection."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def write_recipes(connection: sqlite3.Connection, recipes: Iterable[Dict[str, Any]]) -> int:
+    """
+    Inserts recipe payloads into a recipe corpus; a recipe that is already there is replaced.
+
+    Returns:
+        int: The number of recipes written (payloads without ID or title are skipped).
+    """
+    count = 0
+    for recipe in recipes:
+        if recipe.get("id") is None or not recipe.get("title"):
+            continue
+        connection.execute(
+            "INSERT OR REPLACE INTO recipes (id, title, payload) VALUES (?, ?, ?)",
+            (recipe["id"], recipe["title"], json.dumps(recipe)),
+        )
+        count += 1
+    return count
+
+
+def finalize_corpus(connection: sqlite3.Connection) -> None:
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+
+
+_corpora: Dict[str, LocalRecipeCorpus] = {}
+_corpora_lock = threading.Lock()
+
+
+def get_local_corpus(path: str) -> Optional[LocalRecipeCorpus]:
+    """Returns a shared corpus for `path`, or None when the file has not been built yet."""
+    with _corpora_lock:
+        if path not in _corpora:
+            if not os.path.exists(path):
+                return None
+            _corpora[path] = LocalRecipeCorpus(path)
+        return _corpora[path]
@@ -0,0 +1,131 @@
+import threading
+from collections import deque
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from actions.cache import LRUCache
+
+
+class SearchResults:
+    """
+    The hits of one conversation's last recipe search that were not shown yet.
+
+    Args:
+        search_key (Hashable): Identifies the search (normalized ingredients and wish).
+        search_url (str): The search endpoint, to fetch the next page.
+        search_params (dict): The search parameters without the API key.
+        hits (list): The unseen hits, best first.
+        shown_ids (list): IDs of the recipes already shown.
+        next_offset (int): Offset of the next page of search results.
+        total_results (int): Hits the search has in total (None when unknown).
+    """
+
+    def __init__(self, search_key: Hashable, search_url: str, search_params: Dict[str, Any], hits: List[dict],
+                 shown_ids: List[int], next_offset: int, total_results: Optional[int]):
+        self.search_key = search_key
+        self.search_url = search_url
+        self.search_params = search_params
+        self.hits = deque(hits)
+        self.seen_ids = set(shown_ids) | {hit.get('id') for hit in hits}
+        self.next_offset = next_offset
+        self.total_results = total_results
+        self.refilling = False
+        self.lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        """No more pages to fetch."""
+        return self.total_results is not None and self.next_offset >= self.total_results
+
+
+class RecipeResultBuffer:
+    """
+    Per conversation, the unseen hits of the last recipe search, so "show me another recipe" is
+    answered without a new search. Bounded in conversations (least recently used first out) and
+    in hits per conversation, and every buffer expires.
+
+    Args:
+        max_conversations (int): Conversations kept.
+        ttl (float): Seconds a buffer stays valid after the search.
+        max_hits (int): Unseen hits kept per conversation.
+    """
+
+    def __init__(self, max_conversations: int = 1000, ttl: float = 1800, max_hits: int = 20):
+        self.max_hits = max_hits
+        self._buffers = LRUCache(max_size=max_conversations, ttl=ttl)
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "refills": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def put(self, sender_id: str, results: SearchResults) -> None:
+        """Replaces the conversation's buffer with the results of a new search."""
+        while len(results.hits) > self.max_hits:
+            results.hits.pop()
+        self._buffers.set(sender_id, results)
+
+    def get(self, sender_id: str, search_key: Hashable) -> Optional[SearchResults]:
+        """The conversation's buffer, when it has not expired and belongs to the same search."""
+        results = self._buffers.get(sender_id)
+        if results is None or results.search_key != search_key:
+            return None
+        return results
+
+    def pop(self, sender_id: str, search_key: Hashable) -> Tuple[Optional[dict], Optional[SearchResults]]:
+        """
+        Takes the next unseen hit of the conversation's search.
+
+        Returns:
+            A tuple containing:
+            - dict: The hit, or None when there is none left (or no buffer).
+            - SearchResults: The buffer, or None when there is no valid buffer for this search.
+        """
+        results = self.get(sender_id, search_key)
+        hit = None
+        if results is not None:
+            with results.lock:
+                if results.hits:
+                    hit = results.hits.popleft()
+        self._count("hits" if hit is not None else "misses")
+        return hit, results
+
+    def start_refill(self, results: SearchResults, low_water: int) -> Optional[int]:
+        """
+        Claims the refill of a buffer that has `low_water` hits or fewer left.
+
+        Returns:
+            int: The offset of the page to fetch, or None when no refill is needed or one is running.
+        """
+        with results.lock:
+            if results.refilling or results.exhausted or len(results.hits) > low_water:
+                return None
+            results.refilling = True
+            offset = results.next_offset
+        self._count("refills")
+        return offset
+
+    def finish_refill(self, results: SearchResults, hits: List[dict], next_offset: int,
+                      total_results: Optional[int]) -> None:
+        """Appends a fetched page, skipping recipes that were already shown or buffered."""
+        with results.lock:
+            for hit in hits:
+                if hit.get('id') not in results.seen_ids and len(results.hits) < self.max_hits:
+                    results.hits.append(hit)
+                    results.seen_ids.add(hit.get('id'))
+            results.next_offset = next_offset
+            if total_results is not None:
+                results.total_results = total_results
+            results.refilling = False
+
+    def cancel_refill(self, results: SearchResults) -> None:
+        with results.lock:
+            results.refilling = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        lookups = counts["hits"] + counts["misses"]
+        counts["conversations"] = len(self._buffers)
+        counts["hit_ratio"] = counts["hits"] / lookups if lookups else 0.0
+        return counts
@@ -0,0 +1,88 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+# --- Request coalescing ---
+# When several conversations ask for the same thing at the same moment (a trending ingredient,
+# the same recipe), only the first caller goes upstream; the others wait for its result.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call between concurrent callers that ask for the same key.
+
+    Unlike a cache nothing is kept once the call returns: callers that arrive later start a
+    new call. Exceptions are raised in every caller that shared the call.
+
+    Args:
+        name (str): Name of the group in `get_singleflight_stats`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0   # Calls that went upstream
+        self.shared = 0  # Calls that were answered by another caller's request
+
+    def do(self, key: Hashable, function: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Runs `function(*args, **kwargs)`, unless a call for `key` is already running, then waits for that one."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "requests_saved": self.shared, "in_flight": len(self._calls)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_flight_group(name: str) -> SingleFlight:
+    """Returns the shared coalescing group `name` (e.g. "fdc_search"), creating it on first use."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def get_singleflight_stats() -> Dict[str, Any]:
+    """Calls made and requests saved per coalescing group."""
+    with _groups_lock:
+        groups = dict(_groups)
+    stats = {name: group.stats() for name, group in groups.items()}
+    return {
+        "groups": stats,
+        "requests_saved_total": sum(group["requests_saved"] for group in stats.values()),
+    }
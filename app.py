@@ -2,9 +2,16 @@ import json
 import os
 import requests
 import logging
-from flask import Flask, send_from_directory, request, jsonify
+import time
+from flask import Flask, Response, g, send_file, request, jsonify
 from flask_cors import CORS
 from requests.exceptions import RequestException, Timeout, ConnectionError
+from rasa_client import get_pool_stats, get_rasa_session, rasa_timeout
+from conversation import SENDER_ID_KEY, carry_over_slots, keep_conversation, prepare_turn, rasa_base_url
+from rasa_health import (RASA_BREAKER_FAILURES, RASA_BREAKER_RESET, CircuitBreaker, HealthStatus,
+                         start_health_prober)
+from gateway_metrics import RASA_ERRORS, RASA_ROUND_TRIP_SECONDS, metrics_payload, observe_request
+from static_assets import AssetIndex
 
 # Setup logging
 logging.basicConfig(level=logging.INFO,
@@ -19,27 +26,79 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 # Default Rasa server URL
 DEFAULT_RASA_URL = 'http://localhost:5005/webhooks/rest/webhook'
 
+# Per-worker view of Rasa's health (see rasa_health.py)
+RASA_BREAKER = CircuitBreaker(RASA_BREAKER_FAILURES, RASA_BREAKER_RESET)
+RASA_HEALTH = HealthStatus(RASA_BREAKER)
+
+# Frontend files, indexed once (see static_assets.py and build_assets.py)
+STATIC_ASSETS = AssetIndex.load()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Label by route pattern, so every frontend file doesn't get its own time series
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(endpoint, request.method, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus scrape endpoint (see gateway_metrics.py)
+    body, content_type = metrics_payload()
+    return Response(body, content_type=content_type)
+
+
 # Serve frontend files
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_static(path):
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, 'index.html')
-
-@app.route('/api/check_rasa', methods=['GET'])
-def check_rasa():
-    rasa_url = os.environ.get('RASA_URL', 'http://localhost:5005')
+    asset = STATIC_ASSETS.resolve(path)
+    file_path, etag, encoding = asset.variant(request.headers.get('Accept-Encoding', ''))
+    # send_file answers If-None-Match with a 304 and hands the file to gunicorn's sendfile
+    response = send_file(file_path, mimetype=asset.content_type, etag=etag)
+    response.headers['Content-Type'] = asset.content_type
+    response.headers['Cache-Control'] = asset.cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def probe_rasa():
+    """Checks Rasa's /version endpoint and returns (available, /api/check_rasa body)."""
+    # RASA_URL may be the server or the webhook URL, /version lives on the server
+    rasa_url = rasa_base_url(os.environ.get('RASA_URL', DEFAULT_RASA_URL))
     try:
         # Try to connect to the server's health endpoint
-        response = requests.get(f"{rasa_url}/version", timeout=3)
+        response = get_rasa_session().get(f"{rasa_url}/version", timeout=rasa_timeout(3))
         if response.ok:
-            return jsonify({"status": "available", "version": response.json()})
+            return True, {"status": "available", "version": response.json()}
         else:
-            return jsonify({"status": "unavailable", "reason": "API responded with error"}), 503
-    except RequestException as e:
+            return False, {"status": "unavailable", "reason": "API responded with error"}
+    except (RequestException, ValueError) as e:
         logger.error(f"Failed to connect to Rasa server: {str(e)}")
-        return jsonify({"status": "unavailable", "reason": str(e)}), 503
+        return False, {"status": "unavailable", "reason": str(e)}
+
+
+@app.route('/api/check_rasa', methods=['GET'])
+def check_rasa():
+    # Answered from the background prober; only the very first call checks Rasa itself
+    start_health_prober(probe_rasa, RASA_HEALTH)
+    result = RASA_HEALTH.get()
+    if result is None:
+        RASA_HEALTH.update(*probe_rasa())
+        result = RASA_HEALTH.get()
+    status, body = result
+    return jsonify({**body, "circuit": RASA_BREAKER.state}), status
+
+@app.route('/api/rasa_pool', methods=['GET'])
+def rasa_pool():
+    # Connection pool utilization of this worker's Rasa client
+    return jsonify(get_pool_stats())
 
 
 # Handle Rasa messages
@@ -50,25 +109,65 @@ def send_message():
     context = data.get('context', {})
 
     rasa_url = os.environ.get('RASA_URL', DEFAULT_RASA_URL)
-    payload = {
-        "sender": "user",
-        "message": message,
-        "metadata": context
-    }
+    # Each browser session is its own Rasa conversation
+    context, sender_id, previous_sender_id = prepare_turn(context)
+    rotated_context = context
+    if previous_sender_id:
+        # The chat stays in the previous conversation until its slots have been copied
+        context = keep_conversation(context, previous_sender_id)
+
+    # Rasa has been failing: answer right away instead of waiting for another timeout
+    start_health_prober(probe_rasa, RASA_HEALTH)
+    if not RASA_BREAKER.allow():
+        RASA_ERRORS.labels('circuit_open').inc()
+        return rasa_error_response("Error communicating with Rasa server: circuit breaker is open", context)
 
     try:
-        response = requests.post(rasa_url, json=payload, timeout=30)
+        if previous_sender_id and carry_over_slots(get_rasa_session(), rasa_url, previous_sender_id, sender_id,
+                                                   timeout=rasa_timeout(5)):
+            context = rotated_context
+        payload = {
+            "sender": context[SENDER_ID_KEY],
+            "message": message,
+            "metadata": context
+        }
+        start = time.perf_counter()
+        response = get_rasa_session().post(rasa_url, json=payload, timeout=rasa_timeout())
+        RASA_ROUND_TRIP_SECONDS.labels('rest').observe(time.perf_counter() - start)
         response.raise_for_status()
+        RASA_BREAKER.record_success()
         data = response.json()
         return jsonify(process_rasa_response(data, context))
     except RequestException as e:
+        # Only count failures that say Rasa is unreachable or broken, not e.g. a bad request
+        status_code = e.response.status_code if e.response is not None else None
+        if status_code is None or status_code >= 500:
+            RASA_BREAKER.record_failure()
+        else:
+            RASA_BREAKER.record_success()
+        RASA_ERRORS.labels(rasa_error_reason(e)).inc()
         error_message = f"Error communicating with Rasa server: {str(e)}"
         logger.error(error_message)
-        return jsonify({
-            "error": error_message,
-            "context": context,
-            "messages": [{"text": "I'm sorry, I encountered an error processing your request. Please try again later."}]
-        }), 500
+        return rasa_error_response(error_message, context)
+
+
+def rasa_error_reason(error):
+    """Short label for a failed Rasa call, used in the gateway_rasa_errors_total metric."""
+    if isinstance(error, Timeout):
+        return 'timeout'
+    if isinstance(error, ConnectionError):
+        return 'connection'
+    if error.response is not None:
+        return f'http_{error.response.status_code}'
+    return 'invalid_response'
+
+
+def rasa_error_response(error_message, context):
+    return jsonify({
+        "error": error_message,
+        "context": context,
+        "messages": [{"text": "I'm sorry, I encountered an error processing your request. Please try again later."}]
+    }), 500
 
 
 def process_rasa_response(response, original_context):
@@ -84,57 +183,65 @@ def process_rasa_response(response, original_context):
         return result
 
     for item in response:
-        if item.get("text"):
-            result["messages"].append({"text": item["text"]})
-            
-        # Check for json_message format which is used by newer Rasa SDK
-        if item.get("json_message"):
-            json_data = item["json_message"]
+        process_rasa_item(item, result)
+
+    return result
+
+
+def process_rasa_item(item, result):
+    """Adds one message from Rasa to a result being built (messages, context, actions)."""
+    if item.get("text"):
+        result["messages"].append({"text": item["text"]})
+        
+    # Check for json_message format which is used by newer Rasa SDK
+    if item.get("json_message"):
+        json_data = item["json_message"]
+        
+        # Extract action information
+        if json_data.get("action"):
+            action = json_data["action"]
+            result["actions"].append(action)
+        
+        # Update context with any new information
+        if json_data.get("context"):
+            result["context"].update(json_data["context"])
             
-            # Extract action information
-            if json_data.get("action"):
-                action = json_data["action"]
-                result["actions"].append(action)
+        # Nothing else to process in this message
+        return
+
+    # Handle legacy custom format
+    if item.get("custom"):
+        custom_data = item["custom"]
+        if isinstance(custom_data, str):
+            try:
+                custom_data = json.loads(custom_data)
+            except json.JSONDecodeError:
+                logger.warning(
+                    f"Failed to decode custom JSON: {custom_data}")
+                return
+
+        if custom_data.get("action"):
+            result["actions"].append(custom_data["action"])
             
-            # Update context with any new information
-            if json_data.get("context"):
-                result["context"].update(json_data["context"])
-                
-            # Continue processing other parts of the message
-            continue
-
-        # Handle legacy custom format
-        if item.get("custom"):
-            custom_data = item["custom"]
-            if isinstance(custom_data, str):
-                try:
-                    custom_data = json.loads(custom_data)
-                except json.JSONDecodeError:
-                    logger.warning(
-                        f"Failed to decode custom JSON: {custom_data}")
-                    continue
-
-            if custom_data.get("action"):
-                result["actions"].append(custom_data["action"])
-                
-            if custom_data.get("context"):
-                result["context"].update(custom_data["context"])
-
-        if item.get("image"):
-            result["messages"].append({"type": "image", "url": item["image"]})
-
-        if item.get("buttons"):
-            last_message = result["messages"][-1] if result["messages"] else {
-                "text": ""}
-            last_message["buttons"] = item["buttons"]
-            if not result["messages"] or result["messages"][-1] != last_message:
-                result["messages"].append(last_message)
+        if custom_data.get("context"):
+            result["context"].update(custom_data["context"])
+
+    if item.get("image"):
+        result["messages"].append({"type": "image", "url": item["image"]})
+
+    if item.get("buttons"):
+        last_message = result["messages"][-1] if result["messages"] else {
+            "text": ""}
+        last_message["buttons"] = item["buttons"]
+        if not result["messages"] or result["messages"][-1] != last_message:
+            result["messages"].append(last_message)
 
-    return result
 
 if __name__ == '__main__':
+    # Development server only. In production use: gunicorn -c gunicorn.conf.py app:app
     port = int(os.environ.get('PORT', 3000))
+    debug = os.environ.get('FLASK_DEBUG', 'false').lower() in ('1', 'true')
     logger.info(f"Chatbot server running on http://localhost:{port}")
     logger.info("To use with Rasa, make sure to start the Rasa server with:")
     logger.info("  - rasa run --enable-api --cors \"*\"")
-    app.run(debug=True, port=port)
+    app.run(debug=debug, port=port)
@@ -0,0 +1,430 @@
+"""
+Async gateway: the same API as app.py, served from an event loop.
+
+A chat turn waiting on Rasa costs a coroutine here instead of a worker thread, so a handful
+of processes can keep thousands of conversations in flight. Browsers can also chat over a
+WebSocket (/api/ws) that pushes every bot message as soon as Rasa sends it.
+
+    python async_app.py
+    # or, with several processes:
+    gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker --workers 2 --bind 0.0.0.0:5000
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+from app import DEFAULT_RASA_URL, process_rasa_item, process_rasa_response
+from conversation import SENDER_ID_KEY, flow_active, keep_conversation, prepare_turn, rasa_base_url, slot_snapshot_events
+from rasa_health import RASA_BREAKER_FAILURES, RASA_BREAKER_RESET, RASA_HEALTH_INTERVAL, CircuitBreaker, HealthStatus
+from rasa_client import RASA_BACKOFF, RASA_CONNECT_TIMEOUT, RASA_KEEP_ALIVE, RASA_MAX_RETRIES, RASA_READ_TIMEOUT
+from static_assets import AssetIndex
+from gateway_metrics import (RASA_ERRORS, RASA_FIRST_MESSAGE_SECONDS, RASA_ROUND_TRIP_SECONDS, metrics_payload,
+                             observe_request)
+
+logger = logging.getLogger(__name__)
+
+# Connections to Rasa per process. Unlike the threaded gateway this is not bounded by a
+# thread count, so it is the cap on concurrent turns one process sends to Rasa.
+RASA_ASYNC_POOL_SIZE = int(os.environ.get('RASA_ASYNC_POOL_SIZE', 256))
+
+# Seconds between pings on idle chat sockets, so proxies don't close them between turns
+WS_HEARTBEAT = float(os.environ.get('WS_HEARTBEAT', 25))
+
+
+class PoolCounters:
+    """
+    Counts what the Rasa client session does through aiohttp's public trace hooks, for the pool
+    utilization stats (the async counterpart of rasa_client._MeteredAdapter).
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._request_start)
+        trace_config.on_request_end.append(self._request_done)
+        trace_config.on_request_exception.append(self._request_done)
+        trace_config.on_connection_create_end.append(self._connection_created)
+        trace_config.on_connection_reuseconn.append(self._connection_reused)
+        return trace_config
+
+    async def _request_start(self, session, context, params):
+        self.in_flight += 1
+        self.requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def _request_done(self, session, context, params):
+        self.in_flight -= 1
+
+    async def _connection_created(self, session, context, params):
+        self.connections_opened += 1
+
+    async def _connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+
+rasa_session_key = web.AppKey('rasa_session', aiohttp.ClientSession)
+rasa_pool_key = web.AppKey('rasa_pool', PoolCounters)
+rasa_health_key = web.AppKey('rasa_health', HealthStatus)
+rasa_prober_key = web.AppKey('rasa_prober', asyncio.Task)
+static_assets_key = web.AppKey('static_assets', AssetIndex)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # Same policy as flask_cors in app.py: any origin
+    if request.method == 'OPTIONS':
+        response = web.Response()
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # Label by route pattern; chat sockets are measured per turn (gateway_rasa_*) instead
+        route = request.match_info.route
+        endpoint = route.resource.canonical if route.resource is not None else 'unmatched'
+        if endpoint != '/api/ws':
+            observe_request(endpoint, request.method, status, time.perf_counter() - start)
+
+
+async def metrics(request):
+    # Prometheus scrape endpoint (see gateway_metrics.py)
+    body, content_type = metrics_payload()
+    return web.Response(body=body, headers={'Content-Type': content_type})
+
+
+async def rasa_request(app, method, url, **kwargs):
+    """
+    Sends a request to Rasa with the shared session and returns (status, JSON body).
+
+    Like rasa_client, only failed connections are retried, so a message is never processed twice.
+    """
+    session = app[rasa_session_key]
+    for attempt in range(RASA_MAX_RETRIES + 1):
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                response.raise_for_status()
+                return response.status, await response.json(content_type=None)
+        except aiohttp.ClientConnectorError:
+            if attempt == RASA_MAX_RETRIES:
+                raise
+            await asyncio.sleep(RASA_BACKOFF * (2 ** attempt))
+
+
+async def probe_rasa(app):
+    """Checks Rasa's /version endpoint and returns (available, /api/check_rasa body)."""
+    # RASA_URL may be the server or the webhook URL, /version lives on the server
+    rasa_url = rasa_base_url(os.environ.get('RASA_URL', DEFAULT_RASA_URL))
+    try:
+        # Try to connect to the server's health endpoint
+        _, version = await rasa_request(app, 'GET', f"{rasa_url}/version",
+                                        timeout=aiohttp.ClientTimeout(connect=RASA_CONNECT_TIMEOUT, total=3))
+        return True, {"status": "available", "version": version}
+    except aiohttp.ClientResponseError:
+        return False, {"status": "unavailable", "reason": "API responded with error"}
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.error(f"Failed to connect to Rasa server: {str(e)}")
+        return False, {"status": "unavailable", "reason": str(e) or type(e).__name__}
+
+
+async def probe_rasa_forever(app):
+    while True:
+        app[rasa_health_key].update(*await probe_rasa(app))
+        await asyncio.sleep(RASA_HEALTH_INTERVAL)
+
+
+async def check_rasa(request):
+    # Answered from the background prober; only a call before the first probe checks Rasa itself
+    health = request.app[rasa_health_key]
+    result = health.get()
+    if result is None:
+        health.update(*await probe_rasa(request.app))
+        result = health.get()
+    status, body = result
+    return web.json_response({**body, "circuit": health.breaker.state}, status=status)
+
+
+def record_rasa_result(app, error=None):
+    """Tells the circuit breaker how a Rasa call went. Client errors (4xx) don't count as failures."""
+    breaker = app[rasa_health_key].breaker
+    if error is None or (isinstance(error, aiohttp.ClientResponseError) and error.status < 500):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+async def rasa_pool(request):
+    # Connection pool utilization of this process's Rasa client; in_use counts requests waiting on Rasa
+    connector = request.app[rasa_session_key].connector
+    counters = request.app[rasa_pool_key]
+    return web.json_response({
+        "pid": os.getpid(),
+        "pool_size": connector.limit,
+        "pool_size_per_host": connector.limit_per_host,
+        "in_use": counters.in_flight,
+        "peak_in_use": counters.peak_in_flight,
+        "requests": counters.requests,
+        "connections_opened": counters.connections_opened,
+        "connections_reused": counters.connections_reused,
+        "reuse_ratio": round(1 - counters.connections_opened / counters.requests, 4) if counters.requests else 0.0,
+    })
+
+
+async def carry_over_slots(request, rasa_url, context, sender_id, previous_sender_id):
+    """
+    Moves a rotated chat (see conversation.prepare_turn) to its new tracker by copying the slots over,
+    and returns the context of the conversation the turn goes to.
+
+    Like conversation.carry_over_slots, the chat stays in the previous conversation while a flow is
+    running or when copying fails, and errors that say Rasa is down are raised for the circuit breaker.
+    """
+    base_url = rasa_base_url(rasa_url)
+    try:
+        _, tracker = await rasa_request(request.app, 'GET', f"{base_url}/conversations/{previous_sender_id}/tracker",
+                                        params={'include_events': 'NONE'})
+        if flow_active(tracker):
+            return keep_conversation(context, previous_sender_id)
+        events = slot_snapshot_events(tracker)
+        if events:
+            await rasa_request(request.app, 'POST', f"{base_url}/conversations/{sender_id}/tracker/events",
+                               params={'include_events': 'NONE'}, json=events)
+        return context
+    except (aiohttp.ClientResponseError, ValueError) as e:
+        if isinstance(e, aiohttp.ClientResponseError) and e.status >= 500:
+            raise
+        logger.warning(f"Could not carry slots over from {previous_sender_id} to {sender_id}: {e}")
+        return keep_conversation(context, previous_sender_id)
+
+
+# Handle Rasa messages
+async def send_message(request):
+    data = await request.json()
+    message = data.get('message')
+    context = data.get('context', {})
+
+    rasa_url = os.environ.get('RASA_URL', DEFAULT_RASA_URL)
+    # Each browser session is its own Rasa conversation
+    context, sender_id, previous_sender_id = prepare_turn(context)
+    rotated_context = context
+    if previous_sender_id:
+        # The chat stays in the previous conversation until its slots have been copied
+        context = keep_conversation(context, previous_sender_id)
+
+    # Rasa has been failing: answer right away instead of waiting for another timeout
+    if not request.app[rasa_health_key].breaker.allow():
+        RASA_ERRORS.labels('circuit_open').inc()
+        return rasa_error_response("Error communicating with Rasa server: circuit breaker is open", context)
+
+    try:
+        if previous_sender_id:
+            context = await carry_over_slots(request, rasa_url, rotated_context, sender_id, previous_sender_id)
+        payload = {
+            "sender": context[SENDER_ID_KEY],
+            "message": message,
+            "metadata": context
+        }
+        start = time.perf_counter()
+        _, data = await rasa_request(request.app, 'POST', rasa_url, json=payload)
+        RASA_ROUND_TRIP_SECONDS.labels('rest').observe(time.perf_counter() - start)
+        record_rasa_result(request.app)
+        return web.json_response(process_rasa_response(data, context))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        record_rasa_result(request.app, e)
+        RASA_ERRORS.labels(rasa_error_reason(e)).inc()
+        error_message = f"Error communicating with Rasa server: {str(e) or type(e).__name__}"
+        logger.error(error_message)
+        return rasa_error_response(error_message, context)
+
+
+def rasa_error_reason(error):
+    """Short label for a failed Rasa call, used in the gateway_rasa_errors_total metric."""
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f'http_{error.status}'
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return 'connection'
+    return 'invalid_response'
+
+
+def rasa_error_response(error_message, context):
+    return web.json_response({
+        "error": error_message,
+        "context": context,
+        "messages": [{"text": "I'm sorry, I encountered an error processing your request. Please try again later."}]
+    }, status=500)
+
+
+async def stream_rasa_items(request, payload):
+    """Yields the messages of one Rasa turn as Rasa dispatches them (REST channel, stream=true)."""
+    rasa_url = os.environ.get('RASA_URL', DEFAULT_RASA_URL)
+    session = request.app[rasa_session_key]
+    async with session.post(rasa_url, params={'stream': 'true'}, json=payload) as response:
+        response.raise_for_status()
+        # One JSON message per line
+        async for line in response.content:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+async def stream_turn(request, ws, turn_id, message, context):
+    """Runs one chat turn and pushes every bot message to the socket as soon as it arrives."""
+    context, sender_id, previous_sender_id = prepare_turn(context)
+    rotated_context = context
+    if previous_sender_id:
+        # The chat stays in the previous conversation until its slots have been copied
+        context = keep_conversation(context, previous_sender_id)
+    full_context = {**context}
+    received = False
+    breaker = request.app[rasa_health_key].breaker
+    try:
+        if not breaker.allow():
+            raise CircuitOpenError("circuit breaker is open")
+        start = time.perf_counter()
+        try:
+            if previous_sender_id:
+                context = await carry_over_slots(request, os.environ.get('RASA_URL', DEFAULT_RASA_URL),
+                                                 rotated_context, sender_id, previous_sender_id)
+                full_context = {**context}
+            payload = {
+                "sender": context[SENDER_ID_KEY],
+                "message": message,
+                "metadata": context
+            }
+            async for item in stream_rasa_items(request, payload):
+                if not received:
+                    RASA_FIRST_MESSAGE_SECONDS.observe(time.perf_counter() - start)
+                received = True
+                # The same processing as process_rasa_response, one message at a time
+                chunk = {"messages": [], "context": {}, "actions": []}
+                process_rasa_item(item, chunk)
+                full_context.update(chunk["context"])
+                if chunk["messages"] or chunk["actions"]:
+                    await ws.send_json({"type": "chunk", "id": turn_id, **chunk, "context": full_context})
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            record_rasa_result(request.app, e)
+            raise
+        RASA_ROUND_TRIP_SECONDS.labels('stream').observe(time.perf_counter() - start)
+        record_rasa_result(request.app)
+        if not received:
+            await ws.send_json({"type": "chunk", "id": turn_id, "context": full_context, "actions": [],
+                                "messages": [{"text": "I didn't receive a proper response. Please try again."}]})
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, CircuitOpenError) as e:
+        RASA_ERRORS.labels(rasa_error_reason(e)).inc()
+        error_message = f"Error communicating with Rasa server: {str(e) or type(e).__name__}"
+        logger.error(error_message)
+        await ws.send_json({
+            "type": "chunk",
+            "id": turn_id,
+            "error": error_message,
+            "context": full_context,
+            "actions": [],
+            "messages": [{"text": "I'm sorry, I encountered an error processing your request. Please try again later."}]
+        })
+    await ws.send_json({"type": "done", "id": turn_id, "context": full_context})
+
+
+# Streaming chat over one WebSocket per browser tab
+async def chat_socket(request):
+    """
+    Client frames: {"type": "message", "id": ..., "message": "...", "context": {...}}
+    Server frames: {"type": "chunk", "id": ..., "messages": [...], "actions": [...], "context": {...}}
+    for every bot message, then {"type": "done", "id": ..., "context": {...}} when the turn is over.
+    """
+    ws = web.WebSocketResponse(heartbeat=WS_HEARTBEAT)
+    await ws.prepare(request)
+    async for frame in ws:
+        if frame.type != aiohttp.WSMsgType.TEXT:
+            continue
+        try:
+            data = json.loads(frame.data)
+        except ValueError:
+            continue
+        if data.get("type") == "message":
+            # Turns of one conversation run in order, like they would in the chat window
+            await stream_turn(request, ws, data.get("id"), data.get("message"), data.get("context") or {})
+    return ws
+
+
+# Serve frontend files
+async def serve_static(request):
+    asset = request.app[static_assets_key].resolve(request.match_info.get('path', ''))
+    # FileResponse picks the .br/.gz file the build wrote next to it, answers If-None-Match
+    # with a 304 and sends the file with sendfile
+    return web.FileResponse(asset.path, headers={
+        'Content-Type': asset.content_type,
+        'Cache-Control': asset.cache_control,
+        'Vary': 'Accept-Encoding',
+    })
+
+
+async def open_rasa_session(app):
+    connector = aiohttp.TCPConnector(limit=RASA_ASYNC_POOL_SIZE, force_close=not RASA_KEEP_ALIVE)
+    timeout = aiohttp.ClientTimeout(connect=RASA_CONNECT_TIMEOUT, sock_read=RASA_READ_TIMEOUT)
+    app[rasa_pool_key] = PoolCounters()
+    app[rasa_session_key] = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  trace_configs=[app[rasa_pool_key].trace_config()])
+    # Per-process view of Rasa's health (see rasa_health.py), refreshed in the background
+    app[rasa_health_key] = HealthStatus(CircuitBreaker(RASA_BREAKER_FAILURES, RASA_BREAKER_RESET))
+    app[rasa_prober_key] = asyncio.create_task(probe_rasa_forever(app))
+
+
+async def close_rasa_session(app):
+    app[rasa_prober_key].cancel()
+    await app[rasa_session_key].close()
+
+
+def create_app():
+    app = web.Application(middlewares=[metrics_middleware, cors_middleware])
+    # Frontend files, indexed once (see static_assets.py and build_assets.py)
+    app[static_assets_key] = AssetIndex.load()
+    app.on_startup.append(open_rasa_session)
+    app.on_cleanup.append(close_rasa_session)
+    app.router.add_get('/api/check_rasa', check_rasa)
+    app.router.add_get('/api/rasa_pool', rasa_pool)
+    app.router.add_post('/api/send_message', send_message)
+    app.router.add_get('/api/ws', chat_socket)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/', serve_static)
+    app.router.add_get('/{path:.*}', serve_static)
+    return app
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    logger.info(f"Async chatbot gateway running on http://localhost:{port}")
+    web.run_app(app, port=port, access_log=None)
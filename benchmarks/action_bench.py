@@ -0,0 +1,248 @@
+"""
+Benchmark for the action layer.
+
+Runs the actions and the API helpers behind them against the stub FDC/Spoonacular servers in
+benchmarks/stub_apis.py, cold (all caches empty) and warm (answered from the caches), and
+reports per-call latency percentiles, peak allocations and upstream calls per call.
+
+    # Measure and print
+    python benchmarks/action_bench.py
+
+    # Store the results as the new baseline
+    python benchmarks/action_bench.py --save benchmarks/baselines/actions.json
+
+    # Gate a release: exits with status 1 when a scenario got slower, allocates more or makes
+    # more upstream calls than the baseline
+    python benchmarks/action_bench.py --compare benchmarks/baselines/actions.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_apis import StubAPIs  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "actions.json")
+
+# How much of the relative tolerance each latency metric gets: the tail of 30-odd samples is
+# noisier than the median, so p95 may grow twice as much before it counts as a regression
+LATENCY_METRICS = {"p50_ms": 1, "p95_ms": 2}
+ALLOCATION_METRIC = "peak_alloc_kib"
+
+RECIPE_ID, RECIPE_TITLE = 716406, "Asparagus and Pea Soup: Real Convenience Food"  # In the Spoonacular fixtures
+
+RASA_RESPONSE = [
+    {"recipient_id": "bench", "text": f"🍲 Here's a recipe I found for you!\n\n**{RECIPE_TITLE}**\n\n**Serves:** 4"},
+    {"recipient_id": "bench", "json_message": {"action": "show_recipe", "context": {"last_recipe_id": RECIPE_ID}}},
+    {"recipient_id": "bench", "custom": '{"context": {"food_item": "spinach"}}'},
+    {"recipient_id": "bench", "text": "You can also ask me why this recipe is healthy!"},
+]
+
+
+def load_actions(base_url: str):
+    """Imports the action modules against the stub servers, without disk caches, local stores or rate limits."""
+    os.environ.update({
+        "FDC_BASE_URL": f"{base_url}/fdc/v1",
+        "SPOONACULAR_BASE_URL": base_url,
+        "FDC_API_KEY": "bench",
+        "SPOONACULAR_API_KEY": "bench",
+        "FDC_BACKEND": "api",
+        "FDC_CACHE_PATH": "",
+        "SPOONACULAR_CACHE_PATH": "",
+        "SPOONACULAR_PREFETCH_TOP_N": "0",
+        "SPOONACULAR_PREFETCH_NUTRITION": "false",
+        "SPOONACULAR_QUOTA_PATH": "",
+        "SPOONACULAR_RATE_LIMIT": "0",  # The benchmark measures the actions, not the rate limit
+        "RECIPE_BACKEND": "api",
+        "KNOWLEDGE_INDEX_PATH": "",
+        "ACTION_METRICS_PORT": "0",
+    })
+    from rasa_sdk import Tracker
+    from rasa_sdk.executor import CollectingDispatcher
+
+    import app
+    from actions import FDC_API, Spoonacular_API, actions
+    from actions.name_index import INGREDIENT_INDEX
+
+    def clear_caches():
+        FDC_API.FDC_SEARCH_CACHE.clear()
+        FDC_API.FDC_DETAILS_CACHE.clear()
+        for cache in Spoonacular_API.RECIPE_CACHES.values():
+            cache.clear()
+        INGREDIENT_INDEX.clear()
+
+    def run_action(action, slots, text=""):
+        tracker = Tracker.from_dict({"sender_id": "bench", "slots": slots, "latest_message": {"text": text}})
+        return asyncio.run(action.run(CollectingDispatcher(), tracker, {}))
+
+    scenarios = {
+        "process_rasa_response": lambda: app.process_rasa_response(RASA_RESPONSE, {"sender_id": "bench"}),
+        "get_ingredient_health_info": lambda: FDC_API.get_ingredient_health_info("spinach", "bench"),
+        "find_recipe": lambda: Spoonacular_API.find_recipe(["chicken", "garlic"], "", "bench"),
+        "get_recipe_nutrition": lambda: Spoonacular_API.get_recipe_nutrition(RECIPE_ID, RECIPE_TITLE, "bench"),
+        "plan_meals_week": lambda: Spoonacular_API.plan_meals(["chicken"], "", "bench", days=7),
+        "ActionSearchRecipe": lambda: run_action(
+            actions.ActionSearchRecipe(), {"ingredients": "chicken, garlic", "query_wish": None}),
+        "ActionCheckHealthiness": lambda: run_action(
+            actions.ActionCheckHealthiness(), {"food_item": "tomato, cheddar cheese, broccoli"}),
+        "ActionExplainRecommendation": lambda: run_action(
+            actions.ActionExplainRecommendation(),
+            {"last_recipe_name": RECIPE_TITLE, "last_recipe_id": RECIPE_ID}),
+        "ActionAnswerCookingQuestion": lambda: run_action(
+            actions.ActionAnswerCookingQuestion(), {}, "What can I use instead of eggs?"),
+    }
+    return scenarios, clear_caches
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(stub, call, clear_caches, cold: bool, iterations: int) -> dict:
+    """
+    Times `iterations` calls of one scenario.
+
+    Cold runs empty every cache before each call; warm runs prime the caches with one call first.
+    The allocation peak is measured in a separate call, because tracemalloc slows everything down.
+    """
+    def prepare():
+        random.seed(0)  # find_recipe picks a random search hit
+        if cold:
+            clear_caches()
+
+    if not cold:
+        prepare()
+        call()
+
+    before = Counter(stub.call_counts())
+    timings = []
+    for _ in range(iterations):
+        prepare()
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    upstream = Counter(stub.call_counts())
+    upstream.subtract(before)
+
+    prepare()
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        ALLOCATION_METRIC: round(peak / 1024, 1),
+        "upstream_calls": {route: round(count / iterations, 3) for route, count in sorted(upstream.items()) if count},
+    }
+
+
+def run_benchmarks(latency: float, iterations: int, only=None) -> dict:
+    stub = StubAPIs(latency=latency)
+    scenarios, clear_caches = load_actions(stub.start())
+    results = {}
+    try:
+        for name, call in scenarios.items():
+            if only and name not in only:
+                continue
+            for mode in ("cold", "warm"):
+                results[f"{name}/{mode}"] = measure(stub, call, clear_caches, mode == "cold", iterations)
+    finally:
+        stub.stop()
+    return {
+        "meta": {
+            "latency_s": latency,
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, floor_ms: float, floor_kib: float) -> list:
+    """
+    Returns the regressions of `current` against `baseline` as readable lines.
+
+    A latency or allocation only counts when it grew by more than `tolerance` (relative) and by
+    more than the absolute floor, so sub-millisecond jitter on warm paths never fails the gate.
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        result = current["results"].get(name)
+        if result is None:
+            continue
+        for metric, slack in LATENCY_METRICS.items():
+            if result[metric] > base[metric] * (1 + tolerance * slack) and result[metric] - base[metric] > floor_ms:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+        if (result[ALLOCATION_METRIC] > base[ALLOCATION_METRIC] * (1 + tolerance)
+                and result[ALLOCATION_METRIC] - base[ALLOCATION_METRIC] > floor_kib):
+            regressions.append(f"{name}: {ALLOCATION_METRIC} {base[ALLOCATION_METRIC]} -> {result[ALLOCATION_METRIC]}")
+        # Upstream calls are deterministic, any extra call is a regression (and costs quota)
+        for route, count in result["upstream_calls"].items():
+            if count > base["upstream_calls"].get(route, 0):
+                regressions.append(f"{name}: {route} calls {base['upstream_calls'].get(route, 0)} -> {count}")
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(f"{'scenario':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9}  upstream calls/call")
+    for name, result in results["results"].items():
+        upstream = ", ".join(f"{route}={count:g}" for route, count in result["upstream_calls"].items()) or "-"
+        print(f"{name:<40} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result[ALLOCATION_METRIC]:>9.1f}  {upstream}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the stub APIs wait before answering")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed calls per scenario and mode")
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="Write the results as a baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="Fail on regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth (0.25 = 25%%)")
+    parser.add_argument("--floor-ms", type=float, default=5.0, help="Latency growth below this is never a regression")
+    parser.add_argument("--floor-kib", type=float, default=64.0, help="Allocation growth below this is never a regression")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        # Compare like with like: the stub latency dominates the cold numbers
+        args.latency = baseline["meta"]["latency_s"]
+
+    results = run_benchmarks(args.latency, args.iterations, args.only)
+    print_results(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+            file.write("\n")
+        print(f"\nBaseline written to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms, args.floor_kib)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Hit rate and accuracy of the command cache on the e2e test suite.
+
+Every test case's first message is predicted by a cache that was filled with the other cases
+(leave-one-out) and with the annotated examples of data/nlu.yml, using the commands their
+assertions and annotations describe (flow_started / nlu_trigger, slot_was_set / entities) as
+the LLM's answers. A hit is accurate when the replayed commands pass the case's assertions.
+No Rasa or LLM is needed.
+
+    python benchmarks/command_cache_eval.py
+    python benchmarks/command_cache_eval.py --verbose --min-accuracy 0.95
+"""
+import argparse
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_cache import CommandCache, CommandDicts, dialogue_state  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+E2E_TESTS = os.path.join(ROOT, "tests", "e2e_test_cases.yml")
+NLU_DATA = os.path.join(ROOT, "data", "nlu.yml")
+FLOWS = os.path.join(ROOT, "data", "flows.yml")
+DOMAIN = os.path.join(ROOT, "domain.yml")
+ENTITY = re.compile(r"\[([^\]]+)\]\s*\((\w+)\)")
+
+
+def load_cases(path: str = E2E_TESTS) -> List[Dict[str, Any]]:
+    """The first user message of every test case and the commands its assertions expect."""
+    with open(path, encoding="utf-8") as file:
+        suite = yaml.safe_load(file)
+    cases = []
+    for case in suite.get("test_cases", []):
+        step = next((step for step in case.get("steps", []) if "user" in step), None)
+        if step is None:
+            continue
+        commands = []
+        for assertion in step.get("assertions", []):
+            if "flow_started" in assertion:
+                commands.append({"command": "start flow", "flow": assertion["flow_started"]})
+            for slot in assertion.get("slot_was_set", []):
+                commands.append({"command": "set slot", "name": slot["name"], "value": slot.get("value")})
+        if commands:
+            cases.append({"name": case["test_case"], "text": step["user"], "commands": commands})
+    return cases
+
+
+def load_nlu_examples(nlu_path: str = NLU_DATA, flows_path: str = FLOWS,
+                      domain_path: str = DOMAIN) -> List[Dict[str, Any]]:
+    """NLU examples of intents that trigger a flow, with their entity annotations as slots."""
+    with open(flows_path, encoding="utf-8") as file:
+        flows = yaml.safe_load(file).get("flows", {})
+    with open(domain_path, encoding="utf-8") as file:
+        slots = set(yaml.safe_load(file).get("slots", {}))
+    with open(nlu_path, encoding="utf-8") as file:
+        nlu = yaml.safe_load(file).get("nlu", [])
+    flow_of_intent = {trigger["intent"]: flow_id for flow_id, flow in flows.items()
+                      for trigger in flow.get("nlu_trigger") or [] if "intent" in trigger}
+    examples = []
+    for block in nlu:
+        flow = flow_of_intent.get(block.get("intent"))
+        if flow is None:
+            continue
+        for line in block.get("examples", "").splitlines():
+            example = line.strip().lstrip("- ").strip()
+            if not example or "(when" in example:
+                continue
+            commands = [{"command": "start flow", "flow": flow}]
+            commands += [{"command": "set slot", "name": entity, "value": value}
+                         for value, entity in ENTITY.findall(example) if entity in slots]
+            examples.append({"text": ENTITY.sub(r"\1", example), "commands": commands})
+    return examples
+
+
+def passes(expected: CommandDicts, predicted: Optional[CommandDicts]) -> bool:
+    """Whether the predicted commands satisfy every assertion (extra slots are allowed, as in e2e tests)."""
+    if predicted is None:
+        return False
+    for command in expected:
+        if command["command"] == "start flow":
+            ok = any(c["command"] == "start flow" and c["flow"] == command["flow"] for c in predicted)
+        else:
+            ok = any(c["command"] == "set slot" and c["name"] == command["name"]
+                     and str(c.get("value")).lower() == str(command["value"]).lower() for c in predicted)
+        if not ok:
+            return False
+    return True
+
+
+def evaluate(cases: List[Dict[str, Any]], history: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """Leave-one-out over the cases, with `history` (earlier messages and their commands) always in the cache."""
+    state = dialogue_state(None, None, [])  # First message of a conversation
+    results = []
+    for i, case in enumerate(cases):
+        cache = CommandCache(path=None, verify_rate=0)
+        for example in history:
+            cache.store(example["text"], state, example["commands"])
+        for j, other in enumerate(cases):
+            if j != i:
+                cache.store(other["text"], state, other["commands"])
+        predicted = cache.lookup(case["text"], state)
+        results.append({**case, "predicted": predicted, "hit": predicted is not None,
+                        "correct": passes(case["commands"], predicted)})
+
+    hits = [result for result in results if result["hit"]]
+    return {
+        "cases": len(results),
+        "hits": len(hits),
+        "hit_rate": len(hits) / len(results) if results else 0.0,
+        "accuracy": sum(result["correct"] for result in hits) / len(hits) if hits else None,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", default=E2E_TESTS, help="e2e test file")
+    parser.add_argument("--no-nlu", action="store_true", help="Don't fill the cache with the NLU examples")
+    parser.add_argument("--verbose", action="store_true", help="Show every case")
+    parser.add_argument("--min-accuracy", type=float, default=None, help="Exit with status 1 below this accuracy")
+    args = parser.parse_args()
+
+    report = evaluate(load_cases(args.tests), [] if args.no_nlu else load_nlu_examples())
+    if args.verbose:
+        for result in report["results"]:
+            status = "miss" if not result["hit"] else ("ok" if result["correct"] else "WRONG")
+            print(f"{status:<6} {result['text']!r} -> {result['predicted']}")
+    accuracy = report["accuracy"]
+    print(f"{report['cases']} cases, hit rate {report['hit_rate']:.0%} ({report['hits']} replayed without the LLM), "
+          f"accuracy of hits {'n/a' if accuracy is None else f'{accuracy:.0%}'}")
+    if args.min_accuracy is not None and accuracy is not None and accuracy < args.min_accuracy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
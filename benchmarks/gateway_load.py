@@ -0,0 +1,144 @@
+"""
+Load test for the Flask gateway.
+
+Starts a stub Rasa server that answers every message after a fixed delay, then sends chat
+messages to the gateway from many concurrent clients and reports throughput and latency.
+
+    # 1. Start the stub Rasa server (or point the gateway at a real one)
+    python benchmarks/gateway_load.py stub --port 5005 --latency 0.5
+
+    # 2. Start the gateway against it, e.g.
+    RASA_URL=http://localhost:5005/webhooks/rest/webhook gunicorn -c gunicorn.conf.py app:app
+
+    # 3. Run the load
+    python benchmarks/gateway_load.py load --url http://localhost:5000 --concurrency 64 --duration 20
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+STUB_REPLY = [
+    {"recipient_id": "user", "text": "🍲 Here's a recipe I found for you!\n\n**Stub Soup**\n\n**Serves:** 2\n"},
+    {"recipient_id": "user", "text": "You can also ask me why this recipe is healthy!"},
+]
+
+
+def run_stub(port: int, latency: float) -> None:
+    """Serves a fake Rasa REST webhook, /version and the tracker endpoints."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+        def _send(self, body):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith("/conversations/"):
+                # Tracker snapshot, used when the gateway rotates a long conversation
+                self._send({"sender_id": self.path.split("/")[2], "slots": {"ingredients": "chicken"}})
+                return
+            self._send({"version": "stub", "minimum_compatible_version": "stub"})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.startswith("/conversations/"):
+                self._send({})
+                return
+            if "stream=true" not in self.path:
+                time.sleep(latency)  # Pretend to be the LLM pipeline
+                self._send(STUB_REPLY)
+                return
+
+            # stream=true: like Rasa's REST channel, one JSON line per message as it is dispatched
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for message in STUB_REPLY:
+                time.sleep(latency / len(STUB_REPLY))
+                line = (json.dumps(message) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    print(f"Stub Rasa listening on :{port} with {latency}s latency")
+    server.serve_forever()
+
+
+def run_load(url: str, concurrency: int, duration: float) -> dict:
+    """Sends chat messages from `concurrency` clients for `duration` seconds."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(number):
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{url}/api/send_message", timeout=60,
+                                        json={"message": f"recipe with chicken {number}", "context": {}})
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(quantiles[49] * 1000, 1),
+        "p95_ms": round(quantiles[94] * 1000, 1),
+        "p99_ms": round(quantiles[98] * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stub = commands.add_parser("stub", help="Run a stub Rasa server")
+    stub.add_argument("--port", type=int, default=5005)
+    stub.add_argument("--latency", type=float, default=0.5, help="Seconds before every reply")
+
+    load = commands.add_parser("load", help="Send load to the gateway")
+    load.add_argument("--url", default="http://localhost:5000")
+    load.add_argument("--concurrency", type=int, default=64)
+    load.add_argument("--duration", type=float, default=20)
+
+    args = parser.parse_args()
+    if args.command == "stub":
+        run_stub(args.port, args.latency)
+    else:
+        print(json.dumps(run_load(args.url, args.concurrency, args.duration), indent=2))
+
+
+if __name__ == "__main__":
+    main()
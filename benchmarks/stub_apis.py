@@ -0,0 +1,254 @@
+"""
+Local stand-ins for the FoodData Central and Spoonacular APIs.
+
+Replays the payloads in benchmarks/fixtures/ with an injected delay and counts every call per
+route, so the actions can be measured without network access, API keys or quota.
+
+    python benchmarks/stub_apis.py --port 5200 --latency 0.05
+    python benchmarks/stub_apis.py --quota 150    # Spoonacular quota headers, 402 once it is used up
+    FDC_BASE_URL=http://localhost:5200/fdc/v1 SPOONACULAR_BASE_URL=http://localhost:5200 rasa run actions
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures(directory: str = FIXTURES_DIR) -> Tuple[list, list]:
+    with open(os.path.join(directory, "fdc_foods.json"), encoding="utf-8") as file:
+        foods = json.load(file)
+    with open(os.path.join(directory, "spoonacular_recipes.json"), encoding="utf-8") as file:
+        recipes = json.load(file)
+    return foods, recipes
+
+
+class StubAPIs:
+    """
+    The stub server and its call counters.
+
+    Args:
+        latency (float): Seconds every response is delayed by.
+        route_latency (dict): Per-route delays overriding `latency`, e.g. {"fdc_search": 0.2}.
+        quota (float): Daily Spoonacular points; when set, responses carry the X-API-Quota-*
+            headers and requests get a 402 once the points are used up.
+    """
+
+    ROUTES = [
+        ("GET", re.compile(r"^/fdc/v1/foods/search$"), "fdc_search"),
+        ("POST", re.compile(r"^/fdc/v1/foods$"), "fdc_foods"),
+        ("GET", re.compile(r"^/recipes/complexSearch$"), "spoonacular_complexSearch"),
+        ("GET", re.compile(r"^/recipes/random$"), "spoonacular_random"),
+        ("GET", re.compile(r"^/recipes/(\d+)/information$"), "spoonacular_information"),
+        ("GET", re.compile(r"^/recipes/informationBulk$"), "spoonacular_informationBulk"),
+        ("GET", re.compile(r"^/recipes/(\d+)/nutritionWidget\.json$"), "spoonacular_nutritionWidget"),
+    ]
+
+    # Roughly what Spoonacular charges for the requests the actions make
+    QUOTA_POINTS = {
+        "spoonacular_complexSearch": 1.6,
+        "spoonacular_random": 1.01,
+        "spoonacular_information": 1,
+        "spoonacular_informationBulk": 1,  # Plus 0.5 per additional recipe
+        "spoonacular_nutritionWidget": 1,
+    }
+
+    def __init__(self, latency: float = 0.0, route_latency: Optional[Dict[str, float]] = None,
+                 quota: Optional[float] = None):
+        self.latency = latency
+        self.route_latency = route_latency or {}
+        self.quota = quota
+        self.quota_used = 0.0
+        self.foods, self.recipes = load_fixtures()
+        self.foods_by_id = {food["fdcId"]: food for food in self.foods}
+        self.recipes_by_id = {recipe["id"]: recipe for recipe in self.recipes}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.server = None
+
+    # --- Responses ---
+
+    def fdc_search(self, query, body, recipe_id):
+        words = set(re.findall(r"[a-z]+", query.get("query", [""])[0].lower()))
+        # Roughly what FDC does: the foods sharing the most words with the query come first,
+        # where "tomato" matches "tomatoes"
+        scored = []
+        for food in self.foods:
+            description = set(re.findall(r"[a-z]+", food["description"].lower()))
+            shared = sum(any(other.startswith(word) or word.startswith(other) for other in description)
+                         for word in words)
+            if shared:
+                scored.append((-shared, len(food["description"]), food))
+        scored.sort(key=lambda item: item[:2])
+        hits = [{"fdcId": food["fdcId"], "description": food["description"], "dataType": food["dataType"]}
+                for _, _, food in scored[:int(query.get("pageSize", ["50"])[0])]]
+        return 200, {"totalHits": len(scored), "foods": hits}
+
+    def fdc_foods(self, query, body, recipe_id):
+        return 200, [self.foods_by_id[fdc_id] for fdc_id in body.get("fdcIds", []) if fdc_id in self.foods_by_id]
+
+    def _recipe_summary(self, recipe):
+        return {key: value for key, value in recipe.items() if key != "nutritionWidget"}
+
+    def _search_hit(self, recipe, query, wanted):
+        """A complexSearch result: only what the add*/fill* flags ask for, in the search's own shape."""
+        def flag(name):
+            return query.get(name, ["false"])[0].lower() == "true"
+
+        hit = {key: recipe[key] for key in ("id", "title", "image", "imageType")}
+        if flag("addRecipeInformation"):
+            hit.update({key: value for key, value in self._recipe_summary(recipe).items()
+                        if key not in ("extendedIngredients", "instructions")})
+        if flag("addRecipeInformation") or flag("addRecipeInstructions"):
+            steps = [step.strip() for step in re.split(r"<[^>]+>|(?<=\.)\s+", recipe.get("instructions") or "")
+                     if step.strip()]
+            hit["analyzedInstructions"] = [{"name": "", "steps": [{"number": number, "step": step}
+                                                                  for number, step in enumerate(steps, 1)]}]
+        if flag("fillIngredients"):
+            used = [ingredient for ingredient in recipe["extendedIngredients"]
+                    if any(item in ingredient["original"].lower() for item in wanted)]
+            hit["usedIngredients"] = used
+            hit["missedIngredients"] = [ingredient for ingredient in recipe["extendedIngredients"] if ingredient not in used]
+        return hit
+
+    def spoonacular_complexSearch(self, query, body, recipe_id):
+        wanted = [item.strip().lower() for item in query.get("includeIngredients", [""])[0].split(",") if item.strip()]
+        results = []
+        for recipe in self.recipes:
+            text = " ".join(ingredient["original"].lower() for ingredient in recipe["extendedIngredients"])
+            if all(item in text for item in wanted):
+                results.append(self._search_hit(recipe, query, wanted))
+        number = int(query.get("number", ["10"])[0])
+        return 200, {"results": results[:number], "offset": 0, "number": number, "totalResults": len(results)}
+
+    def spoonacular_random(self, query, body, recipe_id):
+        return 200, {"recipes": [self._recipe_summary(self.recipes[0])]}
+
+    def spoonacular_information(self, query, body, recipe_id):
+        recipe = self.recipes_by_id.get(int(recipe_id))
+        return (200, self._recipe_summary(recipe)) if recipe else (404, {"status": "failure", "code": 404})
+
+    def spoonacular_informationBulk(self, query, body, recipe_id):
+        ids = [int(value) for value in query.get("ids", [""])[0].split(",") if value.strip().isdigit()]
+        include_nutrition = query.get("includeNutrition", ["false"])[0].lower() == "true"
+        recipes = []
+        for recipe in (self.recipes_by_id[recipe_id] for recipe_id in ids if recipe_id in self.recipes_by_id):
+            payload = self._recipe_summary(recipe)
+            if include_nutrition:
+                widget = recipe["nutritionWidget"]
+                payload["nutrition"] = {"nutrients": [
+                    {"name": name, "amount": float(re.sub(r"[^\d.]", "", widget[key]) or 0), "unit": unit}
+                    for name, key, unit in (("Calories", "calories", "kcal"), ("Fat", "fat", "g"),
+                                            ("Carbohydrates", "carbs", "g"), ("Protein", "protein", "g"))
+                ]}
+            recipes.append(payload)
+        return 200, recipes
+
+    def spoonacular_nutritionWidget(self, query, body, recipe_id):
+        recipe = self.recipes_by_id.get(int(recipe_id))
+        return (200, recipe["nutritionWidget"]) if recipe else (404, {"status": "failure", "code": 404})
+
+    # --- Server ---
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, object, Dict[str, str]]:
+        """Returns (status, JSON payload, extra headers) for a request."""
+        url = urlparse(path)
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                with self._lock:
+                    self.calls[name] += 1
+                time.sleep(self.route_latency.get(name, self.latency))
+                headers = {}
+                if self.quota is not None and name in self.QUOTA_POINTS:
+                    with self._lock:
+                        if self.quota_used >= self.quota:
+                            return 402, {"status": "failure", "code": 402, "message": "Your daily points limit "
+                                         f"of {self.quota:g} has been reached."}, {}
+                        points = self.QUOTA_POINTS[name]
+                        if name == "spoonacular_informationBulk":
+                            points += 0.5 * max(0, len(parse_qs(url.query).get("ids", [""])[0].split(",")) - 1)
+                        self.quota_used += points
+                        headers = {
+                            "X-API-Quota-Request": f"{points:g}",
+                            "X-API-Quota-Used": f"{self.quota_used:g}",
+                            "X-API-Quota-Left": f"{max(0.0, self.quota - self.quota_used):g}",
+                        }
+                payload = json.loads(body) if body else {}
+                status, data = getattr(self, name)(parse_qs(url.query), payload,
+                                                   match.group(1) if match.groups() else None)
+                return status, data, headers
+        return 404, {"error": f"No stub for {method} {url.path}"}, {}
+
+    def call_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.calls)
+
+    def start(self, port: int = 0) -> str:
+        """Serves in a background thread and returns the base URL (port 0 picks a free port)."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length", 0))
+                status, payload, headers = stub.handle(method, self.path,
+                                                       self.rfile.read(length) if length else b"")
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before every response")
+    parser.add_argument("--quota", type=float, default=None, help="Daily Spoonacular points (default: unlimited)")
+    args = parser.parse_args()
+
+    stub = StubAPIs(latency=args.latency, quota=args.quota)
+    base_url = stub.start(args.port)
+    print(f"FDC_BASE_URL={base_url}/fdc/v1 SPOONACULAR_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(stub.call_counts(), indent=2))
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Builds the frontend for production serving.
+
+Copies frontend/ to frontend/dist/ with a content hash in every asset name (js/app.js ->
+js/app.3f9c2a7b1d04.js), rewrites index.html to point at the hashed names, writes .gz (and, with
+the `brotli` package installed, .br) siblings next to every compressible file, and records it all
+in manifest.json. The gateways serve the hashed files as immutable, so browsers only download
+them again after they changed.
+
+    python build_assets.py
+    python build_assets.py --source frontend --out frontend/dist
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Any, Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are built
+    brotli = None
+
+from static_assets import ASSET_DIST_DIR, FRONTEND_DIR, MANIFEST_NAME, content_type
+
+# Files smaller than this, or that compress by less than 10%, are only served uncompressed
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Pages keep their name (the URL users visit); everything else is fingerprinted
+PAGE_EXTENSIONS = ('.html',)
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(path: str, digest: str) -> str:
+    """js/app.js -> js/app.<digest>.js"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{digest}{extension}"
+
+
+def compress_variants(out_dir: str, path: str, data: bytes) -> Dict[str, str]:
+    """Writes the precompressed siblings of one file and returns {encoding: relative path}."""
+    if len(data) < MIN_COMPRESS_SIZE or not content_type(path).startswith(COMPRESSIBLE_TYPES):
+        return {}
+    candidates = {'gzip': ('.gz', gzip.compress(data, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        candidates['br'] = ('.br', brotli.compress(data, quality=11))
+    variants = {}
+    for encoding, (suffix, compressed) in candidates.items():
+        if len(compressed) < len(data) * 0.9:
+            with open(os.path.join(out_dir, path + suffix), 'wb') as file:
+                file.write(compressed)
+            variants[encoding] = path + suffix
+    return variants
+
+
+def rewrite_references(page: str, assets: Dict[str, Dict[str, Any]], page_path: str) -> str:
+    """Points src/href attributes of a page at the fingerprinted asset names."""
+    page_dir = os.path.dirname(page_path)
+
+    def replace(match):
+        reference = match.group(2)
+        target = os.path.normpath(os.path.join(page_dir, reference.lstrip('/'))).replace(os.sep, '/')
+        asset = assets.get(target)
+        if asset is None or reference.startswith(('http:', 'https:', '//')):
+            return match.group(0)
+        hashed = os.path.relpath(asset['file'], page_dir or '.').replace(os.sep, '/')
+        return f"{match.group(1)}{'/' + hashed if reference.startswith('/') else hashed}{match.group(3)}"
+
+    return re.sub(r'''((?:src|href)=["'])([^"'?#]+)(["'])''', replace, page)
+
+
+def build(source: str = FRONTEND_DIR, out_dir: str = ASSET_DIST_DIR) -> Dict[str, Any]:
+    """
+    Builds the fingerprinted, precompressed copy of `source` in `out_dir`.
+
+    Args:
+        source (str): The frontend directory.
+        out_dir (str): Where to write the build; it is emptied first.
+
+    Returns:
+        dict: The manifest, also written to `out_dir`/manifest.json.
+    """
+    source, out_dir = os.path.abspath(source), os.path.abspath(out_dir)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+
+    files = []
+    for root, dirs, names in os.walk(source):
+        # Never build the build output into itself
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != out_dir)
+        for name in sorted(names):
+            files.append(os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/'))
+
+    # Assets first, so the pages can point at their hashed names
+    files.sort(key=lambda path: path.endswith(PAGE_EXTENSIONS))
+    assets: Dict[str, Dict[str, Any]] = {}
+    for path in files:
+        with open(os.path.join(source, path), 'rb') as file:
+            data = file.read()
+        is_page = path.endswith(PAGE_EXTENSIONS)
+        if is_page:
+            data = rewrite_references(data.decode('utf-8'), assets, path).encode('utf-8')
+        digest = fingerprint(data)
+        built = path if is_page else hashed_name(path, digest)
+
+        os.makedirs(os.path.dirname(os.path.join(out_dir, built)), exist_ok=True)
+        with open(os.path.join(out_dir, built), 'wb') as file:
+            file.write(data)
+        assets[path] = {
+            'file': built,
+            'etag': digest,
+            'size': len(data),
+            'immutable': not is_page,
+            'encodings': compress_variants(out_dir, built, data),
+        }
+
+    manifest = {'version': 1, 'assets': assets}
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=FRONTEND_DIR, help="The frontend directory")
+    parser.add_argument('--out', default=ASSET_DIST_DIR, help="Where to write the build")
+    args = parser.parse_args(argv)
+
+    manifest = build(args.source, args.out)
+    assets = manifest['assets'].values()
+    raw = sum(asset['size'] for asset in assets)
+    print(f"Built {len(manifest['assets'])} files ({raw / 1024:.1f} KiB) into {args.out}"
+          f"{'' if brotli is not None else ' (gzip only, install brotli for .br files)'}")
+    for path, asset in sorted(manifest['assets'].items()):
+        sizes = ", ".join(f"{encoding} {os.path.getsize(os.path.join(args.out, variant)) / 1024:.1f} KiB"
+                          for encoding, variant in asset['encodings'].items())
+        print(f"  {path} -> {asset['file']} ({asset['size'] / 1024:.1f} KiB{', ' + sizes if sizes else ''})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+The LLM command generator with a command cache in front of it (see command_cache.py).
+
+Used in config.yml instead of CompactLLMCommandGenerator:
+
+    pipeline:
+    - name: cached_command_generator.CachedCommandGenerator
+      llm:
+        model_group: rasa_command_generation_model
+"""
+import hashlib
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+from rasa.dialogue_understanding.commands import Command, SetSlotCommand, StartFlowCommand
+from rasa.dialogue_understanding.generator import CompactLLMCommandGenerator
+from rasa.dialogue_understanding.patterns.collect_information import CollectInformationPatternFlowStackFrame
+from rasa.dialogue_understanding.stack.utils import top_user_flow_frame
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.shared.core.constants import DEFAULT_SLOT_NAMES
+from rasa.shared.core.flows import FlowsList
+from rasa.shared.core.trackers import DialogueStateTracker
+from rasa.shared.nlu.constants import TEXT
+from rasa.shared.nlu.training_data.message import Message
+
+from command_cache import COMMAND_CACHE_ENABLED, CommandCache, CommandDicts, dialogue_state
+
+logger = logging.getLogger(__name__)
+
+
+def to_dicts(commands: List[Command]) -> Optional[CommandDicts]:
+    """The commands as cache entries, or None when they contain anything that is not safe to replay."""
+    dicts = []
+    for command in commands:
+        if isinstance(command, StartFlowCommand):
+            dicts.append({"command": "start flow", "flow": command.flow})
+        elif isinstance(command, SetSlotCommand):
+            dicts.append({"command": "set slot", "name": command.name, "value": command.value})
+        else:
+            return None
+    # Exactly one flow to start, or slots for the flow that is already running
+    if sum(d["command"] == "start flow" for d in dicts) > 1:
+        return None
+    return dicts
+
+
+def to_commands(dicts: CommandDicts) -> List[Command]:
+    return [StartFlowCommand(flow=d["flow"]) if d["command"] == "start flow"
+            else SetSlotCommand(name=d["name"], value=d["value"]) for d in dicts]
+
+
+def tracker_state(tracker: Optional[DialogueStateTracker], fingerprint: str = "") -> str:
+    """Active flow, the slot being collected and which slots are filled."""
+    if tracker is None:
+        return dialogue_state(None, None, [], fingerprint)
+    frame = top_user_flow_frame(tracker.stack)
+    top = tracker.stack.top()
+    collecting = top.collect if isinstance(top, CollectInformationPatternFlowStackFrame) else None
+    filled = [name for name, slot in tracker.slots.items()
+              if name not in DEFAULT_SLOT_NAMES and slot.value is not None and slot.value != slot.initial_value]
+    return dialogue_state(frame.flow_id if frame else None, collecting, filled, fingerprint)
+
+
+@DefaultV1Recipe.register([DefaultV1Recipe.ComponentType.COMMAND_GENERATOR], is_trainable=True)
+class CachedCommandGenerator(CompactLLMCommandGenerator):
+    """
+    Replays the commands of earlier, equivalent messages instead of asking the LLM.
+
+    Only messages whose commands just start a flow and/or set slots are cached, keyed by the
+    dialogue state. A sample of cache hits is still sent to the LLM; templates that no longer
+    agree with it are dropped.
+    """
+
+    command_cache: Optional[CommandCache] = None
+    # (id of the flows, their fingerprint), so the flows are only hashed once per model
+    _fingerprint: Optional[Tuple[int, str]] = None
+
+    def fingerprint(self, flows: FlowsList) -> str:
+        """
+        Hash of the flows, the generator config and its prompt. Part of every cache key, so a
+        retrained model or edited flows never replay commands cached for the old ones.
+        """
+        if self._fingerprint is None or self._fingerprint[0] != id(flows):
+            model = json.dumps([flows.as_json_list(), self.config, getattr(self, "prompt_template", None)],
+                               sort_keys=True, default=str)
+            self._fingerprint = (id(flows), hashlib.sha256(model.encode("utf-8")).hexdigest()[:16])
+        return self._fingerprint[1]
+
+    async def predict_commands(self, message: Message, flows: FlowsList,
+                               tracker: Optional[DialogueStateTracker] = None, **kwargs: Any) -> List[Command]:
+        if not COMMAND_CACHE_ENABLED:
+            return await super().predict_commands(message, flows, tracker, **kwargs)
+        if CachedCommandGenerator.command_cache is None:
+            CachedCommandGenerator.command_cache = CommandCache()
+        cache = CachedCommandGenerator.command_cache
+
+        text = message.get(TEXT) or ""
+        state = tracker_state(tracker, self.fingerprint(flows))
+        replayed = cache.lookup(text, state)
+        if replayed is not None and not cache.should_verify():
+            logger.debug(f"Replaying cached commands for {text!r}: {replayed}")
+            return to_commands(replayed)
+
+        commands = await super().predict_commands(message, flows, tracker, **kwargs)
+        cache.store(text, state, to_dicts(commands), replayed=replayed)
+        return commands
@@ -0,0 +1,234 @@
+import logging
+import os
+import random
+import re
+import threading
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from actions.cache import TieredCache, cache_path_from_env
+
+logger = logging.getLogger(__name__)
+
+# --- Command cache ---
+# Remembers the commands the LLM command generator produced for a message in a given dialogue
+# state, and replays them for the same message (or the same sentence about another food) in the
+# same state, skipping the LLM round-trip. See cached_command_generator.py.
+COMMAND_CACHE_ENABLED = os.environ.get("COMMAND_CACHE_ENABLED", "true").lower() == "true"
+COMMAND_CACHE_PATH = cache_path_from_env("COMMAND_CACHE_PATH", ".cache/commands.sqlite")
+COMMAND_CACHE_SIZE = int(os.environ.get("COMMAND_CACHE_SIZE", 2048))
+COMMAND_CACHE_TTL = float(os.environ.get("COMMAND_CACHE_TTL", 7 * 24 * 3600))  # Retraining changes the answers
+# Share of cache hits that are still sent to the LLM to check the cached commands
+COMMAND_CACHE_VERIFY_RATE = float(os.environ.get("COMMAND_CACHE_VERIFY_RATE", 0.05))
+
+# A slot value is only turned into a parameter when it is this short ("tomato", "red lentils")
+MAX_PARAMETER_WORDS = 3
+# Templates need this many fixed words, so "{food_item}" alone never matches every message
+MIN_LITERAL_WORDS = 2
+PARAMETER = r"([a-z][a-z0-9']*(?: [a-z][a-z0-9']*){0,%d})" % (MAX_PARAMETER_WORDS - 1)
+
+# Words a slot value never consists of: "Is it healthy?" or "a recipe with no chicken" must not
+# replay food_item="it" / ingredients="no chicken" from the template of "Is cucumber healthy?"
+NON_VALUE_WORDS = {
+    # Pronouns
+    "i", "me", "my", "you", "your", "he", "him", "his", "she", "her", "it", "its", "we", "us", "our",
+    "they", "them", "their", "this", "that", "these", "those", "one", "ones", "what", "which",
+    "something", "anything", "everything", "nothing", "stuff",
+    # Determiners and quantifiers
+    "a", "an", "the", "some", "any", "no", "every", "each", "all", "more", "less", "other", "another", "same",
+    # Negations
+    "not", "never", "without", "nor", "none", "don't", "doesn't", "isn't", "aren't", "can't", "won't",
+    # Fillers
+    "really", "very", "so", "too", "also", "just", "even", "still", "actually", "please",
+}
+
+# Words that don't change what a message asks for ("Are the cucumbers healthy?" = "Is cucumber healthy?")
+IGNORED_WORDS = {"a", "an", "the", "please"}
+CANONICAL_WORDS = {"are": "is", "am": "is", "what's": "what is", "how's": "how is", "it's": "it is"}
+
+# Commands as plain dicts: {"command": "start flow", "flow": ...} / {"command": "set slot", "name": ..., "value": ...}
+CommandDicts = List[Dict[str, Any]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words without articles, with "are"/"am" as "is"."""
+    words = []
+    for word in re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text.lower().replace("’", "'")):
+        if word not in IGNORED_WORDS:
+            words.extend(CANONICAL_WORDS.get(word, word).split())
+    return words
+
+
+def is_slot_value(words: List[str]) -> bool:
+    """Whether words can be a slot value ("red lentils"), i.e. none of them is a pronoun, negation, ..."""
+    return 0 < len(words) <= MAX_PARAMETER_WORDS and not any(word in NON_VALUE_WORDS for word in words)
+
+
+def mentions_values(text: str, commands: CommandDicts) -> bool:
+    """
+    Whether every text slot value is written in the message. Values the LLM took from the
+    context ("Is it healthy?" -> the food discussed before) are not safe to replay.
+    """
+    words = " ".join(tokenize(text))
+    return all(f" {' '.join(tokenize(c['value']))} " in f" {words} " for c in commands
+               if c["command"] == "set slot" and isinstance(c.get("value"), str))
+
+
+def make_template(text: str, commands: CommandDicts) -> Tuple[Tuple[str, ...], CommandDicts]:
+    """
+    Replaces slot values that appear word for word in the message by "{slot}" placeholders.
+
+    Returns:
+        tuple: The template words and the commands, where a replaced value becomes
+        {"command": "set slot", "name": slot, "parameter": True}.
+    """
+    words = tokenize(text)
+    template_commands = []
+    for command in commands:
+        value = command.get("value")
+        if command["command"] == "set slot" and isinstance(value, str):
+            value_words = tokenize(value)
+            if is_slot_value(value_words) and " ".join(value_words) == value.lower().strip():
+                for start in range(len(words) - len(value_words) + 1):
+                    if words[start:start + len(value_words)] == value_words:
+                        words[start:start + len(value_words)] = ["{%s}" % command["name"]]
+                        command = {"command": "set slot", "name": command["name"], "parameter": True}
+                        break
+        template_commands.append(command)
+    if sum(not word.startswith("{") for word in words) < MIN_LITERAL_WORDS and len(words) != len(tokenize(text)):
+        # Too little left to recognize the sentence by: only replay it word for word
+        return tuple(tokenize(text)), commands
+    return tuple(words), template_commands
+
+
+def compile_template(template: Tuple[str, ...]) -> Tuple[Pattern, List[str]]:
+    """A regex for a whole tokenized message and the slot names of its groups, in order."""
+    parts, slots = [], []
+    for word in template:
+        if word.startswith("{"):
+            parts.append(PARAMETER)
+            slots.append(word[1:-1])
+        else:
+            parts.append(re.escape(word))
+    return re.compile("^" + " ".join(parts) + "$"), slots
+
+
+def same_commands(a: CommandDicts, b: CommandDicts) -> bool:
+    def key(commands):
+        return sorted((c["command"], c.get("flow") or c.get("name"), str(c.get("value", "")).lower()) for c in commands)
+    return key(a) == key(b)
+
+
+class CommandCache:
+    """
+    Dialogue state + message template -> commands.
+
+    Args:
+        max_size (int): Templates kept in memory.
+        ttl (float): Seconds a template is replayed before the LLM is asked again.
+        path (str): SQLite file shared by Rasa processes and restarts (None keeps it in memory).
+        verify_rate (float): Share of hits that are checked against the LLM anyway.
+    """
+
+    def __init__(self, max_size: int = COMMAND_CACHE_SIZE, ttl: float = COMMAND_CACHE_TTL,
+                 path: Optional[str] = COMMAND_CACHE_PATH, verify_rate: float = COMMAND_CACHE_VERIFY_RATE):
+        self.entries = TieredCache("command_cache", ttl=ttl, max_size=max_size, path=path)
+        self.verify_rate = verify_rate
+        self._patterns: Dict[str, Dict[Tuple[str, ...], Tuple[Pattern, List[str]]]] = {}
+        self._lock = threading.Lock()
+        self.counts = {"lookups": 0, "hits": 0, "stored": 0, "verified": 0, "mismatches": 0}
+        for key, _ in self.entries.items():
+            state, _, template = key.partition("\x1f")
+            self._add_pattern(state, tuple(template.split(" ")))
+
+    def _add_pattern(self, state: str, template: Tuple[str, ...]) -> None:
+        if any(word.startswith("{") for word in template):
+            with self._lock:
+                self._patterns.setdefault(state, {})[template] = compile_template(template)
+
+    def lookup(self, text: str, state: str) -> Optional[CommandDicts]:
+        """Returns the commands to replay for a message in a dialogue state, or None on a miss."""
+        with self._lock:
+            self.counts["lookups"] += 1
+            candidates = list(self._patterns.get(state, {}).items())
+
+        words = " ".join(tokenize(text))
+        entry = self.entries.get(f"{state}\x1f{words}")
+        if entry is None:
+            # Most specific template first
+            for template, (pattern, slots) in sorted(candidates, key=lambda item: -len(item[0])):
+                match = pattern.match(words)
+                if not match or not all(is_slot_value(value.split(" ")) for value in match.groups()):
+                    continue  # "Is it healthy?": let the LLM work out what "it" is
+                entry = self.entries.get(f"{state}\x1f{' '.join(template)}")
+                if entry is None:  # Expired
+                    with self._lock:
+                        self._patterns[state].pop(template, None)
+                    continue
+                values = dict(zip(slots, match.groups()))
+                entry = [{"command": "set slot", "name": c["name"], "value": values[c["name"]]}
+                         if c.get("parameter") else c for c in entry]
+                break
+        if entry is not None:
+            with self._lock:
+                self.counts["hits"] += 1
+            self._log_stats()
+        return entry
+
+    def should_verify(self) -> bool:
+        return random.random() < self.verify_rate
+
+    def store(self, text: str, state: str, commands: Optional[CommandDicts],
+              replayed: Optional[CommandDicts] = None) -> None:
+        """
+        Remembers the LLM's commands for a message. `commands` is None when they must not be
+        replayed (anything but starting flows and setting slots).
+
+        Args:
+            replayed (CommandDicts): What the cache would have replayed, when this LLM call was a
+                verification. A template that replays something else is dropped.
+        """
+        template, template_commands = make_template(text, commands or [])
+        key = f"{state}\x1f{' '.join(template)}"
+        if replayed is not None:
+            agreed = commands is not None and same_commands(commands, replayed)
+            with self._lock:
+                self.counts["verified" if agreed else "mismatches"] += 1
+            if not agreed:
+                # The template the replayed commands came from
+                stale, _ = make_template(text, replayed)
+                logger.info(f"Cached commands for {text!r} no longer match the LLM, dropping {stale}")
+                self.entries.delete(f"{state}\x1f{' '.join(stale)}")
+                self.entries.delete(f"{state}\x1f{' '.join(tokenize(text))}")
+                with self._lock:
+                    self._patterns.get(state, {}).pop(stale, None)
+                return
+        if not commands or not mentions_values(text, commands):
+            return
+        self.entries.set(key, template_commands)
+        self._add_pattern(state, template)
+        with self._lock:
+            self.counts["stored"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        counts["hit_ratio"] = counts["hits"] / counts["lookups"] if counts["lookups"] else 0.0
+        checked = counts["verified"] + counts["mismatches"]
+        counts["verified_accuracy"] = counts["verified"] / checked if checked else None
+        return counts
+
+    def _log_stats(self) -> None:
+        if self.counts["lookups"] % 100 == 0:
+            logger.info(f"Command cache: {self.stats()}")
+
+
+def dialogue_state(active_flow: Optional[str], collecting: Optional[str], filled_slots: List[str],
+                   fingerprint: str = "") -> str:
+    """
+    The part of the dialogue state that can change which commands a message means.
+
+    Args:
+        fingerprint (str): Identifies the flows and the generator config (see cached_command_generator.py),
+            so commands cached before retraining or editing the flows are never replayed.
+    """
+    return f"{fingerprint or '-'}|{active_flow or '-'}|{collecting or '-'}|{','.join(sorted(filled_slots))}"
@@ -0,0 +1,123 @@
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+# --- Per-session conversations ---
+# Every browser session gets its own Rasa sender ID (kept in the frontend context), so each chat
+# has its own tracker and Rasa can work on different chats in parallel.
+SENDER_ID_KEY = 'sender_id'
+TURN_COUNT_KEY = 'turn_count'
+
+# After this many turns the gateway continues the chat under a fresh sender ID, carrying the
+# slots over, so the tracker history Rasa replays every turn stays bounded. 0 disables it.
+# A chat in the middle of a flow (e.g. while a slot is being collected) is only rotated once
+# the flow has finished, because the dialogue stack is not carried over.
+RASA_MAX_TURNS = int(os.environ.get('RASA_MAX_TURNS', 50))
+
+# Slots Rasa manages itself; they are never copied into a new conversation
+INTERNAL_SLOTS = {
+    'requested_slot', 'dialogue_stack', 'return_value', 'flow_hashes',
+    'session_started_metadata', 'startup_utterances',
+}
+
+
+def new_sender_id() -> str:
+    return uuid.uuid4().hex
+
+
+def prepare_turn(context: Dict[str, Any]) -> Tuple[Dict[str, Any], str, Optional[str]]:
+    """
+    Assigns the sender ID for the next turn of a conversation.
+
+    Args:
+        context (dict): The context the frontend sent with the message.
+
+    Returns:
+        tuple: (context with sender ID and turn count, sender ID to use, previous sender ID
+            when the conversation was just rotated to a new tracker, else None).
+    """
+    context = {**context}
+    sender_id = context.get(SENDER_ID_KEY)
+    previous_sender_id = None
+    try:
+        turn_count = int(context.get(TURN_COUNT_KEY, 0)) + 1
+    except (TypeError, ValueError):
+        turn_count = 1
+
+    if not sender_id:
+        sender_id, turn_count = new_sender_id(), 1
+    elif RASA_MAX_TURNS and turn_count > RASA_MAX_TURNS:
+        previous_sender_id, sender_id, turn_count = sender_id, new_sender_id(), 1
+
+    context[SENDER_ID_KEY] = sender_id
+    context[TURN_COUNT_KEY] = turn_count
+    return context, sender_id, previous_sender_id
+
+
+def keep_conversation(context: Dict[str, Any], previous_sender_id: str) -> Dict[str, Any]:
+    """Undoes a rotation of prepare_turn: the turn stays in the previous conversation and the next turn tries again."""
+    return {**context, SENDER_ID_KEY: previous_sender_id, TURN_COUNT_KEY: RASA_MAX_TURNS}
+
+
+def flow_active(tracker: Dict[str, Any]) -> bool:
+    """Whether a tracker (Rasa HTTP API) is in the middle of a flow, i.e. its dialogue stack is not empty."""
+    stack = tracker.get('stack')
+    if stack is None:
+        stack = (tracker.get('slots') or {}).get('dialogue_stack')
+    return bool(stack)
+
+
+def rasa_base_url(webhook_url: str) -> str:
+    """http://host:5005/webhooks/rest/webhook -> http://host:5005"""
+    return webhook_url.split('/webhooks/')[0].rstrip('/')
+
+
+def slot_snapshot_events(tracker: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """SlotSet events that restore the filled slots of a tracker in a new conversation."""
+    return [
+        {'event': 'slot', 'name': name, 'value': value}
+        for name, value in (tracker.get('slots') or {}).items()
+        if value is not None and name not in INTERNAL_SLOTS
+    ]
+
+
+def carry_over_slots(session, webhook_url: str, previous_sender_id: str, sender_id: str, timeout=None) -> bool:
+    """
+    Copies the slots of the previous conversation into the new one (Rasa HTTP API, --enable-api).
+
+    Returns:
+        bool: Whether the chat can continue in the new conversation. False while the previous one
+        is in the middle of a flow, or when the slots could not be copied (logged, not raised);
+        the turn then stays in the previous conversation (see keep_conversation).
+
+    Raises:
+        RequestException: When Rasa is unreachable or broken (no response, 5xx), so the caller
+            counts it on the circuit breaker like a failed message.
+    """
+    base_url = rasa_base_url(webhook_url)
+    try:
+        response = session.get(f"{base_url}/conversations/{previous_sender_id}/tracker",
+                               params={'include_events': 'NONE'}, timeout=timeout)
+        response.raise_for_status()
+        tracker = response.json()
+        if flow_active(tracker):
+            return False
+        events = slot_snapshot_events(tracker)
+        if events:
+            response = session.post(f"{base_url}/conversations/{sender_id}/tracker/events",
+                                    params={'include_events': 'NONE'}, json=events, timeout=timeout)
+            response.raise_for_status()
+        return True
+    except RequestException as e:
+        if e.response is None or e.response.status_code >= 500:
+            raise
+        logger.warning(f"Could not carry slots over from {previous_sender_id} to {sender_id}: {e}")
+        return False
+    except ValueError as e:
+        logger.warning(f"Could not carry slots over from {previous_sender_id} to {sender_id}: {e}")
+        return False
@@ -287,34 +287,32 @@ document.addEventListener('DOMContentLoaded', () => {
         // Show typing indicator
         showTypingIndicator();
 
-        // Send message to Python backend and get response
-        fetch('/api/send_message', { 
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ message: message, context: conversationContext })
+        // Send message to Python backend; bot messages are shown as soon as each one arrives
+        window.rasaAPI.streamMessage(message, conversationContext, data => {
+            console.log("Response from Rasa:", data); // Debug: log the response
+            const responseTimestamp = new Date();
+            hideTypingIndicator();
+
+            // Check if data is in the expected format
+            if (data.fallback_response) {
+                // Handle fallback response (error case)
+                addMessageToChat('bot', data.fallback_response[0].text, responseTimestamp);
+                return;
+            }
+
+            // Process Rasa response
+            handleRasaResponse(data, responseTimestamp);
+            // More messages of this turn may follow
+            showTypingIndicator();
         })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
-                }
-                return response.json();
-            })
-            .then(data => {
-                console.log("Response from Rasa:", data); // Debug: log the response
-                const responseTimestamp = new Date();
+            .then(result => {
                 hideTypingIndicator();
-
-                // Check if data is in the expected format
-                if (data.fallback_response) {
-                    // Handle fallback response (error case)
-                    addMessageToChat('bot', data.fallback_response[0].text, responseTimestamp);
-                    return;
+                if (result.context) {
+                    conversationContext = {
+                        ...conversationContext,
+                        ...result.context
+                    };
                 }
-
-                // Process Rasa response
-                handleRasaResponse(data, responseTimestamp);
             })
             .catch(error => {
                 const errorTimestamp = new Date();
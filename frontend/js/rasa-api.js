@@ -13,10 +13,115 @@ class RasaAPI {
         this.lastCheckTime = Date.now();
         this.connectionCheckInterval = setInterval(() => this.checkAvailability(), 30000);
         
+        // Streaming channel (async gateway only); falls back to POST when unavailable
+        this.socketUrl = `${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/api/ws`;
+        this.socket = null;
+        this.socketReady = null;
+        this.socketUnavailable = false;
+        this.nextTurnId = 1;
+        this.pendingTurns = new Map();
+
         // Initialize by checking connection
         this.checkAvailability();
     }
 
+    /**
+     * Open (or reuse) the WebSocket to the gateway
+     * @private
+     * @returns {Promise<WebSocket|null>} - The open socket, or null if streaming is not available
+     */
+    _openSocket() {
+        if (this.socketUnavailable || typeof WebSocket === 'undefined') {
+            return Promise.resolve(null);
+        }
+        if (this.socketReady) {
+            return this.socketReady;
+        }
+
+        this.socketReady = new Promise(resolve => {
+            const socket = new WebSocket(this.socketUrl);
+            let opened = false;
+
+            socket.onopen = () => {
+                opened = true;
+                this.socket = socket;
+                resolve(socket);
+            };
+
+            socket.onmessage = event => {
+                const frame = JSON.parse(event.data);
+                const turn = this.pendingTurns.get(frame.id);
+                if (!turn) return;
+                if (frame.type === 'chunk') {
+                    turn.onChunk(frame);
+                } else if (frame.type === 'done') {
+                    this.pendingTurns.delete(frame.id);
+                    turn.resolve(frame);
+                }
+            };
+
+            socket.onerror = () => {
+                if (!opened) {
+                    // The gateway has no WebSocket endpoint (e.g. the Flask gateway), stop trying
+                    this.socketUnavailable = true;
+                    this.socketReady = null;
+                    resolve(null);
+                }
+            };
+
+            socket.onclose = () => {
+                this.socket = null;
+                this.socketReady = null;
+                if (!opened) {
+                    this.socketUnavailable = true;
+                    resolve(null);
+                }
+                // Turns in flight on a dropped socket are failed, the caller falls back to POST
+                this.pendingTurns.forEach(turn => turn.reject(new Error('Chat socket closed')));
+                this.pendingTurns.clear();
+            };
+        });
+        return this.socketReady;
+    }
+
+    /**
+     * Send a message and receive the bot messages one by one as they are ready
+     * @param {string} message - The message to send
+     * @param {Object} context - The context to send
+     * @param {Function} onChunk - Called with {messages, actions, context} for every bot message
+     * @returns {Promise<Object>} - Resolves with {context} when the turn is complete
+     */
+    async streamMessage(message, context = {}, onChunk = () => {}) {
+        const socket = await this._openSocket();
+        let received = false;
+        if (socket) {
+            const id = this.nextTurnId++;
+            try {
+                return await new Promise((resolve, reject) => {
+                    this.pendingTurns.set(id, {
+                        resolve,
+                        reject,
+                        onChunk: chunk => {
+                            received = true;
+                            onChunk(chunk);
+                        }
+                    });
+                    socket.send(JSON.stringify({ type: 'message', id: id, message: message, context: context }));
+                });
+            } catch (error) {
+                // Don't send the message twice if part of the reply already arrived
+                if (received) {
+                    return { context: context };
+                }
+                console.warn(`Streaming failed (${error.message}), falling back to HTTP`);
+            }
+        }
+
+        const response = await this.sendMessage(message, context);
+        onChunk(response);
+        return { context: response.context || context };
+    }
+
     /**
      * Send a message to Rasa with improved error handling and retry logic
      * @param {string} message - The message to send
@@ -211,6 +316,9 @@ class RasaAPI {
         if (this.connectionCheckInterval) {
             clearInterval(this.connectionCheckInterval);
         }
+        if (this.socket) {
+            this.socket.close();
+        }
     }
 }
 
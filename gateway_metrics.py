@@ -0,0 +1,51 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# --- Gateway metrics ---
+# Prometheus metrics of app.py and async_app.py, served at /metrics. Under gunicorn every worker
+# counts for itself; point PROMETHEUS_MULTIPROC_DIR at an empty directory to have /metrics add
+# up all workers (gunicorn.conf.py cleans up after workers that exit).
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# A chat turn is dominated by Rasa and the LLM behind it, so the buckets reach well into seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+REQUESTS = Counter('gateway_requests_total', 'HTTP requests answered by the gateway',
+                   ['endpoint', 'method', 'status'])
+REQUEST_SECONDS = Histogram('gateway_request_seconds', 'Time to answer an HTTP request',
+                            ['endpoint'], buckets=LATENCY_BUCKETS)
+RASA_ROUND_TRIP_SECONDS = Histogram('gateway_rasa_round_trip_seconds',
+                                    'Time from sending a message to Rasa until its reply is complete',
+                                    ['mode'], buckets=LATENCY_BUCKETS)
+RASA_FIRST_MESSAGE_SECONDS = Histogram('gateway_rasa_first_message_seconds',
+                                       'Time from sending a message to Rasa until the first streamed bot message',
+                                       buckets=LATENCY_BUCKETS)
+RASA_ERRORS = Counter('gateway_rasa_errors_total', 'Chat turns that failed, by reason '
+                      '(timeout, connection, http_<status>, circuit_open, invalid_response)', ['reason'])
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    """
+    Records one answered HTTP request.
+
+    Args:
+        endpoint (str): The route pattern (e.g. "/api/send_message"), never the raw path, so
+            the number of label values stays bounded.
+        method (str): The HTTP method.
+        status (int): The response status code.
+        seconds (float): Time taken to answer.
+    """
+    REQUESTS.labels(endpoint, method, str(status)).inc()
+    REQUEST_SECONDS.labels(endpoint).observe(seconds)
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Returns the /metrics body (Prometheus text format) and its content type."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,41 @@
+# Gunicorn configuration for the Flask gateway (app.py).
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Every setting can be overridden with an environment variable. See the "Production serving"
+# section of the README for how the defaults were chosen.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+
+# The gateway mostly waits on Rasa, so threads do the heavy lifting. A few processes give
+# CPU parallelism and isolation, the threads of each process keep many chats in flight.
+# One per CPU (at least two, so a crashing worker doesn't take the gateway down)
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+# Keep browser connections open between chat messages (the frontend polls /api/check_rasa too)
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 15))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# A chat turn may legitimately take up to the 30 s Rasa timeout, so give workers more than that
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+# On SIGTERM, finish the chat turns that are in flight before exiting
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 35))
+
+# Recycle workers now and then to contain slow memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None  # Empty disables the access log
+errorlog = os.environ.get("GUNICORN_ERROR_LOG", "-")
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, /metrics adds up every worker; drop the live gauges of exited ones
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
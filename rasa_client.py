@@ -0,0 +1,156 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# --- Pooled client for the Rasa server ---
+# Every gateway worker keeps one requests.Session for Rasa, so chat messages reuse open
+# keep-alive connections instead of paying a TCP handshake per message.
+RASA_POOL_SIZE = int(os.environ.get("RASA_POOL_SIZE", 32))            # Connections kept per worker, match GUNICORN_THREADS
+RASA_POOL_BLOCK = os.environ.get("RASA_POOL_BLOCK", "false").lower() == "true"  # Wait for a free connection instead of opening an extra one
+RASA_KEEP_ALIVE = os.environ.get("RASA_KEEP_ALIVE", "true").lower() == "true"
+RASA_CONNECT_TIMEOUT = float(os.environ.get("RASA_CONNECT_TIMEOUT", 3.05))
+RASA_READ_TIMEOUT = float(os.environ.get("RASA_READ_TIMEOUT", 30))
+RASA_MAX_RETRIES = int(os.environ.get("RASA_MAX_RETRIES", 2))
+RASA_BACKOFF = float(os.environ.get("RASA_BACKOFF", 0.3))
+
+
+_connects = 0
+_connects_lock = threading.Lock()
+
+
+def _count_connect() -> None:
+    global _connects
+    with _connects_lock:
+        _connects += 1
+
+
+# Connections that count every TCP connect, including reconnects of a pooled connection
+class _CountingHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        _count_connect()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        _count_connect()
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _MeteredAdapter(HTTPAdapter):
+    """An HTTPAdapter that counts requests in flight and TCP connects, for the pool utilization stats."""
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+_session: Optional[requests.Session] = None
+_adapter: Optional[_MeteredAdapter] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_rasa_session() -> requests.Session:
+    """
+    Returns this worker's pooled session for the Rasa server.
+
+    The session is created on first use in every process, so gunicorn workers never share
+    sockets inherited from the master process.
+
+    Returns:
+        requests.Session: A session with pool size, keep-alive and retries configured.
+    """
+    global _session, _adapter, _session_pid
+    with _session_lock:
+        if _session is not None and _session_pid == os.getpid():
+            return _session
+
+        # Messages are not idempotent: a POST is only retried when the connection could not be
+        # made (the message never reached Rasa). GETs like /version also retry on 5xx responses.
+        retries = Retry(
+            total=RASA_MAX_RETRIES,
+            backoff_factor=RASA_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,  # Let raise_for_status() report the final response
+        )
+        _adapter = _MeteredAdapter(
+            pool_connections=1, pool_maxsize=RASA_POOL_SIZE, pool_block=RASA_POOL_BLOCK, max_retries=retries
+        )
+        _session = requests.Session()
+        _session.mount("http://", _adapter)
+        _session.mount("https://", _adapter)
+        if not RASA_KEEP_ALIVE:
+            _session.headers["Connection"] = "close"
+        _session_pid = os.getpid()
+        return _session
+
+
+def rasa_timeout(read_timeout: Optional[float] = None):
+    """The (connect, read) timeout for a Rasa request."""
+    return (RASA_CONNECT_TIMEOUT, RASA_READ_TIMEOUT if read_timeout is None else read_timeout)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Returns utilization numbers for this worker's Rasa connection pool.
+
+    Returns:
+        dict: Pool size, connections in use / idle, requests sent, TCP connections opened and
+            the share of requests that reused an open connection.
+    """
+    get_rasa_session()
+    idle = 0
+    for key in _adapter.poolmanager.pools.keys():
+        pool = _adapter.poolmanager.pools.get(key)
+        if pool is not None:
+            # The pool queue holds idle connections and None placeholders for unopened slots
+            idle += sum(1 for connection in list(pool.pool.queue) if connection is not None)
+
+    requests_sent, opened = _adapter.requests, _connects
+    return {
+        "pid": _session_pid,
+        "pool_size": RASA_POOL_SIZE,
+        "in_use": _adapter.in_flight,
+        "peak_in_use": _adapter.peak_in_flight,
+        "idle": idle,
+        "requests": requests_sent,
+        "connections_opened": opened,
+        "reuse_ratio": round(1 - opened / requests_sent, 4) if requests_sent else 0.0,
+    }
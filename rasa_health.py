@@ -0,0 +1,162 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Rasa health and circuit breaker ---
+# A background prober checks Rasa's /version every few seconds, so /api/check_rasa answers from
+# memory. A circuit breaker around the webhook call makes the gateway fail fast while Rasa is
+# down instead of letting every chat message wait for the full timeout.
+RASA_HEALTH_INTERVAL = float(os.environ.get('RASA_HEALTH_INTERVAL', 5))      # Seconds between probes
+RASA_BREAKER_FAILURES = int(os.environ.get('RASA_BREAKER_FAILURES', 5))      # Consecutive failures that open the breaker
+RASA_BREAKER_RESET = float(os.environ.get('RASA_BREAKER_RESET', 10))         # Seconds before an open breaker lets a trial through
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after repeated failures, then lets single trial calls through to detect recovery.
+
+    closed: every call goes through; `failure_threshold` consecutive failures open the breaker.
+    open: calls are rejected until `reset_timeout` seconds have passed, then it turns half-open.
+    half_open: one trial call at a time; a success closes the breaker, a failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds an open breaker waits before allowing a trial call.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_running = False
+
+    def allow(self) -> bool:
+        """Returns True when a call may go through. Every allowed call must be followed by record_success/failure."""
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Rasa circuit breaker closed, Rasa is reachable again")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._trip()
+
+    def trip(self) -> None:
+        """Opens the breaker right away, e.g. when the health prober finds Rasa down."""
+        with self._lock:
+            self._trip()
+
+    def half_open(self) -> None:
+        """Lets the next call through as a trial, e.g. when the health prober finds Rasa up again."""
+        with self._lock:
+            if self._state == OPEN:
+                self._state = HALF_OPEN
+                self._trial_running = False
+
+    def _trip(self) -> None:
+        if self._state != OPEN:
+            logger.warning("Rasa circuit breaker opened, failing chat messages fast")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._update_state()
+            return {"state": self._state, "consecutive_failures": self._failures, "rejected": self._rejected}
+
+
+class HealthStatus:
+    """The latest result of the Rasa health probe, shared by the request handlers."""
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker
+        self._result: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, available: bool, body: Dict[str, Any]) -> None:
+        """
+        Stores a probe result (the /api/check_rasa body) and tells the breaker about it: Rasa down
+        keeps the breaker open, Rasa coming back lets a trial message through right away.
+        """
+        with self._lock:
+            was_available = self._result is not None and self._result[0] == 200
+            self._result = (200 if available else 503, body)
+            self._checked_at = time.time()
+        if self.breaker is not None:
+            if not available:
+                self.breaker.trip()
+            elif not was_available:
+                self.breaker.half_open()
+
+    def get(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Returns (HTTP status, body) of the latest probe, or None before the first one."""
+        with self._lock:
+            if self._result is None:
+                return None
+            status, body = self._result
+            return status, {**body, "checked_at": self._checked_at}
+
+
+_prober_pid: Optional[int] = None
+_prober_lock = threading.Lock()
+
+
+def start_health_prober(check: Callable[[], Tuple[bool, Dict[str, Any]]], status: HealthStatus,
+                        interval: float = RASA_HEALTH_INTERVAL) -> None:
+    """
+    Starts a daemon thread that runs `check()` every `interval` seconds and stores the result in `status`.
+    Safe to call on every request: the thread is started once per process (i.e. per gunicorn worker).
+    """
+    global _prober_pid
+    with _prober_lock:
+        if _prober_pid == os.getpid():
+            return
+        _prober_pid = os.getpid()
+
+    def probe_forever():
+        while True:
+            try:
+                status.update(*check())
+            except Exception as e:
+                status.update(False, {"status": "unavailable", "reason": str(e)})
+            time.sleep(interval)
+
+    threading.Thread(target=probe_forever, name="rasa-health", daemon=True).start()
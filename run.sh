@@ -36,9 +36,24 @@ RASA_PID=$!
 # Wait a moment to ensure Rasa server has started
 sleep 10
 
-# Start Flask server in background
-echo "Starting Flask server..."
-flask run &
+# Fingerprint and precompress the frontend (see build_assets.py); the gateway serves the build
+if [ "$DEV" != "1" ]; then
+    python build_assets.py || echo "Frontend build failed, serving frontend/ as is"
+fi
+
+# Start the gateway in background
+# gunicorn (see gunicorn.conf.py) unless DEV=1 asks for the Flask development server
+# or GATEWAY=async for the event-loop gateway (async_app.py)
+if [ "$DEV" = "1" ]; then
+    echo "Starting Flask development server..."
+    flask run &
+elif [ "$GATEWAY" = "async" ]; then
+    echo "Starting async gateway..."
+    python async_app.py &
+else
+    echo "Starting gateway with gunicorn..."
+    gunicorn -c gunicorn.conf.py app:app &
+fi
 FLASK_PID=$!
 
 echo "Chatbot servers are running!"
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend')
+
+# --- Static assets ---
+# The gateways serve the frontend from an index built once at startup: no filesystem lookups per
+# request, strong ETags (304 when the browser already has the file), precompressed variants and
+# long-lived caching for fingerprinted files. Run `python build_assets.py` to create the build;
+# without one the plain frontend/ files are served, revalidated on every use.
+ASSET_DIST_DIR = os.environ.get('ASSET_DIST_DIR', os.path.join(FRONTEND_DIR, 'dist'))
+MANIFEST_NAME = 'manifest.json'
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'  # The name changes when the content does
+REVALIDATE_CACHE = 'no-cache'                            # Kept, but checked against the ETag before use
+
+# Best first; only variants the build produced are offered
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+
+def content_type(path: str) -> str:
+    guessed = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if guessed.startswith('text/') or guessed in ('application/javascript', 'application/json'):
+        return f'{guessed}; charset=utf-8'
+    return guessed
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Content codings the client accepts ("gzip, br;q=0" -> {"gzip"})."""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.partition(';')
+        refused = re.search(r'q=0(\.0*)?\s*$', params.strip())  # q=0 means "not acceptable"
+        if name.strip() and not refused:
+            accepted.add(name.strip())
+    return accepted
+
+
+class Asset(NamedTuple):
+    path: str                  # File on disk
+    content_type: str
+    etag: str                  # Content hash, unquoted
+    cache_control: str
+    encodings: Dict[str, str]  # Content coding -> precompressed file on disk
+
+    def variant(self, accept_encoding: str) -> Tuple[str, str, Optional[str]]:
+        """
+        Picks the file to send for a client's Accept-Encoding header.
+
+        Returns:
+            tuple: (file path, ETag of that variant, Content-Encoding or None).
+        """
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in self.encodings and encoding in accepted:
+                return self.encodings[encoding], f'{self.etag}-{encoding}', encoding
+        return self.path, self.etag, None
+
+
+class AssetIndex:
+    """
+    URL path -> Asset for every file the gateway serves.
+
+    Args:
+        assets (dict): The assets by URL path relative to the site root (e.g. "js/app.js").
+        built (bool): Whether the assets come from a build (fingerprinted and precompressed).
+    """
+
+    def __init__(self, assets: Dict[str, Asset], built: bool):
+        self.assets = assets
+        self.built = built
+
+    @classmethod
+    def load(cls, frontend_dir: str = FRONTEND_DIR, dist_dir: str = ASSET_DIST_DIR) -> 'AssetIndex':
+        """Reads the build manifest, or indexes the plain frontend files when there is no build."""
+        manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding='utf-8') as file:
+                manifest = json.load(file)
+            assets = {}
+            for path, entry in manifest['assets'].items():
+                encodings = {encoding: os.path.join(dist_dir, variant)
+                             for encoding, variant in entry['encodings'].items()}
+                asset = Asset(os.path.join(dist_dir, entry['file']), content_type(path), entry['etag'],
+                              REVALIDATE_CACHE, encodings)
+                # Old pages and direct links may still use the plain name; those get revalidated
+                assets[path] = asset
+                if entry['immutable']:
+                    assets[entry['file']] = asset._replace(cache_control=IMMUTABLE_CACHE)
+            logger.info(f"Serving {len(manifest['assets'])} built frontend files from {dist_dir}")
+            return cls(assets, built=True)
+
+        logger.info("No frontend build found, serving frontend/ as is (run `python build_assets.py`)")
+        assets = {}
+        dist_dir = os.path.abspath(dist_dir)
+        for root, dirs, names in os.walk(frontend_dir):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != dist_dir]
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, frontend_dir).replace(os.sep, '/')
+                with open(full_path, 'rb') as file:
+                    etag = hashlib.sha256(file.read()).hexdigest()[:12]
+                assets[path] = Asset(full_path, content_type(path), etag, REVALIDATE_CACHE, {})
+        return cls(assets, built=False)
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        return self.assets.get(path.lstrip('/'))
+
+    def resolve(self, path: str) -> Asset:
+        """The asset for a URL path; unknown paths get the chat page, like before."""
+        return self.lookup(path) or self.assets['index.html']